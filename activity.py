@@ -0,0 +1,318 @@
+"""
+Buffered ingestion of user activity.
+
+The activity tracker posts an event on every view, so events are not
+written one by one. :class:`ActivityBuffer` keeps them in memory and a
+background thread writes them with multi-row INSERTs once
+``ACTIVITY_BATCH_SIZE`` events are waiting or ``ACTIVITY_FLUSH_INTERVAL``
+seconds have passed, updating the activity rollups (see ``rollups.py``) in
+the same transaction. The buffer is also flushed when the process exits.
+
+When ``ACTIVITY_SPOOL`` names a folder, accepted events are first appended
+to a file of the process in it, as JSON lines. A flush moves the file aside
+and deletes it once the rows are committed. Files left by a process that
+crashed are replayed by the next process to start its buffer, so events
+committed just before a crash may be written twice.
+"""
+import atexit
+import json
+import logging
+import os
+import re
+import threading
+from datetime import datetime
+
+from sqlalchemy import insert, select
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+from rollups import add_to_rollups
+
+logger = logging.getLogger(__name__)
+
+# Events accepted in one request
+MAX_EVENTS_PER_REQUEST = 100
+
+_TEXT_FIELDS = {'activity_type': 50, 'content_type': 50, 'content_title': 255}
+
+_SPOOL_FILE = re.compile(r'^activity-(\d+)\.jsonl(\.flushing-.+)?$')
+
+
+class ActivityError(ValueError):
+    """Raised for activity events that cannot be recorded."""
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def parse_events(data):
+    """Validates one event or a batch of events from a request body.
+
+    Accepts an event object, a list of them, or ``{"events": [...]}``.
+    Each event needs an ``activity_type``; ``content_id``,
+    ``content_type``, ``content_title`` and a ``metadata`` object are
+    optional. Over-long titles are truncated.
+
+    Returns:
+        list[dict]: The events, with the columns of ``UserActivity``.
+
+    Raises:
+        ActivityError: If the body or an event is invalid.
+    """
+    if isinstance(data, dict) and 'events' in data:
+        data = data['events']
+    events = data if isinstance(data, list) else [data]
+    if not events:
+        raise ActivityError('No events')
+    if len(events) > MAX_EVENTS_PER_REQUEST:
+        raise ActivityError(f'At most {MAX_EVENTS_PER_REQUEST} events can be sent at once')
+
+    parsed = []
+    for event in events:
+        if not isinstance(event, dict) or not isinstance(event.get('activity_type'), str) \
+                or not event['activity_type'].strip():
+            raise ActivityError('Each event needs an activity_type')
+        row = {}
+        for field, length in _TEXT_FIELDS.items():
+            value = event.get(field)
+            if value is not None and not isinstance(value, str):
+                raise ActivityError(f'{field} must be a string')
+            row[field] = value.strip()[:length] if value else None
+        if len(event['activity_type'].strip()) > _TEXT_FIELDS['activity_type']:
+            raise ActivityError('activity_type is too long')
+        content_id = event.get('content_id')
+        if content_id in (None, ''):
+            row['content_id'] = None
+        else:
+            try:
+                row['content_id'] = int(content_id)
+            except (TypeError, ValueError):
+                raise ActivityError('content_id must be an integer') from None
+        metadata = event.get('metadata')
+        if metadata is not None and not isinstance(metadata, dict):
+            raise ActivityError('metadata must be an object')
+        row['activity_data'] = metadata or None
+        parsed.append(row)
+    return parsed
+
+
+class ActivityBuffer:
+    """Collects activity events and writes them in batches.
+
+    The flushing thread starts with the first event added by the process,
+    or when :meth:`start` is called.
+
+    Args:
+        app: The Flask application whose database receives the events.
+        batch_size (int): Pending events that trigger a flush, and the
+            most rows written by one INSERT.
+        flush_interval (float): Seconds an event may wait before a flush.
+        spool_folder (str, optional): Folder of append-only files that keep
+            pending events across crashes, one per process.
+    """
+
+    def __init__(self, app, batch_size=100, flush_interval=5.0, spool_folder=None):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.spool_folder = spool_folder
+        self._pending = []
+        self._claimed = []
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._exit_registered = False
+
+    # --- Spool ---
+    def _spool_path(self):
+        # Resolved on use, since workers are often forked after the app is created
+        return os.path.join(self.spool_folder, f'activity-{os.getpid()}.jsonl')
+
+    def _claim_spools(self):
+        """Takes over the spool files of processes that no longer run.
+
+        Files are renamed before they are read, so each one is claimed by a
+        single process. Returns the events they hold.
+        """
+        if not os.path.isdir(self.spool_folder):
+            return []
+        rows = []
+        for filename in sorted(os.listdir(self.spool_folder)):
+            match = _SPOOL_FILE.match(filename)
+            if not match or (int(match.group(1)) != os.getpid() and _process_alive(int(match.group(1)))):
+                continue
+            claimed = f'{self._spool_path()}.flushing-{len(self._claimed)}-{filename}'
+            try:
+                os.replace(os.path.join(self.spool_folder, filename), claimed)
+            except FileNotFoundError:
+                continue  # Claimed by another process
+            self._claimed.append(claimed)
+            with open(claimed, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        row = json.loads(line)
+                        row['created_at'] = datetime.fromisoformat(row['created_at'])
+                    except (ValueError, KeyError, TypeError):
+                        continue  # A line cut short by a crash
+                    rows.append(row)
+        if rows:
+            logger.info('Replaying %d spooled activity events', len(rows))
+        return rows
+
+    def _append_spool(self, rows):
+        os.makedirs(self.spool_folder, exist_ok=True)
+        with open(self._spool_path(), 'a', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps({**row, 'created_at': row['created_at'].isoformat()}, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def _rotate_spool(self):
+        """Moves the spool files aside; returns them to delete after the flush."""
+        rotated, self._claimed = self._claimed, []
+        path = self._spool_path()
+        if os.path.exists(path):
+            target = f'{path}.flushing-{datetime.utcnow():%Y%m%d%H%M%S%f}'
+            os.replace(path, target)
+            rotated.append(target)
+        return rotated
+
+    # --- Buffering ---
+    def add(self, user_id, events):
+        """Queues events recorded by a user.
+
+        Args:
+            user_id (int): The user the events belong to.
+            events (list[dict]): Events returned by :func:`parse_events`.
+        """
+        # Started first, so the spools it claims do not include these events
+        self.start()
+        now = datetime.utcnow()
+        rows = [{**event, 'user_id': user_id, 'created_at': now} for event in events]
+        with self._lock:
+            if self.spool_folder:
+                self._append_spool(rows)
+            self._pending.extend(rows)
+            full = len(self._pending) >= self.batch_size
+        if full:
+            self._wakeup.set()
+
+    def pending(self):
+        """Returns the number of events waiting to be written."""
+        with self._lock:
+            return len(self._pending)
+
+    def flush(self):
+        """Writes every pending event.
+
+        Events that cannot be written stay pending and are retried by the
+        next flush, except those of users deleted in the meantime.
+
+        Returns:
+            int: The number of events written.
+        """
+        with self._flush_lock:
+            with self._lock:
+                rows, self._pending = self._pending, []
+                rotated = self._rotate_spool() if self.spool_folder else []
+            if not rows:
+                return 0
+            try:
+                with self.app.app_context():
+                    written = self._insert(rows)
+            except Exception:
+                logger.exception('Failed to write %d activity events', len(rows))
+                with self._lock:
+                    self._pending[:0] = rows
+                    self._claimed[:0] = rotated
+                return 0
+            for path in rotated:
+                os.remove(path)
+            return written
+
+    def _insert(self, rows):
+        from models import User, UserActivity
+
+        table = UserActivity.__table__
+        try:
+            with db.engine.begin() as connection:
+                for start in range(0, len(rows), self.batch_size):
+                    connection.execute(insert(table).values(rows[start:start + self.batch_size]))
+                add_to_rollups(connection, rows)
+            return len(rows)
+        except IntegrityError:
+            # A user was deleted while their events waited; drop those events
+            user_ids = {row['user_id'] for row in rows}
+            with db.engine.begin() as connection:
+                existing = set(connection.scalars(select(User.id).where(User.id.in_(user_ids))))
+                kept = [row for row in rows if row['user_id'] in existing]
+                for start in range(0, len(kept), self.batch_size):
+                    connection.execute(insert(table).values(kept[start:start + self.batch_size]))
+                add_to_rollups(connection, kept)
+            logger.warning('Dropped %d activity events of deleted users', len(rows) - len(kept))
+            return len(kept)
+
+    # --- Flushing thread ---
+    def start(self):
+        """Starts the flushing thread and the flush at exit.
+
+        Events spooled by processes that stopped without flushing are
+        picked up here.
+        """
+        with self._lock:
+            if self._thread is not None:
+                return
+            if self.spool_folder:
+                self._pending[:0] = self._claim_spools()
+            self._thread = threading.Thread(target=self._run, name='activity-flusher', daemon=True)
+            self._thread.start()
+            if not self._exit_registered:
+                atexit.register(self.stop)
+                self._exit_registered = True
+
+    def stop(self, timeout=None):
+        """Stops the flushing thread and writes the remaining events."""
+        self._stopping.set()
+        self._wakeup.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+        self._stopping.clear()
+        self.flush()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                break
+            if self.pending():
+                self.flush()
+
+
+def init_activity_buffer(app):
+    """Creates the application's activity buffer and registers it as an extension.
+
+    ``ACTIVITY_BATCH_SIZE``, ``ACTIVITY_FLUSH_INTERVAL`` and
+    ``ACTIVITY_SPOOL`` configure it; see :class:`ActivityBuffer`.
+
+    Returns:
+        ActivityBuffer: The buffer instance.
+    """
+    buffer = ActivityBuffer(
+        app,
+        batch_size=app.config.get('ACTIVITY_BATCH_SIZE', 100),
+        flush_interval=app.config.get('ACTIVITY_FLUSH_INTERVAL', 5.0),
+        spool_folder=app.config.get('ACTIVITY_SPOOL'),
+    )
+    app.extensions['activity_buffer'] = buffer
+    return buffer
@@ -8,14 +8,34 @@ for managing content like books, articles, and gallery images.
 """
 import os
 import logging
-import uuid
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from werkzeug.utils import secure_filename
-from flask import Flask, render_template, request, jsonify, url_for, send_from_directory, redirect, flash, session, make_response
+from flask import Flask, render_template, request, jsonify, url_for, send_from_directory, redirect, flash, session, make_response, abort
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from sqlalchemy import func, desc
 from functools import wraps
+from activity import ActivityError, init_activity_buffer, parse_events
+from assets import OUTPUT_FOLDER, SERVICE_WORKER_SOURCE, init_assets
+from cache import init_cache
 from database import db
+from downloads import download_response, init_download_counter
+from fragments import init_fragment_cache
+from http_cache import (
+    apply_cache_policy, cache_policy, collection_version, is_not_modified, make_etag, set_validators
+)
+from images import IMAGE_EXTENSIONS, manifest_path
+from jobs import TASKS, init_job_queue
+from pagination import PaginationError, load_columns, paginate, parse_fields, parse_json_filter, parse_limit
+from pdfs import load_info as load_pdf_info
+from recommendations import DEFAULT_RECOMMENDATIONS, MAX_RECOMMENDATIONS, init_recommendations, recommend
+from rollups import PERIODS, activity_series, init_rollups, user_statistics
+from retention import init_retention
+from search import get_search_backend
+from snapshots import build_snapshot, coding_etag, negotiate_coding, snapshot_response
+from static_export import init_static_export
+from storage import commit_blob, hash_file, init_storage, store_upload, write_chunk
+from suggest import init_suggest_index
+from user_cache import init_user_cache
 
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
@@ -50,13 +70,62 @@ def create_app(config_name='production'):
     os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'books'), exist_ok=True)
     os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'articles'), exist_ok=True)
     app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload size
+    # Book PDFs may be larger when sent in chunks through an upload session
+    app.config['MAX_BOOK_PDF_SIZE'] = int(os.environ.get('MAX_BOOK_PDF_SIZE', 512 * 1024 * 1024))
+    app.config['UPLOAD_CHUNK_SIZE'] = 4 * 1024 * 1024
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'pdf'}
 
+    # Let a front-end server send book downloads (see downloads.py)
+    app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE') == '1'
+    app.config['X_ACCEL_REDIRECT_PREFIX'] = os.environ.get('X_ACCEL_REDIRECT_PREFIX')
+
+    # Configure the content cache ('memory', 'local' or 'redis')
+    app.config['CACHE_BACKEND'] = os.environ.get('CACHE_BACKEND', 'memory')
+    app.config['CACHE_REDIS_URL'] = os.environ.get('CACHE_REDIS_URL', 'redis://localhost:6379/0')
+    app.config['CACHE_DEFAULT_TTL'] = int(os.environ.get('CACHE_DEFAULT_TTL', 300))
+    # Seconds each worker trusts its copy of the tables' versions (memory backend only)
+    app.config['CACHE_VERSION_CHECK_INTERVAL'] = float(os.environ.get('CACHE_VERSION_CHECK_INTERVAL', 5))
+    # Seconds the search suggestion index is trusted before checking for edits
+    app.config['SUGGEST_REFRESH_INTERVAL'] = float(os.environ.get('SUGGEST_REFRESH_INTERVAL', 1))
+    # Seconds a worker reuses a logged-in user without querying it (0 disables)
+    app.config['USER_CACHE_TTL'] = int(os.environ.get('USER_CACHE_TTL', 30))
+
+    # Configure the background job queue
+    app.config['JOB_QUEUE_WORKERS'] = int(os.environ.get('JOB_QUEUE_WORKERS', 2))
+    app.config['JOB_QUEUE_EAGER'] = os.environ.get('JOB_QUEUE_EAGER') == '1'
+    # Days succeeded and failed jobs are kept before workers delete them
+    app.config['JOB_RETENTION_DAYS'] = float(os.environ.get('JOB_RETENTION_DAYS', 7))
+
+    # Configure batched user activity writes (see activity.py)
+    app.config['ACTIVITY_BATCH_SIZE'] = int(os.environ.get('ACTIVITY_BATCH_SIZE', 100))
+    app.config['ACTIVITY_FLUSH_INTERVAL'] = float(os.environ.get('ACTIVITY_FLUSH_INTERVAL', 5))
+    app.config['ACTIVITY_SPOOL'] = os.environ.get('ACTIVITY_SPOOL')
+    # Seconds between writes of the counted book downloads (see downloads.py)
+    app.config['DOWNLOAD_FLUSH_INTERVAL'] = float(os.environ.get('DOWNLOAD_FLUSH_INTERVAL', 10))
+    # Raw activity older than this is moved to compressed archives (see retention.py)
+    app.config['ACTIVITY_RETENTION_DAYS'] = int(os.environ.get('ACTIVITY_RETENTION_DAYS', 180))
+    app.config['ACTIVITY_ARCHIVE_FOLDER'] = os.environ.get(
+        'ACTIVITY_ARCHIVE_FOLDER', os.path.join(app.instance_path, 'activity-archive'))
+
     # Initialize extensions
     db.init_app(app)
+    content_cache = init_cache(app)
+    user_cache = init_user_cache(app)
+    suggest_index = init_suggest_index(app)
+    job_queue = init_job_queue(app)
+    activity_buffer = init_activity_buffer(app)
+    init_download_counter(app)
+    init_assets(app)
+    init_fragment_cache(app)
+    init_static_export(app)
+    init_rollups(app)
+    init_recommendations(app)
+    init_retention(app)
+    init_storage(app)
 
     # Import models after initializing db
-    from models import Book, Article, GalleryImage, ContactMessage, User, UserActivity
+    from models import (Book, Article, GalleryImage, ContactMessage, User, UserActivity, Tombstone, Job, UploadSession,
+                        json_contains)
 
     # Initialize Flask-Login
     login_manager = LoginManager()
@@ -66,17 +135,14 @@ def create_app(config_name='production'):
 
     @login_manager.user_loader
     def load_user(user_id):
-        """Loads a user from the database for Flask-Login."""
-        return User.query.get(int(user_id))
+        """Loads a user for Flask-Login, from the user cache when possible."""
+        return user_cache.load(int(user_id))
 
     # Configure proper response headers
     @app.after_request
     def add_header(response):
-        """Adds headers to prevent caching of responses."""
-        response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '-1'
-        return response
+        """Applies the route's cache policy, defaulting to no-store."""
+        return apply_cache_policy(response)
 
     # --- Authorization Decorators ---
     def admin_required(f):
@@ -102,38 +168,101 @@ def create_app(config_name='production'):
         """Checks if a filename has an allowed extension."""
         return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-    def generate_unique_filename(filename):
-        """Generates a unique filename using UUID4."""
-        ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
-        unique_name = f"{uuid.uuid4().hex}.{ext}"
-        return unique_name
+    def list_collection(model, key, list_fields=None):
+        """Serves a collection honouring the limit, cursor and fields parameters.
+
+        ``list_fields`` restricts both the default projection and the fields a
+        client may request, keeping heavy columns out of list responses.
+        """
+        allowed = list_fields or model.API_FIELDS
+        table = model.__tablename__
+        query_string = request.query_string.decode()
+        last_modified, count = content_cache.get_or_set(
+            f'{table}:version', (table,), lambda: tuple(collection_version(model))
+        )
+
+        def build_payload():
+            limit = parse_limit(request.args.get('limit'))
+            fields = parse_fields(request.args.get('fields'), allowed)
+            if fields is None and list_fields:
+                fields = list(list_fields)
+            query = model.query
+            columns = load_columns(model, fields)
+            if columns is not None:
+                query = query.options(columns)
+            items, next_cursor = paginate(query, model, limit, request.args.get('cursor'))
+            return build_snapshot({key: [item.to_dict(fields) for item in items], 'next_cursor': next_cursor})
+
+        try:
+            snapshot = content_cache.get_or_set(f'{table}:list:{query_string}', (table,), build_payload)
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
+        # Negotiated against the cached snapshot, so the ETag names a coding it holds
+        coding = negotiate_coding(snapshot)
+        etag = coding_etag(make_etag(table, last_modified, count, query_string), coding)
+        if is_not_modified(etag):
+            response = set_validators(app.response_class(status=304), etag, last_modified)
+            response.vary.add('Accept-Encoding')
+            return response
+        return set_validators(snapshot_response(snapshot, coding), etag, last_modified)
+
+    def item_response(item, key):
+        """Serves a single resource, answering 304 when the client's copy is current."""
+        etag = make_etag(item.__tablename__, item.id, item.updated_at)
+        if is_not_modified(etag, item.updated_at):
+            return set_validators(app.response_class(status=304), etag, item.updated_at)
+        return set_validators(jsonify({key: item.to_dict()}), etag, item.updated_at)
 
     # --- Frontend Page Routes ---
+    @app.route('/service-worker.js')
+    def service_worker():
+        """Serves the service worker from the root so it controls the whole site."""
+        built = os.path.join(OUTPUT_FOLDER, 'service-worker.js')
+        filename = built if os.path.exists(os.path.join(app.static_folder, built)) else SERVICE_WORKER_SOURCE
+        return send_from_directory(app.static_folder, filename, mimetype='application/javascript')
+
     @app.route('/')
     def index():
-        latest_articles = Article.query.order_by(Article.created_at.desc()).limit(6).all()
-        latest_books = Book.query.order_by(Book.created_at.desc()).limit(4).all()
+        # Left unevaluated: the template's cached fragments only run them on a miss
+        latest_articles = Article.summary_query().order_by(Article.created_at.desc())
+        latest_books = Book.query.order_by(Book.created_at.desc()).limit(4)
         return render_template('index.html', articles=latest_articles, books=latest_books, now=datetime.now())
 
+    SEARCH_PAGE_SIZE = 10
+
     @app.route('/search')
     def search():
         query = request.args.get('q', '').strip()
         if not query:
-            return render_template('search_results.html', results=[], query='', total_results=0)
-        ts_query = func.websearch_to_tsquery('arabic', query)
-        book_results = db.session.query(
-            Book, func.ts_rank(Book.__ts_vector__, ts_query).label('rank')
-        ).filter(Book.__ts_vector__.match(ts_query, postgresql_regconfig='arabic')).order_by(desc('rank')).all()
-        article_results = db.session.query(
-            Article, func.ts_rank(Article.__ts_vector__, ts_query).label('rank')
-        ).filter(Article.__ts_vector__.match(ts_query, postgresql_regconfig='arabic')).order_by(desc('rank')).all()
+            return render_template('search_results.html', results=[], query='', total_results=0, now=datetime.now())
+        page = max(request.args.get('page', 1, type=int), 1)
+        kind = request.args.get('type') if request.args.get('type') in ('book', 'article') else None
+        category = request.args.get('category') or None
+        result_page = get_search_backend().search(
+            query, SEARCH_PAGE_SIZE, (page - 1) * SEARCH_PAGE_SIZE, kind, category
+        )
         results = []
-        for book, rank in book_results:
-            results.append({'type': 'كتاب', 'item': book.to_dict(), 'rank': rank, 'url': url_for('books_page') + f'#book-{book.id}'})
-        for article, rank in article_results:
-            results.append({'type': 'مقال', 'item': article.to_dict(), 'rank': rank, 'url': url_for('articles_page') + f'#article-{article.id}'})
-        results.sort(key=lambda x: x['rank'], reverse=True)
-        return render_template('search_results.html', results=results, query=query, total_results=len(results))
+        for hit in result_page.hits:
+            if hit.kind == 'book':
+                results.append({'type': 'كتاب', 'item': hit.item.to_dict(), 'rank': hit.rank, 'snippet': hit.snippet, 'url': url_for('books_page') + f'#book-{hit.item.id}'})
+            else:
+                results.append({'type': 'مقال', 'item': hit.item.to_summary_dict(), 'rank': hit.rank, 'snippet': hit.snippet, 'url': url_for('articles_page') + f'#article-{hit.item.id}'})
+        pages = -(-result_page.total // SEARCH_PAGE_SIZE)
+        return render_template(
+            'search_results.html', results=results, query=query, total_results=result_page.total,
+            facets=result_page.facets, page=page, pages=pages, kind=kind, category=category, now=datetime.now()
+        )
+
+    SUGGEST_LIMIT = 8
+
+    @app.route('/api/search/suggest')
+    @cache_policy(max_age=30)
+    def search_suggest():
+        """Returns title and category suggestions for the text typed so far."""
+        query = request.args.get('q', '').strip()
+        limit = min(max(request.args.get('limit', SUGGEST_LIMIT, type=int), 1), SUGGEST_LIMIT)
+        suggestions = suggest_index.refresh().suggest(query, limit) if query else []
+        return jsonify({'query': query, 'suggestions': suggestions})
 
     @app.route('/admin')
     @login_required
@@ -183,8 +312,10 @@ def create_app(config_name='production'):
 
     @app.route('/articles')
     def articles_page():
-        categories = db.session.query(Article.category).distinct().all()
-        categories = [cat[0] for cat in categories if cat[0]]
+        def load_categories():
+            rows = db.session.query(Article.category).distinct().all()
+            return [cat[0] for cat in rows if cat[0]]
+        categories = content_cache.get_or_set('article:categories', ('article',), load_categories)
         if not categories:
             categories = ['فكر إسلامي', 'تربية', 'مجتمع', 'سياسة', 'تاريخ']
         return render_template('articles_simple.html', categories=categories, now=datetime.now())
@@ -230,6 +361,7 @@ def create_app(config_name='production'):
                 login_user(user)
                 user.last_login = datetime.utcnow()
                 db.session.commit()
+                user_cache.invalidate(user.id)
                 return jsonify({'message': 'تم تسجيل الدخول بنجاح', 'user': user.to_dict()})
             else:
                 return jsonify({'error': 'تم تعطيل هذا الحساب'}), 403
@@ -254,20 +386,31 @@ def create_app(config_name='production'):
 
     @app.route('/api/auth-status')
     def auth_status():
+        # current_user comes from the user cache, so polling does not query the database
         if current_user.is_authenticated:
             return jsonify({'authenticated': True, 'user': current_user.to_dict()})
         return jsonify({'authenticated': False})
 
     # --- Books API ---
     @app.route('/api/books', methods=['GET'])
+    @cache_policy()
     def get_books():
-        books = Book.query.all()
-        return jsonify({'books': [book.to_dict() for book in books]})
+        return list_collection(Book, 'books')
 
     @app.route('/api/books/<int:book_id>', methods=['GET'])
+    @cache_policy()
     def get_book(book_id):
         book = Book.query.get_or_404(book_id)
-        return jsonify({'book': book.to_dict()})
+        return item_response(book, 'book')
+
+    @app.route('/books/<int:book_id>/download')
+    @cache_policy()
+    def download_book(book_id):
+        book = Book.query.get_or_404(book_id)
+        response = download_response(book)
+        if response is None:
+            abort(404)
+        return response
 
     @app.route('/api/books', methods=['POST'])
     @login_required
@@ -308,14 +451,15 @@ def create_app(config_name='production'):
 
     # --- Articles API ---
     @app.route('/api/articles', methods=['GET'])
+    @cache_policy()
     def get_articles():
-        articles = Article.query.order_by(Article.created_at.desc()).all()
-        return jsonify({'articles': [article.to_dict() for article in articles]})
+        return list_collection(Article, 'articles', Article.SUMMARY_FIELDS)
 
     @app.route('/api/articles/<int:article_id>', methods=['GET'])
+    @cache_policy()
     def get_article(article_id):
         article = Article.query.get_or_404(article_id)
-        return jsonify({'article': article.to_dict()})
+        return item_response(article, 'article')
 
     @app.route('/api/articles', methods=['POST'])
     @login_required
@@ -355,14 +499,15 @@ def create_app(config_name='production'):
 
     # --- Gallery API ---
     @app.route('/api/gallery', methods=['GET'])
+    @cache_policy()
     def get_gallery():
-        images = GalleryImage.query.all()
-        return jsonify({'images': [image.to_dict() for image in images]})
+        return list_collection(GalleryImage, 'images')
 
     @app.route('/api/gallery/<int:image_id>', methods=['GET'])
+    @cache_policy()
     def get_gallery_image(image_id):
         image = GalleryImage.query.get_or_404(image_id)
-        return jsonify({'image': image.to_dict()})
+        return item_response(image, 'image')
 
     @app.route('/api/gallery', methods=['POST'])
     @login_required
@@ -394,6 +539,49 @@ def create_app(config_name='production'):
         db.session.commit()
         return jsonify({'message': 'Image deleted'})
 
+    # --- Sync API ---
+    # Rows committed while a sync is running may carry an updated_at slightly
+    # older than the returned server_time, so each sync re-reads this window.
+    SYNC_OVERLAP = timedelta(seconds=5)
+
+    @app.route('/api/sync', methods=['GET'])
+    def sync():
+        """Returns content created, changed or deleted since the client's last sync.
+
+        Clients pass the previous response's ``server_time`` as ``since`` and
+        should apply ``deleted`` before ``changed``. Without ``since`` the full
+        catalogue is returned.
+        """
+        server_time = datetime.utcnow()
+        since = None
+        if request.args.get('since'):
+            try:
+                since = datetime.fromisoformat(request.args['since'].replace('Z', '+00:00'))
+            except ValueError:
+                return jsonify({'error': 'Invalid since timestamp'}), 400
+            if since.tzinfo is not None:
+                since = since.astimezone(timezone.utc).replace(tzinfo=None)
+            since -= SYNC_OVERLAP
+
+        collections = (
+            ('books', Book, Book.query, Book.to_dict),
+            ('articles', Article, Article.summary_query(), Article.to_summary_dict),
+            ('gallery', GalleryImage, GalleryImage.query, GalleryImage.to_dict),
+        )
+        payload = {'server_time': server_time.isoformat() + 'Z'}
+        for key, model, query, serialize in collections:
+            deleted = []
+            if since is not None:
+                query = query.filter(model.updated_at >= since)
+                deleted = [record_id for (record_id,) in db.session.query(Tombstone.record_id).filter(
+                    Tombstone.table_name == model.__tablename__, Tombstone.deleted_at >= since
+                )]
+            payload[key] = {
+                'changed': [serialize(item) for item in query.order_by(model.updated_at)],
+                'deleted': deleted,
+            }
+        return jsonify(payload)
+
     # --- Contact API ---
     @app.route('/api/contact', methods=['POST'])
     def submit_contact():
@@ -426,12 +614,123 @@ def create_app(config_name='production'):
         db.session.commit()
         return jsonify({'message': 'Message deleted'})
 
+    # --- Jobs API ---
+    @app.route('/api/jobs', methods=['POST'])
+    @login_required
+    @admin_required
+    def enqueue_job():
+        data = request.json or {}
+        if data.get('name') not in TASKS:
+            return jsonify({'error': f'Unknown task. Available: {", ".join(sorted(TASKS))}'}), 400
+        if not isinstance(data.get('payload', {}), dict):
+            return jsonify({'error': 'payload must be an object'}), 400
+        if data.get('max_attempts') is not None and (type(data['max_attempts']) is not int or data['max_attempts'] < 1):
+            return jsonify({'error': 'max_attempts must be a positive integer'}), 400
+        job = job_queue.enqueue(data['name'], data.get('payload'), max_attempts=data.get('max_attempts'))
+        response = jsonify({'message': 'Job queued', 'job': job.to_dict()})
+        response.status_code = 202
+        response.headers['Location'] = url_for('get_job', job_id=job.id)
+        return response
+
+    @app.route('/api/jobs/<int:job_id>', methods=['GET'])
+    @login_required
+    @editor_required
+    def get_job(job_id):
+        job = db.get_or_404(Job, job_id)
+        return jsonify({'job': job.to_dict()})
+
+    # --- User Activity API ---
+    @app.route('/api/user/record-activity', methods=['POST'])
+    @login_required
+    def record_activity():
+        """Accepts one activity event or a batch; they are written in the background."""
+        try:
+            events = parse_events(request.get_json(silent=True))
+        except ActivityError as e:
+            return jsonify({'error': str(e)}), 400
+        activity_buffer.add(current_user.id, events)
+        return jsonify({'accepted': len(events)}), 202
+
+    @app.route('/api/user/activities')
+    @login_required
+    def user_activities():
+        """Lists the user's recent activities, newest first, a page at a time.
+
+        ``data``, a JSON object, keeps the activities whose metadata holds
+        its keys and values.
+        """
+        try:
+            limit = parse_limit(request.args.get('limit')) or 20
+            data = parse_json_filter(request.args.get('data'))
+            query = UserActivity.query.filter_by(user_id=current_user.id)
+            if data:
+                query = query.filter(json_contains(UserActivity.activity_data, data))
+            activities, next_cursor = paginate(query, UserActivity, limit, request.args.get('cursor'))
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'activities': [activity.to_dict() for activity in activities], 'next_cursor': next_cursor})
+
+    @app.route('/api/user/statistics')
+    @login_required
+    def user_statistics_api():
+        """Returns the user's activity totals, read from the daily rollup."""
+        return jsonify(user_statistics(current_user.id))
+
+    @app.route('/api/user/recommendations')
+    @login_required
+    def user_recommendations():
+        """Recommends books and articles from the precomputed neighbours of the user's recent reads."""
+        try:
+            limit = min(parse_limit(request.args.get('limit')) or DEFAULT_RECOMMENDATIONS, MAX_RECOMMENDATIONS)
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify({'recommendations': recommend(current_user.id, limit)})
+
+    @app.route('/api/admin/recent-activities')
+    @login_required
+    @admin_required
+    def recent_activities():
+        """Lists the latest activities with the names of their users."""
+        try:
+            limit = parse_limit(request.args.get('limit')) or 20
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
+        # Newest first by primary key, so only the returned rows are read
+        rows = (db.session.query(UserActivity, User.username)
+                .join(User, User.id == UserActivity.user_id)
+                .order_by(UserActivity.id.desc()).limit(limit))
+        return jsonify({'activities': [{**activity.to_dict(), 'username': username} for activity, username in rows]})
+
+    @app.route('/api/admin/activity-statistics')
+    @login_required
+    @admin_required
+    def activity_statistics():
+        """Returns site-wide activity per hour or day, read from the rollups."""
+        period = request.args.get('period', 'day')
+        if period not in PERIODS:
+            return jsonify({'error': 'Invalid period'}), 400
+        maximum = 24 * 7 if period == 'hour' else 366
+        try:
+            buckets = int(request.args.get('buckets', 24 if period == 'hour' else 30))
+        except ValueError:
+            return jsonify({'error': 'Invalid buckets'}), 400
+        if not 1 <= buckets <= maximum:
+            return jsonify({'error': f'buckets must be between 1 and {maximum}'}), 400
+        return jsonify({'period': period, 'series': activity_series(period, buckets)})
+
     # --- User Management API ---
     @app.route('/api/users', methods=['GET'])
     @login_required
     @admin_required
     def get_users():
-        users = User.query.all()
+        try:
+            preferences = parse_json_filter(request.args.get('preferences'))
+        except PaginationError as e:
+            return jsonify({'error': str(e)}), 400
+        query = User.query
+        if preferences:
+            query = query.filter(json_contains(User.preferences, preferences))
+        users = query.all()
         return jsonify({'users': [user.to_dict() for user in users]})
 
     @app.route('/api/users/<int:user_id>', methods=['GET'])
@@ -465,6 +764,7 @@ def create_app(config_name='production'):
         if 'password' in data and data['password']:
             user.set_password(data['password'])
         db.session.commit()
+        user_cache.invalidate(user.id)
         return jsonify({'message': 'User updated', 'user': user.to_dict()})
 
     @app.route('/api/users/<int:user_id>/status', methods=['PUT'])
@@ -476,6 +776,7 @@ def create_app(config_name='production'):
         if 'active' in data:
             user.active = data['active']
             db.session.commit()
+            user_cache.invalidate(user.id)
         return jsonify({'message': 'User status updated', 'user': user.to_dict()})
 
     @app.route('/api/users/<int:user_id>', methods=['DELETE'])
@@ -487,6 +788,7 @@ def create_app(config_name='production'):
             return jsonify({'error': 'Cannot delete self'}), 400
         db.session.delete(user)
         db.session.commit()
+        user_cache.invalidate(user_id)
         return jsonify({'message': 'User deleted'})
 
     # --- File Uploads ---
@@ -529,10 +831,130 @@ def create_app(config_name='production'):
         elif not allowed_file(file.filename):
             return jsonify({'error': 'File type not allowed'}), 400
 
-        filename = generate_unique_filename(file.filename)
         upload_path = os.path.join(app.config['UPLOAD_FOLDER'], subfolder)
-        os.makedirs(upload_path, exist_ok=True)
-        file.save(os.path.join(upload_path, filename))
-        return jsonify({'message': 'File uploaded', 'file_url': f'/static/uploads/{subfolder}/{filename}'}), 201
+        ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
+        filename, created = store_upload(file.stream, upload_path, ext)
+        file_url = f'/static/uploads/{subfolder}/{filename}'
+        response = {'message': 'File uploaded', 'file_url': file_url}
+        if ext in IMAGE_EXTENSIONS and (created or not os.path.exists(manifest_path(os.path.join(upload_path, filename)))):
+            # Resized copies are made in the background; srcset appears once they exist
+            job = job_queue.enqueue('image_variants', {'path': os.path.join(upload_path, filename), 'url': file_url})
+            response['job'] = job.to_dict()
+        elif ext == 'pdf' and load_pdf_info(os.path.join(upload_path, filename)) is None:
+            response['job'] = extract_pdf_info(os.path.join(upload_path, filename), file_url).to_dict()
+        return jsonify(response), 201
+
+    def extract_pdf_info(path, url):
+        """Queues reading a new PDF's page count and first-page preview."""
+        return job_queue.enqueue('pdf_metadata', {'path': path, 'url': url})
+
+    # --- Resumable Book PDF Uploads ---
+    # Protocol: create a session with the file's size, PUT each chunk as the
+    # raw request body at ?offset=<bytes received so far>, then complete it.
+    # After an interruption, GET the session to learn where to resume.
+    UPLOAD_SESSION_TTL = timedelta(days=1)
+
+    def partial_path(upload):
+        return os.path.join(app.config['UPLOAD_FOLDER'], '.partial', f'{upload.id}.part')
+
+    def discard_upload(upload):
+        """Deletes an upload session and its partial file."""
+        if os.path.exists(partial_path(upload)):
+            os.remove(partial_path(upload))
+        db.session.delete(upload)
+
+    def get_upload_or_404(upload_id):
+        upload = db.get_or_404(UploadSession, upload_id)
+        if upload.user_id != current_user.id and not current_user.is_admin():
+            abort(404)
+        return upload
+
+    @app.route('/api/upload/book-pdf/sessions', methods=['POST'])
+    @login_required
+    @editor_required
+    def create_upload_session():
+        data = request.json or {}
+        filename = data.get('filename') or ''
+        size = data.get('size')
+        if filename.rsplit('.', 1)[-1].lower() != 'pdf' or '.' not in filename:
+            return jsonify({'error': 'File type not allowed. Allowed: pdf'}), 400
+        if type(size) is not int or not 0 < size <= app.config['MAX_BOOK_PDF_SIZE']:
+            return jsonify({'error': f'size must be between 1 and {app.config["MAX_BOOK_PDF_SIZE"]} bytes'}), 400
+
+        # Abandoned sessions are cleaned up whenever a new one starts
+        for stale in UploadSession.query.filter(UploadSession.updated_at < datetime.utcnow() - UPLOAD_SESSION_TTL):
+            discard_upload(stale)
+        upload = UploadSession(id=os.urandom(16).hex(), user_id=current_user.id, filename=filename, size=size)
+        db.session.add(upload)
+        db.session.commit()
+        os.makedirs(os.path.dirname(partial_path(upload)), exist_ok=True)
+        open(partial_path(upload), 'wb').close()
+
+        response = jsonify({'upload': upload.to_dict(), 'chunk_size': app.config['UPLOAD_CHUNK_SIZE']})
+        response.status_code = 201
+        response.headers['Location'] = url_for('upload_session', upload_id=upload.id)
+        return response
+
+    @app.route('/api/upload/book-pdf/sessions/<upload_id>', methods=['GET'])
+    @login_required
+    @editor_required
+    def upload_session(upload_id):
+        return jsonify({'upload': get_upload_or_404(upload_id).to_dict()})
+
+    @app.route('/api/upload/book-pdf/sessions/<upload_id>', methods=['PUT'])
+    @login_required
+    @editor_required
+    def upload_chunk(upload_id):
+        upload = get_upload_or_404(upload_id)
+        offset = request.args.get('offset', type=int)
+        if offset != upload.received:
+            return jsonify({'error': 'Chunk does not start at the current offset', 'offset': upload.received}), 409
+        try:
+            # request.stream is read directly, so the body is never buffered whole
+            written = write_chunk(partial_path(upload), offset, request.stream, upload.size - offset)
+        except ValueError as e:
+            return jsonify({'error': str(e), 'offset': upload.received}), 400
+        upload.received = offset + written
+        db.session.commit()
+        return jsonify({'upload': upload.to_dict()})
+
+    @app.route('/api/upload/book-pdf/sessions/<upload_id>/complete', methods=['POST'])
+    @login_required
+    @editor_required
+    def complete_upload(upload_id):
+        upload = get_upload_or_404(upload_id)
+        if upload.received != upload.size:
+            return jsonify({'error': 'Upload is incomplete', 'offset': upload.received}), 409
+        path = partial_path(upload)
+        with open(path, 'rb') as f:
+            is_pdf = f.read(5) == b'%PDF-'
+        if not is_pdf:
+            discard_upload(upload)
+            db.session.commit()
+            return jsonify({'error': 'File is not a PDF'}), 400
+        digest = hash_file(path)
+        expected = (request.json or {}).get('sha256') if request.is_json else None
+        if expected and expected.lower() != digest:
+            discard_upload(upload)
+            db.session.commit()
+            return jsonify({'error': 'Checksum mismatch'}), 400
+
+        folder = os.path.join(app.config['UPLOAD_FOLDER'], 'books')
+        filename, _ = commit_blob(path, folder, digest, 'pdf')
+        db.session.delete(upload)
+        db.session.commit()
+        file_url = f'/static/uploads/books/{filename}'
+        response = {'message': 'File uploaded', 'file_url': file_url, 'sha256': digest}
+        if load_pdf_info(os.path.join(folder, filename)) is None:
+            response['job'] = extract_pdf_info(os.path.join(folder, filename), file_url).to_dict()
+        return jsonify(response), 201
+
+    @app.route('/api/upload/book-pdf/sessions/<upload_id>', methods=['DELETE'])
+    @login_required
+    @editor_required
+    def abort_upload(upload_id):
+        discard_upload(get_upload_or_404(upload_id))
+        db.session.commit()
+        return jsonify({'message': 'Upload cancelled'})
 
     return app
\ No newline at end of file
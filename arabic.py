@@ -0,0 +1,89 @@
+"""
+Arabic text normalization and light stemming for search.
+
+Stored text and queries are reduced to the same canonical form before they
+meet in the search index, so spelling variants that readers consider the
+same word match each other:
+
+- diacritics (tashkeel), Quranic marks and tatweel are removed;
+- alef variants (أ إ آ ٱ) become ا, alef maqsura (ى) becomes ي,
+  taa marbuta (ة) becomes ه, and hamza carriers (ؤ ئ) become و and ي;
+- common prefixes (و, ال and its attached forms) and suffixes are stripped
+  by a Light10-style stemmer.
+
+Only the index and the query are normalized; displayed text is never
+altered.
+"""
+import re
+
+_DIACRITICS = re.compile('[ؐ-ًؚ-ٰٟۖ-ۭـ]')
+_LETTER_MAP = str.maketrans({
+    'أ': 'ا', 'إ': 'ا', 'آ': 'ا', 'ٱ': 'ا',
+    'ى': 'ي', 'ة': 'ه', 'ؤ': 'و', 'ئ': 'ي',
+})
+_TAGS = re.compile(r'<[^>]*>?')
+_ARABIC_LETTERS = re.compile('[ء-ي]')
+
+# Word characters including the marks removed by normalization, so a word
+# written with diacritics is read as a single token
+TOKEN_PATTERN = re.compile('[\\wؐ-ًؚ-ٰٟۖ-ۭـ]+')
+
+_PREFIXES = ('وال', 'بال', 'كال', 'فال', 'لل', 'ال')
+_SUFFIXES = ('ها', 'ان', 'ات', 'ون', 'ين', 'يه', 'ه', 'ي')
+
+
+def normalize(text):
+    """Normalizes the letters of an Arabic text without stemming it.
+
+    Args:
+        text (str | None): The text to normalize.
+
+    Returns:
+        str: The text without diacritics or tatweel, with letter variants
+        unified and Latin letters lower-cased.
+    """
+    if not text:
+        return ''
+    return _DIACRITICS.sub('', text).translate(_LETTER_MAP).lower()
+
+
+def strip_prefixes(word):
+    """Removes a leading conjunction and definite article from a normalized word."""
+    if len(word) >= 4 and word.startswith('و'):
+        word = word[1:]
+    for prefix in _PREFIXES:
+        if word.startswith(prefix) and len(word) - len(prefix) >= 2:
+            return word[len(prefix):]
+    return word
+
+
+def stem(word):
+    """Applies light stemming to one normalized word.
+
+    Affixes are only removed when at least two letters remain, and words
+    without Arabic letters are returned unchanged.
+    """
+    if not _ARABIC_LETTERS.search(word):
+        return word
+    word = strip_prefixes(word)
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 2:
+            word = word[:-len(suffix)]
+    return word
+
+
+def analyze(text):
+    """Splits a text into normalized, stemmed search terms.
+
+    HTML tags are ignored, so article bodies can be analyzed directly.
+
+    Returns:
+        list[str]: The terms in document order.
+    """
+    text = normalize(_TAGS.sub(' ', text or ''))
+    return [stem(token) for token in TOKEN_PATTERN.findall(text)]
+
+
+def index_text(*texts):
+    """Builds the space-separated term string stored for the search index."""
+    return ' '.join(term for text in texts for term in analyze(text))
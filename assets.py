@@ -0,0 +1,337 @@
+"""
+Static asset pipeline: minified, fingerprinted bundles and their manifest.
+
+Every stylesheet in ``static/css`` and script in ``static/js`` is minified
+and written to ``static/dist`` under a name containing the hash of its
+content, e.g. ``dist/js/main.3f2a9c81d0b4.js``. Files loaded together on
+the public pages are also concatenated into the bundles in :data:`BUNDLES`.
+``dist/manifest.json`` maps each logical name to its built file, and
+templates resolve names through :func:`asset_url`, so a changed file gets a
+new URL and built files can be cached forever.
+
+The service worker is generated from ``static/js/service-worker.js`` with
+its cache named after the build and its precache list taken from the
+manifest, so each deployment replaces the offline copies of the assets.
+
+Without a build, templates fall back to the source files.
+
+Usage:
+    python assets.py    (or ``flask build-assets``)
+"""
+import hashlib
+import json
+import os
+import posixpath
+import re
+
+import click
+from flask import current_app, url_for
+
+OUTPUT_FOLDER = 'dist'
+MANIFEST_NAME = 'manifest.json'
+SERVICE_WORKER_SOURCE = 'js/service-worker.js'
+
+# Files loaded together on the public pages, in load order
+BUNDLES = {
+    'css/effects.css': ['css/animations.css', 'css/loading.css'],
+    'js/home.js': ['js/scroll-animations.js', 'js/books.js', 'js/gallery.js', 'js/contact.js',
+                   'js/activity-tracking.js'],
+}
+
+# Assets the service worker stores at install, besides the home and offline pages
+PRECACHE = ('css/style.css', 'css/effects.css', 'js/main.js', 'js/home.js', 'js/sw-register.js')
+
+_FINGERPRINTED = re.compile(r'^/static/dist/.+\.[0-9a-f]{12}\.(css|js)$')
+
+
+def is_fingerprinted(path):
+    """Tells whether a request path names a built, fingerprinted asset."""
+    return bool(_FINGERPRINTED.match(path))
+
+
+# --- Minification ---
+_CSS_COMMENT = re.compile(r'("(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\')|/\*.*?\*/', re.DOTALL)
+_CSS_URL = re.compile(r'url\(\s*([\'"]?)([^\'")]+)\1\s*\)')
+
+
+def minify_css(source, filename=None):
+    """Removes comments and redundant whitespace from a stylesheet.
+
+    Relative ``url()`` references are made absolute when ``filename`` (the
+    path below ``static``) is given, since the built file lives elsewhere.
+    """
+    source = _CSS_COMMENT.sub(lambda m: m.group(1) or '', source)
+    if filename:
+        base = posixpath.dirname(f'/static/{filename}')
+
+        def absolute(match):
+            quote, reference = match.groups()
+            if reference.startswith(('/', '#', 'data:', 'http:', 'https:')):
+                return match.group(0)
+            return f'url({quote}{posixpath.normpath(posixpath.join(base, reference))}{quote})'
+
+        source = _CSS_URL.sub(absolute, source)
+    source = re.sub(r'\s+', ' ', source)
+    source = re.sub(r'\s*([{};,>])\s*', r'\1', source)
+    source = re.sub(r':\s+', ':', source)
+    return source.replace(';}', '}').strip()
+
+
+_REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^')
+_REGEX_KEYWORDS = {'return', 'typeof', 'case', 'do', 'else', 'in', 'of', 'void', 'delete', 'throw',
+                   'new', 'instanceof', 'yield', 'await'}
+_WORD = re.compile(r'[\w$]+')
+
+
+def _string_end(source, start):
+    """Returns the index just after the quoted string starting at ``start``."""
+    quote, i = source[start], start + 1
+    while i < len(source) and source[i] != quote:
+        i += 2 if source[i] == '\\' else 1
+    return i + 1
+
+
+def _template_end(source, start):
+    """Returns the index just after the template literal starting at ``start``."""
+    i = start + 1
+    while i < len(source) and source[i] != '`':
+        if source[i] == '\\':
+            i += 2
+        elif source.startswith('${', i):
+            i = _expression_end(source, i + 2)
+        else:
+            i += 1
+    return i + 1
+
+
+def _expression_end(source, start):
+    """Returns the index just after the ``}`` closing a template substitution."""
+    depth, i = 0, start
+    while i < len(source):
+        c = source[i]
+        if c in '\'"':
+            i = _string_end(source, i)
+            continue
+        if c == '`':
+            i = _template_end(source, i)
+            continue
+        if c == '{':
+            depth += 1
+        elif c == '}':
+            if depth == 0:
+                return i + 1
+            depth -= 1
+        i += 1
+    return i
+
+
+def _regex_end(source, start):
+    """Returns the index after a regular expression literal and its flags, or None."""
+    i, in_class = start + 1, False
+    while i < len(source):
+        c = source[i]
+        if c == '\n':
+            return None
+        if c == '\\':
+            i += 2
+            continue
+        if c == '[':
+            in_class = True
+        elif c == ']':
+            in_class = False
+        elif c == '/' and not in_class:
+            i += 1
+            while i < len(source) and (source[i].isalnum() or source[i] == '_'):
+                i += 1
+            return i
+        i += 1
+    return None
+
+
+def minify_js(source):
+    """Removes comments, indentation and blank lines from a script.
+
+    Strings, template literals and regular expressions are copied as they
+    are. Line breaks are kept wherever automatic semicolon insertion could
+    depend on them, so the result behaves exactly like the source.
+    """
+    out = []
+    previous = ''
+    i, length = 0, len(source)
+
+    def emit_break(newline):
+        last = out[-1][-1] if out else ''
+        if newline and last not in '\n{;,([':
+            out.append('\n')
+        elif not newline and last and i < length and (last.isalnum() or last in '_$') \
+                and (source[i].isalnum() or source[i] in '_$'):
+            out.append(' ')
+        elif not newline and last in '+-' and i < length and source[i] == last:
+            out.append(' ')
+
+    while i < length:
+        c = source[i]
+        if c in '\'"':
+            end = _string_end(source, i)
+        elif c == '`':
+            end = _template_end(source, i)
+        elif source.startswith('//', i):
+            end = source.find('\n', i)
+            i = length if end == -1 else end
+            continue
+        elif source.startswith('/*', i):
+            end = source.find('*/', i + 2)
+            end = length if end == -1 else end + 2
+            comment, i = source[i:end], end
+            emit_break('\n' in comment)
+            continue
+        elif c.isspace():
+            start = i
+            while i < length and source[i].isspace():
+                i += 1
+            emit_break('\n' in source[start:i])
+            continue
+        elif c == '/' and (not previous or previous in _REGEX_PRECEDERS or previous in _REGEX_KEYWORDS):
+            end = _regex_end(source, i) or i + 1
+        else:
+            word = _WORD.match(source, i)
+            end = word.end() if word else i + 1
+        token, i = source[i:end], end
+        out.append(token)
+        previous = token if _WORD.fullmatch(token) else token[-1] if len(token) == 1 else '"'
+    return ''.join(out).strip() + '\n'
+
+
+# --- Building ---
+def _sources(static_folder):
+    """Lists every asset built on its own: the top-level stylesheets and scripts."""
+    names = {}
+    for kind, extension in (('css', '.css'), ('js', '.js')):
+        folder = os.path.join(static_folder, kind)
+        for filename in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+            name = f'{kind}/{filename}'
+            if filename.endswith(extension) and name != SERVICE_WORKER_SOURCE:
+                names[name] = [name]
+    return names
+
+
+def _minify(name, static_folder):
+    with open(os.path.join(static_folder, name), encoding='utf-8') as f:
+        source = f.read()
+    return minify_css(source, name) if name.endswith('.css') else minify_js(source)
+
+
+def _write(path, content):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + '.tmp', 'w', encoding='utf-8') as f:
+        f.write(content)
+    os.replace(path + '.tmp', path)
+
+
+def load_manifest(static_folder):
+    """Returns the manifest of the last build, or an empty one."""
+    try:
+        with open(os.path.join(static_folder, OUTPUT_FOLDER, MANIFEST_NAME), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def build_assets(static_folder):
+    """Builds the fingerprinted assets, the manifest and the service worker.
+
+    Files whose content did not change keep their name and are not
+    rewritten. Built files from the previous build are kept, so pages
+    rendered before a deployment still find their assets; older ones are
+    removed.
+
+    Args:
+        static_folder (str): The application's static folder.
+
+    Returns:
+        dict: The manifest, mapping logical names to paths below ``static``.
+    """
+    output = os.path.join(static_folder, OUTPUT_FOLDER)
+    previous = load_manifest(static_folder)
+    manifest = {}
+    for name, files in {**_sources(static_folder), **BUNDLES}.items():
+        separator = '\n' if name.endswith('.css') else ';\n'
+        content = separator.join(_minify(source, static_folder) for source in files)
+        digest = hashlib.sha256(content.encode('utf-8')).hexdigest()[:12]
+        stem, extension = posixpath.splitext(name)
+        built = f'{OUTPUT_FOLDER}/{stem}.{digest}{extension}'
+        if not os.path.exists(os.path.join(static_folder, built)):
+            _write(os.path.join(static_folder, built), content)
+        manifest[name] = built
+
+    _write(os.path.join(output, 'service-worker.js'), _service_worker(static_folder, manifest))
+
+    keep = set(manifest.values()) | set(previous.values())
+    for folder, _, filenames in os.walk(output):
+        for filename in filenames:
+            path = os.path.join(folder, filename)
+            relative = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            if is_fingerprinted(f'/static/{relative}') and relative not in keep:
+                os.remove(path)
+    _write(os.path.join(output, MANIFEST_NAME), json.dumps(manifest, indent=2, sort_keys=True))
+    return manifest
+
+
+def _service_worker(static_folder, manifest):
+    """Generates the service worker with a per-build cache and precache list."""
+    with open(os.path.join(static_folder, SERVICE_WORKER_SOURCE), encoding='utf-8') as f:
+        source = f.read()
+    version = hashlib.sha256(json.dumps(manifest, sort_keys=True).encode('utf-8')).hexdigest()[:12]
+    urls = ["'/'", 'OFFLINE_URL'] + [f"'/static/{manifest[name]}'" for name in PRECACHE if name in manifest]
+    source = re.sub(r"const CACHE_NAME = '[^']*';", f"const CACHE_NAME = 'tahhan-site-{version}';", source)
+    source = re.sub(r'const STATIC_ASSETS = \[.*?\];',
+                    'const STATIC_ASSETS = [\n    ' + ',\n    '.join(urls) + ',\n];', source, flags=re.DOTALL)
+    return minify_js(source)
+
+
+# --- Templates ---
+def asset_url(name):
+    """Returns the URL of an asset, fingerprinted when it was built."""
+    manifest = current_app.extensions.get('assets', {})
+    return url_for('static', filename=manifest.get(name, name))
+
+
+def asset_urls(name):
+    """Returns the URLs to load for a bundle: the built file, or its sources."""
+    manifest = current_app.extensions.get('assets', {})
+    if name in manifest or name not in BUNDLES:
+        return [asset_url(name)]
+    return [url_for('static', filename=source) for source in BUNDLES[name]]
+
+
+def init_assets(app):
+    """Loads the asset manifest and registers the template helpers.
+
+    Also adds the ``flask build-assets`` command.
+
+    Returns:
+        dict: The manifest (empty when assets were not built).
+    """
+    manifest = load_manifest(app.static_folder)
+    app.extensions['assets'] = manifest
+    app.jinja_env.globals.update(asset_url=asset_url, asset_urls=asset_urls)
+
+    @app.cli.command('build-assets')
+    def build_assets_command():
+        """Builds the minified, fingerprinted static assets."""
+        app.extensions['assets'] = build_assets(app.static_folder)
+        click.echo(f'Built {len(app.extensions["assets"])} assets into {os.path.join(app.static_folder, OUTPUT_FOLDER)}')
+
+    return manifest
+
+
+def main():
+    """Builds the assets of the application's static folder."""
+    static_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+    manifest = build_assets(static_folder)
+    for name, built in sorted(manifest.items()):
+        print(f'{name} -> {built}')
+
+
+if __name__ == '__main__':
+    main()
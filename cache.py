@@ -0,0 +1,352 @@
+"""
+Content cache with write-through invalidation.
+
+Public pages and list APIs only change when an editor writes a Book, Article
+or GalleryImage, so their query results and rendered responses are cached
+and tagged with the tables they were built from. Every tag carries a version
+counter; committing a change to a tracked table bumps its counter, which
+makes all entries built from the old version unreachable. Stale entries are
+never served and simply age out of the backend.
+
+Two backends are provided: an in-process LRU with per-entry TTL, and a
+shared backend for any Redis-compatible client so all workers see the same
+entries and invalidations. :class:`LocalSharedClient` is a dict-backed
+stand-in for that client in development and tests.
+
+A commit only bumps the counters of the worker that made it when the
+in-process backend is used. That cache therefore also keys its entries by
+:func:`database_version`, the latest ``updated_at`` and deletion of each
+tag's table. Each worker reads it at most once per ``check_interval``
+seconds, so changes made by other workers or processes are seen within
+that interval while cached reads almost never touch the database.
+"""
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from itertools import chain
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from database import db
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - optional dependency
+    redis = None
+
+logger = logging.getLogger(__name__)
+
+TRACKED_TABLES = frozenset({'book', 'article', 'gallery_image'})
+
+_MISSING = object()
+
+
+class MemoryBackend:
+    """An in-process, thread-safe LRU cache whose entries expire after a TTL.
+
+    Args:
+        max_entries (int): The number of entries kept before evicting the
+            least recently used one.
+        default_ttl (int): Seconds an entry lives when no TTL is given.
+    """
+
+    def __init__(self, max_entries=1024, default_ttl=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._entries = OrderedDict()
+        self._counters = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Returns the cached value for ``key``, or ``default`` if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Stores ``value`` under ``key`` for ``ttl`` seconds."""
+        expires_at = time.monotonic() + (ttl or self.default_ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Removes ``key`` from the cache if present."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def counter(self, key):
+        """Returns the current value of a version counter."""
+        with self._lock:
+            return self._counters.get(key, 0)
+
+    def incr(self, key):
+        """Increments a version counter and returns its new value."""
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+    def clear(self):
+        """Removes every entry and counter."""
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+
+
+class SharedBackend:
+    """A cache shared between workers through a Redis-compatible client.
+
+    Args:
+        client: An object implementing ``get``, ``set(..., ex=)``, ``delete``
+            and ``incr`` with Redis semantics.
+        prefix (str): A namespace prepended to every key.
+        default_ttl (int): Seconds an entry lives when no TTL is given.
+    """
+
+    def __init__(self, client, prefix='tahhan:', default_ttl=300):
+        self.client = client
+        self.prefix = prefix
+        self.default_ttl = default_ttl
+
+    def get(self, key, default=None):
+        """Returns the cached value for ``key``, or ``default`` if absent."""
+        raw = self.client.get(self.prefix + key)
+        if raw is None:
+            return default
+        return pickle.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        """Stores ``value`` under ``key`` for ``ttl`` seconds."""
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=ttl or self.default_ttl)
+
+    def delete(self, key):
+        """Removes ``key`` from the cache if present."""
+        self.client.delete(self.prefix + key)
+
+    def counter(self, key):
+        """Returns the current value of a version counter."""
+        return int(self.client.get(self.prefix + 'counter:' + key) or 0)
+
+    def incr(self, key):
+        """Increments a version counter and returns its new value."""
+        return self.client.incr(self.prefix + 'counter:' + key)
+
+
+class LocalSharedClient:
+    """A dict-backed stand-in for a Redis client.
+
+    It implements the subset of the Redis API used by :class:`SharedBackend`,
+    so the shared code path can run without a Redis server.
+    """
+
+    def __init__(self):
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        expires_at = time.monotonic() + ex if ex else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            return 1 if self._data.pop(key, None) is not None else 0
+
+    def incr(self, key):
+        with self._lock:
+            _, value = self._data.get(key, (None, b'0'))
+            value = int(value) + 1
+            self._data[key] = (None, str(value).encode('ascii'))
+            return value
+
+
+def database_version(tag):
+    """Reads the version of a tracked table from the database.
+
+    Both parts are read from indexes: inserts and updates move the table's
+    latest ``updated_at``, and deletions write a :class:`models.Tombstone`.
+
+    Returns:
+        str: The table's latest ``updated_at`` and latest deletion.
+    """
+    from models import Article, Book, GalleryImage, Tombstone
+
+    model = {'book': Book, 'article': Article, 'gallery_image': GalleryImage}[tag]
+    last_modified, last_deleted = db.session.execute(select(
+        select(func.max(model.updated_at)).scalar_subquery(),
+        select(func.max(Tombstone.deleted_at)).where(Tombstone.table_name == tag).scalar_subquery(),
+    )).one()
+    return '/'.join(value.isoformat() if value else '' for value in (last_modified, last_deleted))
+
+
+class ContentCache:
+    """Caches values tagged with the tables they depend on.
+
+    Args:
+        backend: A :class:`MemoryBackend` or :class:`SharedBackend`.
+        table_version (callable, optional): Returns the current version of a
+            tag from the database, such as :func:`database_version`.
+        check_interval (float): Seconds a worker reuses a ``table_version``
+            before reading it again; 0 reads it on every lookup.
+    """
+
+    def __init__(self, backend, table_version=None, check_interval=5):
+        self.backend = backend
+        self.table_version = table_version
+        self.check_interval = check_interval
+        self._checked = {}
+
+    def version(self, tag):
+        """Returns the current version of a tag."""
+        version = str(self.backend.counter(tag))
+        if self.table_version is None:
+            return version
+        return f'{version}-{self._table_version(tag)}'
+
+    def _table_version(self, tag):
+        now = time.monotonic()
+        checked = self._checked.get(tag)
+        if checked is not None and now - checked[0] < self.check_interval:
+            return checked[1]
+        table_version = self.table_version(tag)
+        self._checked[tag] = (now, table_version)
+        return table_version
+
+    def _versioned_key(self, key, tags):
+        versions = '.'.join(f'{tag}{self.version(tag)}' for tag in tags)
+        return f'{key}@{versions}'
+
+    def get_or_set(self, key, tags, compute, ttl=None):
+        """Returns the cached value for ``key``, computing and storing it on a miss.
+
+        Args:
+            key (str): Identifies the value within the current tag versions.
+            tags (Iterable[str]): The table names the value is built from.
+            compute (callable): Produces the value on a miss. Exceptions
+                propagate and nothing is cached.
+            ttl (int, optional): Overrides the backend's default TTL.
+
+        Returns:
+            The cached or freshly computed value.
+        """
+        versioned = self._versioned_key(key, tags)
+        value = self.backend.get(versioned, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.backend.set(versioned, value, ttl)
+        return value
+
+    def invalidate(self, *tags):
+        """Invalidates every entry built from any of ``tags``."""
+        for tag in tags:
+            self.backend.incr(tag)
+            self._checked.pop(tag, None)
+
+
+def create_backend(config):
+    """Builds the cache backend selected by the application config.
+
+    ``CACHE_BACKEND`` is ``'memory'`` (default), ``'redis'`` (requires the
+    ``redis`` package and ``CACHE_REDIS_URL``) or ``'local'`` for the shared
+    code path backed by :class:`LocalSharedClient`.
+    """
+    kind = config.get('CACHE_BACKEND', 'memory')
+    ttl = config.get('CACHE_DEFAULT_TTL', 300)
+    if kind == 'redis':
+        if redis is None:
+            raise RuntimeError('CACHE_BACKEND=redis requires the redis package')
+        return SharedBackend(redis.Redis.from_url(config['CACHE_REDIS_URL']), default_ttl=ttl)
+    if kind == 'local':
+        return SharedBackend(LocalSharedClient(), default_ttl=ttl)
+    return MemoryBackend(max_entries=config.get('CACHE_MAX_ENTRIES', 1024), default_ttl=ttl)
+
+
+def init_cache(app):
+    """Creates the application's content cache and registers it as an extension.
+
+    With the in-process backend, entries are also checked against
+    :func:`database_version` every ``CACHE_VERSION_CHECK_INTERVAL`` seconds,
+    since other workers' commits do not reach it.
+
+    Returns:
+        ContentCache: The cache instance.
+    """
+    backend = create_backend(app.config)
+    cache = ContentCache(
+        backend,
+        database_version if isinstance(backend, MemoryBackend) else None,
+        check_interval=app.config.get('CACHE_VERSION_CHECK_INTERVAL', 5),
+    )
+    app.extensions['content_cache'] = cache
+    return cache
+
+
+# --- Invalidation on commit ---
+def _pending_tags(session):
+    return session.info.setdefault('content_cache_tags', set())
+
+
+def _tables_of(objects):
+    return {getattr(obj, '__tablename__', None) for obj in objects} & TRACKED_TABLES
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed_tables(session, flush_context):
+    """Remembers which tracked tables the flush wrote to."""
+    _pending_tags(session).update(_tables_of(chain(session.new, session.dirty, session.deleted)))
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_statement_tables(orm_execute_state):
+    """Remembers tracked tables written by INSERT, UPDATE or DELETE statements."""
+    if not (orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    table = getattr(orm_execute_state.statement, 'table', None)
+    if table is not None and table.name in TRACKED_TABLES:
+        _pending_tags(orm_execute_state.session).add(table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_committed_tables(session):
+    """Invalidates cache entries for every tracked table the transaction changed."""
+    tags = session.info.pop('content_cache_tags', None)
+    if not tags or not has_app_context():
+        return
+    cache = current_app.extensions.get('content_cache')
+    if cache is None:
+        return
+    try:
+        cache.invalidate(*sorted(tags))
+    except Exception:
+        logger.exception('Failed to invalidate content cache for %s', sorted(tags))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back_tables(session):
+    """Forgets changes that were rolled back."""
+    session.info.pop('content_cache_tags', None)
@@ -0,0 +1,270 @@
+"""
+Book downloads served with range requests, validators and sendfile.
+
+``/books/<id>/download`` resolves a book's stored ``download`` URL. External
+links are redirected to; uploaded PDFs are sent with
+:func:`flask.send_file`, which answers ``Range`` and ``If-Range`` requests
+with partial content, so PDF viewers can fetch pages on demand and broken
+downloads resume. The body is handed to the WSGI server's
+``wsgi.file_wrapper``, which uses ``sendfile`` where available.
+
+Behind a front-end server the transfer can be delegated entirely:
+``USE_X_SENDFILE`` makes Flask emit ``X-Sendfile`` (Apache, lighttpd) and
+``X_ACCEL_REDIRECT_PREFIX`` emits nginx's ``X-Accel-Redirect`` to an
+internal location mapped onto the uploads folder.
+
+Downloads are counted in memory by :class:`DownloadCounter` and written by
+a background thread every ``DOWNLOAD_FLUSH_INTERVAL`` seconds and when the
+process exits, with one ``download_count + n`` update per book. A busy book
+never makes a download wait on its row, and no write happens per download.
+Counts not yet written are lost if the process is killed.
+"""
+import atexit
+import logging
+import os
+import threading
+import unicodedata
+from collections import Counter
+from urllib.parse import quote
+
+from flask import Response, current_app, redirect, request, send_file
+from sqlalchemy import bindparam, update
+from werkzeug.security import safe_join
+
+from database import db
+from http_cache import make_etag
+from jobs import task
+from storage import UPLOADS_URL, is_immutable_path
+
+logger = logging.getLogger(__name__)
+
+
+def resolve_download(url, upload_folder):
+    """Works out where a stored download URL points.
+
+    Args:
+        url (str | None): The book's ``download`` value.
+        upload_folder (str): Where uploads are stored on disk.
+
+    Returns:
+        tuple: ``('external', url)``, ``('file', path)`` for an upload inside
+        ``upload_folder``, or ``(None, None)`` when there is nothing to send.
+    """
+    url = (url or '').strip().replace('\\', '/')
+    if not url or url == '#':
+        return None, None
+    if url.startswith(('http://', 'https://')):
+        return 'external', url
+    if url.startswith('static/'):
+        url = f'/{url}'
+    if url.startswith(UPLOADS_URL):
+        relative = url[len(UPLOADS_URL):]
+    elif '/' not in url:
+        relative = f'books/{url}'
+    else:
+        return None, None
+    path = safe_join(upload_folder, relative)
+    if path is None or not os.path.isfile(path):
+        return None, None
+    return 'file', path
+
+
+def file_etag(path):
+    """Returns a strong ETag for a downloadable file.
+
+    Content-addressed files are named after their SHA-256, which is used as
+    is; other files are identified by their path, size and modification time.
+    """
+    stat = os.stat(path)
+    filename = os.path.basename(path)
+    if is_immutable_path(f'{UPLOADS_URL}books/{filename}'):
+        return filename.split('.', 1)[0]
+    return make_etag(path, stat.st_size, stat.st_mtime_ns)
+
+
+def is_new_download():
+    """Tells whether the request starts a download rather than continuing one.
+
+    Viewers fetch a PDF in many ranges; only a request starting at the first
+    byte is counted.
+    """
+    if request.method != 'GET':
+        return False
+    ranges = request.range.ranges if request.range else None
+    return not ranges or ranges[0][0] == 0
+
+
+def content_disposition(download_name):
+    """Builds an inline Content-Disposition, with an RFC 5987 name for non-ASCII titles."""
+    fallback = unicodedata.normalize('NFKD', download_name).encode('ascii', 'ignore').decode('ascii')
+    fallback = fallback.replace('"', '').strip() or 'book.pdf'
+    value = f'inline; filename="{fallback}"'
+    if fallback != download_name:
+        value += f"; filename*=UTF-8''{quote(download_name, safe='')}"
+    return value
+
+
+def send_download(path, download_name):
+    """Builds the response sending a file, honouring ranges and validators.
+
+    Args:
+        path (str): The file to send.
+        download_name (str): The file name suggested to the client.
+
+    Returns:
+        Response: The 200, 206, 304 or 416 response.
+    """
+    etag = file_etag(path)
+    prefix = current_app.config.get('X_ACCEL_REDIRECT_PREFIX')
+    if prefix:
+        # nginx serves the body and handles ranges and validators itself
+        relative = os.path.relpath(path, current_app.config['UPLOAD_FOLDER']).replace(os.sep, '/')
+        response = Response(mimetype='application/pdf')
+        response.headers['X-Accel-Redirect'] = prefix.rstrip('/') + '/' + relative
+        response.headers['Content-Disposition'] = content_disposition(download_name)
+        response.set_etag(etag)
+        return response
+    return send_file(
+        os.path.abspath(path),
+        mimetype='application/pdf',
+        download_name=download_name,
+        conditional=True,
+        etag=etag,
+    )
+
+
+def download_response(book):
+    """Serves a book's download and counts it.
+
+    Returns:
+        Response | None: A redirect for external links, the file for
+        uploads, or None when the book has no downloadable file.
+    """
+    kind, target = resolve_download(book.download, current_app.config['UPLOAD_FOLDER'])
+    if kind == 'external':
+        response = redirect(target)
+    elif kind == 'file':
+        name = book.title.replace('/', ' ').replace('\\', ' ').strip() or f'book-{book.id}'
+        response = send_download(target, f'{name}.pdf')
+    else:
+        return None
+    if response.status_code in (200, 206, 302) and is_new_download():
+        current_app.extensions['download_counter'].add(book.id)
+    return response
+
+
+def add_downloads(counts):
+    """Adds to the download counts of books.
+
+    The table is updated without the ORM, so ``updated_at`` is kept and the
+    content cache is not invalidated: counting never makes cached listings
+    or sync clients re-fetch the book.
+
+    Args:
+        counts (dict): Maps book IDs to the downloads to add.
+    """
+    from models import Book
+
+    book = Book.__table__
+    db.session.connection().execute(
+        update(book).where(book.c.id == bindparam('book_id'))
+        .values(download_count=book.c.download_count + bindparam('downloads'), updated_at=book.c.updated_at),
+        [{'book_id': book_id, 'downloads': downloads} for book_id, downloads in counts.items()],
+    )
+    db.session.commit()
+
+
+class DownloadCounter:
+    """Counts downloads in memory and writes them in batches.
+
+    The flushing thread starts with the first download counted by the
+    process.
+
+    Args:
+        app: The Flask application whose database receives the counts.
+        flush_interval (float): Seconds between writes.
+    """
+
+    def __init__(self, app, flush_interval=10.0):
+        self.app = app
+        self.flush_interval = flush_interval
+        self._counts = Counter()
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._exit_registered = False
+
+    def add(self, book_id):
+        """Counts one download of a book."""
+        with self._lock:
+            self._counts[book_id] += 1
+        self.start()
+
+    def pending(self):
+        """Returns the number of downloads waiting to be written."""
+        with self._lock:
+            return sum(self._counts.values())
+
+    def flush(self):
+        """Writes the pending counts; they stay pending if the write fails.
+
+        Returns:
+            int: The number of downloads written.
+        """
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if not counts:
+            return 0
+        try:
+            with self.app.app_context():
+                add_downloads(counts)
+        except Exception:
+            logger.exception('Failed to write %d download counts', len(counts))
+            with self._lock:
+                self._counts.update(counts)
+            return 0
+        return sum(counts.values())
+
+    def start(self):
+        """Starts the flushing thread and the flush at exit."""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='download-counter', daemon=True)
+            self._thread.start()
+            if not self._exit_registered:
+                atexit.register(self.stop)
+                self._exit_registered = True
+
+    def stop(self, timeout=None):
+        """Stops the flushing thread and writes the remaining counts."""
+        self._stopping.set()
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            thread.join(timeout)
+        self._stopping.clear()
+        self.flush()
+
+    def _run(self):
+        while not self._stopping.wait(self.flush_interval):
+            self.flush()
+
+
+def init_download_counter(app):
+    """Creates the application's download counter and registers it as an extension.
+
+    ``DOWNLOAD_FLUSH_INTERVAL`` sets the seconds between writes.
+
+    Returns:
+        DownloadCounter: The counter instance.
+    """
+    counter = DownloadCounter(app, flush_interval=app.config.get('DOWNLOAD_FLUSH_INTERVAL', 10.0))
+    app.extensions['download_counter'] = counter
+    return counter
+
+
+@task('book_download')
+def count_download(book_id):
+    """Adds one download queued as a job by earlier versions."""
+    add_downloads({book_id: 1})
+    return {'book_id': book_id}
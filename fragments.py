@@ -0,0 +1,62 @@
+"""
+Fragment caching for Jinja templates.
+
+Wrapping part of a template in a ``cache`` block stores its rendered HTML in
+the content cache (see ``cache.py``)::
+
+    {% cache 'latest-articles', deps=['article'] %}
+        {% for article in articles[:6] %}...{% endfor %}
+    {% endcache %}
+
+The key is combined with the template name. ``deps`` lists the tables the
+fragment is built from. Their version counters are part of the cache key,
+so a commit to any of them makes the next render rebuild the fragment.
+Without ``deps`` the fragment only expires with its ``ttl``, which defaults
+to the cache's. Anything request-specific, such as the login state, belongs
+outside the block.
+
+Queries passed to a cached fragment should be left unevaluated (e.g. a
+``Query`` sliced inside the block), so a cache hit does not touch the
+database.
+"""
+from flask import current_app, has_app_context
+from jinja2 import nodes
+from jinja2.ext import Extension
+from markupsafe import Markup
+
+from cache import TRACKED_TABLES
+
+
+class FragmentCacheExtension(Extension):
+    """Adds the ``{% cache key, deps=[...], ttl=seconds %}`` block tag."""
+
+    tags = {'cache'}
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        key = parser.parse_expression()
+        options = {'deps': nodes.List([]), 'ttl': nodes.Const(None)}
+        while parser.stream.skip_if('comma'):
+            name = parser.stream.expect('name')
+            if name.value not in options:
+                parser.fail(f'Unknown cache option {name.value!r}', name.lineno)
+            parser.stream.expect('assign')
+            options[name.value] = parser.parse_expression()
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        arguments = [nodes.Const(parser.name), key, options['deps'], options['ttl']]
+        return nodes.CallBlock(self.call_method('_render', arguments), [], [], body).set_lineno(lineno)
+
+    def _render(self, template, key, deps, ttl, caller):
+        """Returns the cached fragment, rendering it with ``caller`` on a miss."""
+        unknown = set(deps) - TRACKED_TABLES
+        if unknown:
+            raise ValueError(f'Fragment {key!r} depends on untracked tables: {", ".join(sorted(unknown))}')
+        cache = current_app.extensions.get('content_cache') if has_app_context() else None
+        if cache is None:
+            return caller()
+        return Markup(cache.get_or_set(f'fragment:{template}:{key}', sorted(set(deps)), lambda: str(caller()), ttl))
+
+
+def init_fragment_cache(app):
+    """Enables the ``cache`` block tag in the application's templates."""
+    app.jinja_env.add_extension(FragmentCacheExtension)
@@ -0,0 +1,107 @@
+"""
+HTTP caching helpers: route-level cache policies and conditional GET.
+
+Responses default to ``no-store`` unless their view declares a policy with
+:func:`cache_policy`. Read-only endpoints derive an ETag from a cheap
+collection version (latest modification stamp plus row count) and answer
+``304 Not Modified`` before running the full query and serialization.
+"""
+import hashlib
+
+from flask import current_app, request
+from sqlalchemy import func
+
+from assets import is_fingerprinted
+from database import db
+from storage import is_immutable_path
+
+NO_STORE = 'no-store, no-cache, must-revalidate, max-age=0'
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+def cache_policy(max_age=0, public=True):
+    """Declares the Cache-Control policy for a view.
+
+    With the default ``max_age`` of 0, clients and shared caches may store
+    the response but must revalidate it with the ETag before each reuse.
+
+    Args:
+        max_age (int): Seconds the response may be reused without revalidating.
+        public (bool): Whether shared caches such as CDNs may store it.
+    """
+    def decorator(f):
+        scope = 'public' if public else 'private'
+        f.cache_control = f'{scope}, max-age={max_age}, must-revalidate'
+        return f
+    return decorator
+
+
+def apply_cache_policy(response):
+    """Sets caching headers on a response according to its view's policy.
+
+    Content-addressed uploads and fingerprinted assets are cached forever, other static files keep
+    the revalidation headers Flask gives them, views decorated with
+    :func:`cache_policy` get their declared policy and everything else is
+    marked ``no-store``.
+    """
+    if request.endpoint == 'static':
+        if response.status_code in (200, 206, 304) and (is_immutable_path(request.path) or is_fingerprinted(request.path)):
+            response.headers['Cache-Control'] = IMMUTABLE
+        return response
+    view = current_app.view_functions.get(request.endpoint)
+    policy = getattr(view, 'cache_control', None)
+    if policy and response.status_code in (200, 206, 304):
+        response.headers['Cache-Control'] = policy
+        return response
+    response.headers['Cache-Control'] = NO_STORE
+    response.headers['Pragma'] = 'no-cache'
+    response.headers['Expires'] = '-1'
+    return response
+
+
+def collection_version(model):
+    """Returns a cheap version stamp for a model's table.
+
+    Args:
+        model: A model with ``id`` and ``updated_at`` columns.
+
+    Returns:
+        tuple: ``(last_modified, row_count)``; ``last_modified`` is None for
+        an empty table.
+    """
+    return db.session.query(func.max(model.updated_at), func.count(model.id)).one()
+
+
+def make_etag(*parts):
+    """Builds a strong ETag value from the given version components."""
+    digest = hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def is_not_modified(etag, last_modified=None):
+    """Checks the request's validators against the current resource state.
+
+    ``If-Modified-Since`` is only honoured when ``last_modified`` is given
+    and the client sent no ``If-None-Match``, as RFC 9110 requires.
+
+    Args:
+        etag (str): The current ETag of the resource.
+        last_modified (datetime, optional): The resource's modification time.
+
+    Returns:
+        bool: True if the client's cached copy is still current.
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    if last_modified is not None and request.if_modified_since is not None:
+        since = request.if_modified_since.replace(tzinfo=None)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+
+def set_validators(response, etag, last_modified=None):
+    """Attaches the ETag and Last-Modified headers to a response."""
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response
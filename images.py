@@ -0,0 +1,231 @@
+"""
+Responsive image derivatives for uploaded pictures.
+
+Every uploaded image gets resized copies at :data:`VARIANT_WIDTHS` in its
+own format and in WebP (and AVIF when Pillow was built with it), written to
+a ``variants`` folder next to the upload together with a JSON manifest.
+Serializers read the manifest to expose ``srcset`` strings, so pages can
+download the smallest copy that fits.
+
+Derivatives are produced by the ``image_variants`` background job (see
+``jobs.py``). Until the manifest exists
+the original is served alone; once it is written, the rows referencing the
+image are touched so cached responses and sync clients pick up the new
+``srcset``.
+
+Usage (derivatives for existing uploads):
+    python images.py
+"""
+import json
+import os
+
+from PIL import Image, ImageOps, features
+
+from jobs import task
+
+VARIANT_WIDTHS = (320, 640, 1280)
+VARIANT_FOLDER = 'variants'
+IMAGE_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
+UPLOADS_URL = '/static/uploads/'
+
+# Modern formats, most efficient first, as (mime type, Pillow format, extension, options)
+_MODERN_FORMATS = [('image/webp', 'WEBP', 'webp', {'quality': 80, 'method': 6})]
+if features.check('avif'):
+    _MODERN_FORMATS.insert(0, ('image/avif', 'AVIF', 'avif', {'quality': 60}))
+
+# Manifests never change once written, so found ones are kept
+_manifests = {}
+
+
+def _variant_paths(path):
+    folder, filename = os.path.split(path)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(folder, VARIANT_FOLDER), stem
+
+
+def manifest_path(path):
+    """Returns the manifest file describing an upload's derivatives."""
+    folder, stem = _variant_paths(path)
+    return os.path.join(folder, f'{stem}.json')
+
+
+def _fallback_format(image_format):
+    """Returns the format resized copies keep: JPEG for photos, PNG otherwise."""
+    if image_format == 'JPEG':
+        return 'image/jpeg', 'JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}
+    return 'image/png', 'PNG', 'png', {'optimize': True}
+
+
+def generate_variants(path, widths=VARIANT_WIDTHS):
+    """Writes the resized and re-encoded copies of an image and their manifest.
+
+    Copies are only made for widths smaller than the original; the modern
+    formats also get a full-size copy. Animated images are left alone.
+
+    Args:
+        path (str): The uploaded image file.
+        widths (Iterable[int]): The target widths in pixels.
+
+    Returns:
+        dict | None: The manifest, or None when no derivatives apply.
+    """
+    folder, stem = _variant_paths(path)
+    os.makedirs(folder, exist_ok=True)
+    with Image.open(path) as source:
+        if getattr(source, 'is_animated', False):
+            return None
+        fallback = _fallback_format(source.format)
+        image = ImageOps.exif_transpose(source)
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+        if fallback[1] == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        manifest = {'width': image.width, 'height': image.height, 'files': {}}
+        targets = sorted(width for width in set(widths) if width < image.width)
+        for width in targets + [image.width]:
+            resized = image
+            if width != image.width:
+                height = max(1, round(image.height * width / image.width))
+                resized = image.resize((width, height), Image.Resampling.LANCZOS)
+            formats = list(_MODERN_FORMATS)
+            if width != image.width:
+                formats.append(fallback)
+            for mime_type, image_format, extension, options in formats:
+                filename = f'{stem}-{width}.{extension}'
+                resized.save(os.path.join(folder, filename), image_format, **options)
+                manifest['files'].setdefault(mime_type, {})[str(width)] = filename
+
+    # The manifest is written last and atomically, so readers never see a partial set
+    target = manifest_path(path)
+    with open(target + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(target + '.tmp', target)
+    return manifest
+
+
+def load_manifest(path):
+    """Returns the derivative manifest of an upload, or None if not generated yet."""
+    manifest = _manifests.get(path)
+    if manifest is None:
+        try:
+            with open(manifest_path(path), encoding='utf-8') as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        _manifests[path] = manifest
+    return manifest
+
+
+def remove_variants(path):
+    """Deletes an upload's derivatives and manifest, if any."""
+    manifest = load_manifest(path)
+    _manifests.pop(path, None)
+    if manifest is None:
+        return
+    folder, _ = _variant_paths(path)
+    for files in manifest['files'].values():
+        for filename in files.values():
+            try:
+                os.remove(os.path.join(folder, filename))
+            except FileNotFoundError:
+                pass
+    os.remove(manifest_path(path))
+
+
+def upload_path(url, upload_folder='static/uploads'):
+    """Maps an uploads URL to its file path, or None for other URLs."""
+    if not url or not url.startswith(UPLOADS_URL):
+        return None
+    return os.path.join(upload_folder, *url[len(UPLOADS_URL):].split('/'))
+
+
+def responsive_sources(url, upload_folder='static/uploads'):
+    """Describes the derivatives of an uploaded image for responsive markup.
+
+    Args:
+        url (str): The image URL as served to clients.
+        upload_folder (str): Where uploads are stored on disk.
+
+    Returns:
+        tuple: ``(srcset, sources)`` where ``srcset`` lists the copies in the
+        original format (including the original itself) and ``sources``
+        holds ``{'type', 'srcset'}`` entries for ``<picture>``, most
+        efficient format first. ``(None, [])`` until derivatives exist.
+    """
+    path = upload_path(url, upload_folder)
+    manifest = load_manifest(path) if path else None
+    if manifest is None:
+        return None, []
+    base = url.rsplit('/', 1)[0] + f'/{VARIANT_FOLDER}/'
+
+    def srcset(files):
+        return ', '.join(f'{base}{name} {width}w' for width, name in sorted(files.items(), key=lambda f: int(f[0])))
+
+    sources = [{'type': mime_type, 'srcset': srcset(manifest['files'][mime_type])}
+               for mime_type, _, _, _ in _MODERN_FORMATS if mime_type in manifest['files']]
+    fallback = [files for mime_type, files in manifest['files'].items()
+                if mime_type not in {source['type'] for source in sources}]
+    entries = [srcset(fallback[0])] if fallback else []
+    entries.append(f'{url} {manifest["width"]}w')
+    return ', '.join(entries), sources
+
+
+def _touch_references(url):
+    """Marks the rows showing an image as updated so their responses refresh."""
+    from datetime import datetime
+
+    from database import db
+    from models import Article, Book, GalleryImage
+
+    filename = url.rsplit('/', 1)[-1]
+    for column in (Book.cover, Article.image, GalleryImage.url):
+        column.class_.query.filter(column.endswith(filename, autoescape=True)).update(
+            {'updated_at': datetime.utcnow()}, synchronize_session=False
+        )
+    db.session.commit()
+
+
+@task('image_variants')
+def process_upload(path, url):
+    """Generates an upload's derivatives and refreshes the rows that use it.
+
+    Runs as a background job inside an application context; errors
+    propagate so the job is retried.
+
+    Args:
+        path (str): The stored image file.
+        url (str): The URL the image is served from.
+
+    Returns:
+        dict: The formats and widths that were written.
+    """
+    manifest = generate_variants(path)
+    if manifest is None:
+        return {'formats': {}}
+    _touch_references(url)
+    return {'formats': {mime_type: sorted(map(int, files)) for mime_type, files in manifest['files'].items()}}
+
+
+def main():
+    """Generates missing derivatives for every existing image upload."""
+    from app import create_app
+
+    app = create_app()
+    upload_folder = app.config['UPLOAD_FOLDER']
+    with app.app_context():
+        for subfolder in ('gallery', 'articles', 'books'):
+            folder = os.path.join(upload_folder, subfolder)
+            if not os.path.isdir(folder):
+                continue
+            for filename in sorted(os.listdir(folder)):
+                path = os.path.join(folder, filename)
+                extension = filename.rsplit('.', 1)[-1].lower()
+                if extension not in IMAGE_EXTENSIONS or os.path.exists(manifest_path(path)):
+                    continue
+                result = process_upload(path, f'{UPLOADS_URL}{subfolder}/{filename}')
+                print(f'{path}: {len(result["formats"])} formats')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,328 @@
+"""
+Persistent background job queue.
+
+Slow work such as image processing is recorded as a :class:`models.Job` row
+and run by worker threads in each application process, so requests return
+immediately and queued work survives restarts. Jobs are claimed with a
+conditional UPDATE, which lets several processes share the table without
+running a job twice. Failed attempts are retried with exponential backoff
+until the job's ``max_attempts`` is reached. Workers also requeue jobs lost
+with a crashed process and delete finished jobs after a retention period.
+
+Tasks are plain functions registered with :func:`task`; they receive the
+job's payload as keyword arguments and run inside an application context.
+Their return value is stored as the job's JSON result.
+"""
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, update
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+TASKS = {}
+
+# Seconds before the first retry; each further retry waits twice as long
+RETRY_BASE_DELAY = 5
+
+# Seconds between a running job's heartbeats, which refresh its updated_at
+HEARTBEAT_INTERVAL = 60
+
+# Running jobs without a heartbeat for this long are assumed lost with their process
+STALE_AFTER = timedelta(minutes=10)
+
+# Seconds between a process's checks for stale and expired jobs
+MAINTENANCE_INTERVAL = 60
+
+
+def task(name, max_attempts=3):
+    """Registers a function as a task that jobs can run.
+
+    Args:
+        name (str): The name jobs refer to the task by.
+        max_attempts (int): The default number of attempts for its jobs.
+    """
+    def decorator(f):
+        f.task_name = name
+        f.max_attempts = max_attempts
+        TASKS[name] = f
+        return f
+    return decorator
+
+
+class JobQueue:
+    """Runs queued jobs on a pool of worker threads.
+
+    Workers start with the first job enqueued by the process, or when
+    :meth:`start` is called.
+
+    Args:
+        app: The Flask application jobs run in.
+        workers (int): The number of worker threads.
+        poll_interval (float): Seconds between checks for due jobs, e.g.
+            retries or jobs enqueued by other processes.
+        eager (bool): Runs every job synchronously inside :meth:`enqueue`,
+            retrying immediately; meant for tests and scripts.
+        retention_days (float): Days succeeded and failed jobs are kept.
+    """
+
+    def __init__(self, app, workers=2, poll_interval=1.0, eager=False, retention_days=7):
+        self.app = app
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.eager = eager
+        self.retention_days = retention_days
+        self._threads = []
+        self._lock = threading.Lock()
+        self._maintenance_lock = threading.Lock()
+        self._maintained_at = None
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+
+    def enqueue(self, name, payload=None, delay=0, max_attempts=None):
+        """Records a job and wakes a worker to run it.
+
+        Must be called inside an application context; the job is committed
+        immediately.
+
+        Args:
+            name (str): The registered task to run.
+            payload (dict, optional): JSON-serializable keyword arguments.
+            delay (float): Seconds to wait before the job may start.
+            max_attempts (int, optional): Overrides the task's default.
+
+        Returns:
+            Job: The queued job (already finished in eager mode).
+
+        Raises:
+            KeyError: If no task is registered under ``name``.
+        """
+        from models import Job
+
+        if name not in TASKS:
+            raise KeyError(f'Unknown task: {name}')
+        job = Job(
+            name=name,
+            payload=json.dumps(payload or {}),
+            max_attempts=max_attempts or TASKS[name].max_attempts,
+            run_after=datetime.utcnow() + timedelta(seconds=delay),
+        )
+        db.session.add(job)
+        db.session.commit()
+        if self.eager:
+            while job.status == 'queued' and self._claim(job.id):
+                self._run(job.id)
+                db.session.refresh(job)
+                if job.status == 'queued':
+                    db.session.execute(update(Job).where(Job.id == job.id).values(run_after=datetime.utcnow()))
+                    db.session.commit()
+        else:
+            self.start()
+            self._wakeup.set()
+        return job
+
+    def start(self):
+        """Starts the worker threads, requeueing jobs lost by a previous run."""
+        with self._lock:
+            if self._threads:
+                return
+            try:
+                with self.app.app_context():
+                    self.maintain(force=True)
+            except Exception:
+                logger.exception('Failed to recover stale jobs')
+            for number in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f'job-worker-{number}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        """Stops the workers after their current job."""
+        self._stopping.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+        self._stopping.clear()
+
+    def recover_stale(self):
+        """Requeues running jobs whose worker sent no heartbeat for :data:`STALE_AFTER`."""
+        from models import Job
+
+        recovered = db.session.execute(
+            update(Job)
+            .where(Job.status == 'running', Job.updated_at < datetime.utcnow() - STALE_AFTER)
+            .values(status='queued', run_after=datetime.utcnow())
+        ).rowcount
+        db.session.commit()
+        if recovered:
+            logger.warning('Requeued %d stale jobs', recovered)
+        return recovered
+
+    def prune(self):
+        """Deletes succeeded and failed jobs finished more than ``retention_days`` ago.
+
+        Returns:
+            int: The number of deleted jobs.
+        """
+        from models import Job
+
+        pruned = db.session.execute(
+            delete(Job)
+            .where(Job.status.in_(('succeeded', 'failed')),
+                   Job.updated_at < datetime.utcnow() - timedelta(days=self.retention_days))
+        ).rowcount
+        db.session.commit()
+        if pruned:
+            logger.info('Deleted %d finished jobs', pruned)
+        return pruned
+
+    def maintain(self, force=False):
+        """Recovers stale jobs and prunes finished ones, at most once a minute.
+
+        Called by the workers between jobs, so jobs lost by another process
+        are requeued without waiting for a restart.
+
+        Args:
+            force (bool): Runs even if the last run was recent.
+
+        Returns:
+            bool: Whether maintenance ran.
+        """
+        with self._maintenance_lock:
+            now = time.monotonic()
+            if not force and self._maintained_at is not None \
+                    and now - self._maintained_at < MAINTENANCE_INTERVAL:
+                return False
+            self._maintained_at = now
+        self.recover_stale()
+        self.prune()
+        return True
+
+    def run_pending(self):
+        """Runs due jobs in the calling thread until none is left.
+
+        Returns:
+            int: The number of attempts made.
+        """
+        attempts = 0
+        while True:
+            job_id = self._claim_next()
+            if job_id is None:
+                return attempts
+            self._run(job_id)
+            attempts += 1
+
+    def _work(self):
+        while not self._stopping.is_set():
+            try:
+                with self.app.app_context():
+                    self.maintain()
+                    job_id = self._claim_next()
+                    if job_id is not None:
+                        self._run(job_id)
+                        continue
+            except Exception:
+                logger.exception('Job worker failed to poll the queue')
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _claim(self, job_id):
+        """Marks a queued job as running; False if another worker got it first."""
+        from models import Job
+
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            update(Job)
+            .where(Job.id == job_id, Job.status == 'queued')
+            .values(status='running', attempts=Job.attempts + 1, started_at=now, updated_at=now)
+        ).rowcount
+        db.session.commit()
+        return claimed == 1
+
+    def _claim_next(self):
+        from models import Job
+
+        due = db.session.query(Job.id).filter(
+            Job.status == 'queued', Job.run_after <= datetime.utcnow()
+        ).order_by(Job.run_after, Job.id).limit(5).all()
+        for (job_id,) in due:
+            if self._claim(job_id):
+                return job_id
+        return None
+
+    def _heartbeat(self, job_id, done):
+        """Refreshes a running job's ``updated_at`` until ``done`` is set."""
+        from models import Job
+
+        while not done.wait(HEARTBEAT_INTERVAL):
+            try:
+                with self.app.app_context():
+                    db.session.execute(
+                        update(Job)
+                        .where(Job.id == job_id, Job.status == 'running')
+                        .values(updated_at=datetime.utcnow())
+                    )
+                    db.session.commit()
+            except Exception:
+                logger.exception('Failed to record a heartbeat for job %d', job_id)
+
+    def _run(self, job_id):
+        """Runs one claimed attempt and records its outcome.
+
+        A heartbeat thread keeps the job from being recovered as stale
+        while the task runs, however long it takes.
+        """
+        from models import Job
+
+        job = db.session.get(Job, job_id)
+        done = threading.Event()
+        threading.Thread(target=self._heartbeat, args=(job_id, done), name=f'job-heartbeat-{job_id}',
+                         daemon=True).start()
+        try:
+            result = TASKS[job.name](**json.loads(job.payload or '{}'))
+        except Exception as e:
+            db.session.rollback()
+            job = db.session.get(Job, job_id)
+            job.error = f'{type(e).__name__}: {e}'
+            if job.attempts < job.max_attempts:
+                job.status = 'queued'
+                job.run_after = datetime.utcnow() + timedelta(seconds=RETRY_BASE_DELAY * 2 ** (job.attempts - 1))
+                logger.warning('Job %d (%s) failed, retrying: %s', job.id, job.name, job.error)
+            else:
+                job.status = 'failed'
+                logger.exception('Job %d (%s) failed', job.id, job.name)
+        else:
+            job = db.session.get(Job, job_id)
+            job.status = 'succeeded'
+            job.error = None
+            job.result = json.dumps(result)
+        finally:
+            done.set()
+        db.session.commit()
+
+
+def init_job_queue(app):
+    """Creates the application's job queue and registers it as an extension.
+
+    ``JOB_QUEUE_WORKERS`` sets the number of worker threads,
+    ``JOB_QUEUE_EAGER`` runs jobs synchronously and ``JOB_RETENTION_DAYS``
+    sets how long finished jobs are kept.
+
+    Returns:
+        JobQueue: The queue instance.
+    """
+    queue = JobQueue(
+        app,
+        workers=app.config.get('JOB_QUEUE_WORKERS', 2),
+        poll_interval=app.config.get('JOB_QUEUE_POLL_INTERVAL', 1.0),
+        eager=app.config.get('JOB_QUEUE_EAGER', False),
+        retention_days=app.config.get('JOB_RETENTION_DAYS', 7),
+    )
+    app.extensions['job_queue'] = queue
+    return queue
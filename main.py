@@ -1,9 +1,17 @@
-from app import app, db  # noqa: F401
+from app import create_app
+from database import db
 import models  # noqa: F401
+from migrations import upgrade_schema
+
+app = create_app()
 
 # Create database tables within app context
 with app.app_context():
     db.create_all()
+    upgrade_schema()
+
+# Resume jobs queued before the last restart, as wsgi.py does
+app.extensions['job_queue'].start()
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, debug=True, threaded=True)
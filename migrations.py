@@ -0,0 +1,192 @@
+"""
+Lightweight schema upgrades for existing databases.
+
+``db.create_all()`` only creates missing tables, so columns added to a model
+after its table exists must be added here. Each upgrade is additive and
+idempotent, making it safe to run on every start-up.
+
+Columns that held JSON as text are converted to the JSON type (JSONB on
+PostgreSQL) by copying their values into a new column, which then replaces
+the old one.
+"""
+import json
+from datetime import datetime
+
+from sqlalchemy import JSON, DateTime, bindparam, inspect, text
+
+from database import db
+
+
+def _added_columns():
+    """Lists the ``(model, column name, backfill SQL)`` upgrades to apply.
+
+    Columns without a SQL backfill are filled by :func:`_backfills`.
+    """
+    from models import Article, Book, GalleryImage
+
+    return [
+        (Book, 'updated_at', 'created_at'),
+        (Article, 'updated_at', 'created_at'),
+        (GalleryImage, 'updated_at', 'created_at'),
+        (Book, 'download_count', '0'),
+        (Book, 'page_count', None),
+        (Book, 'file_size', None),
+        (Book, 'preview', None),
+        (Book, 'normalized_title', None),
+        (Book, 'normalized_body', None),
+        (Article, 'normalized_title', None),
+        (Article, 'normalized_body', None),
+    ]
+
+
+def _required_columns():
+    """Lists the ``(model, column name, backfill SQL)`` columns made NOT NULL later.
+
+    NULLs are replaced by the backfill, which may use the current time as
+    ``:now``. PostgreSQL then enforces the
+    constraint; SQLite cannot add it to an existing column, so its NULLs are
+    filled on every run instead.
+    """
+    from models import Article, Book, GalleryImage
+
+    return [
+        (Book, 'created_at', 'COALESCE(updated_at, :now)'),
+        (Article, 'created_at', 'COALESCE(updated_at, :now)'),
+        (GalleryImage, 'created_at', 'COALESCE(updated_at, :now)'),
+    ]
+
+
+def _indexed_models():
+    """Lists models whose indexes were added after their table existed."""
+    from models import User, UserActivity
+
+    return [UserActivity, User]
+
+
+def _json_columns():
+    """Lists the ``(model, column name)`` pairs that used to be JSON text."""
+    from models import User, UserActivity
+
+    return [
+        (UserActivity, 'activity_data'),
+        (User, 'preferences'),
+    ]
+
+
+# Rows copied at a time when converting a column to JSON
+JSON_CHUNK_SIZE = 1000
+
+
+def _convert_json_column(table, name, inspector):
+    """Converts a text column holding JSON to the model's JSON type.
+
+    Values that are not valid JSON become NULL.
+
+    Returns:
+        bool: False if the column already has a JSON type.
+    """
+    if not inspector.has_table(table.name):
+        return False
+    columns = {column['name']: column for column in inspector.get_columns(table.name)}
+    if name not in columns or isinstance(columns[name]['type'], JSON):
+        return False
+    dialect = db.engine.dialect
+    # "user" is a reserved word on PostgreSQL
+    table_name = dialect.identifier_preparer.format_table(table)
+    column_type = table.columns[name].type.compile(dialect=dialect)
+    value = 'CAST(:value AS JSONB)' if dialect.name == 'postgresql' else ':value'
+    converted = f'{name}_json'
+    if converted not in columns:
+        db.session.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {converted} {column_type}'))
+    last_id = 0
+    while True:
+        rows = db.session.execute(text(
+            f'SELECT id, {name} FROM {table_name} WHERE id > :last_id AND {name} IS NOT NULL '
+            f'ORDER BY id LIMIT :limit'
+        ), {'last_id': last_id, 'limit': JSON_CHUNK_SIZE}).all()
+        if not rows:
+            break
+        last_id = rows[-1][0]
+        updates = []
+        for row_id, raw in rows:
+            try:
+                parsed = json.loads(raw)
+            except (TypeError, ValueError):
+                parsed = None
+            updates.append({'id': row_id, 'value': json.dumps(parsed, ensure_ascii=False)
+                            if parsed is not None else None})
+        db.session.execute(text(f'UPDATE {table_name} SET {converted} = {value} WHERE id = :id'), updates)
+    db.session.execute(text(f'ALTER TABLE {table_name} DROP COLUMN {name}'))
+    db.session.execute(text(f'ALTER TABLE {table_name} RENAME COLUMN {converted} TO {name}'))
+    return True
+
+
+def _backfills():
+    """Maps added ``table.column`` names to the Python backfill filling them."""
+    from search import reindex_documents
+
+    return {
+        'book.normalized_title': reindex_documents,
+        'article.normalized_title': reindex_documents,
+    }
+
+
+def upgrade_schema():
+    """Adds any model columns and indexes missing from existing tables.
+
+    Also makes the columns of :func:`_required_columns` NOT NULL and converts
+    the columns of :func:`_json_columns` from text to JSON.
+    Must be called inside an application context, after ``db.create_all()``.
+
+    Returns:
+        list: The ``table.column`` names that were added or converted.
+    """
+    inspector = inspect(db.engine)
+    dialect = db.engine.dialect
+    added = []
+    for model, name, backfill in _added_columns():
+        table = model.__table__
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column['name'] for column in inspector.get_columns(table.name)}
+        if name in existing:
+            continue
+        table_name = dialect.identifier_preparer.format_table(table)
+        column_type = table.columns[name].type.compile(dialect=dialect)
+        db.session.execute(text(f'ALTER TABLE {table_name} ADD COLUMN {name} {column_type}'))
+        if backfill:
+            db.session.execute(text(f'UPDATE {table_name} SET {name} = {backfill}'))
+        added.append(f'{table.name}.{name}')
+
+    for model, name, backfill in _required_columns():
+        table = model.__table__
+        if not inspector.has_table(table.name):
+            continue
+        columns = {column['name']: column for column in inspector.get_columns(table.name)}
+        if name not in columns or not columns[name]['nullable']:
+            continue
+        table_name = dialect.identifier_preparer.format_table(table)
+        # Bound as a DateTime so SQLite stores it in the format SQLAlchemy compares against
+        now = bindparam('now', datetime.utcnow(), type_=DateTime)
+        db.session.execute(text(f'UPDATE {table_name} SET {name} = {backfill} WHERE {name} IS NULL')
+                           .bindparams(now))
+        if dialect.name == 'postgresql':
+            db.session.execute(text(f'ALTER TABLE {table_name} ALTER COLUMN {name} SET NOT NULL'))
+            added.append(f'{table.name}.{name}')
+
+    for model, name in _json_columns():
+        if _convert_json_column(model.__table__, name, inspector):
+            added.append(f'{model.__table__.name}.{name}')
+
+    backfills = _backfills()
+    for backfill in dict.fromkeys(backfills[name] for name in added if name in backfills):
+        backfill(db.session)
+
+    connection = db.session.connection()
+    tables = {model.__table__ for model, _, _ in _added_columns()}
+    tables |= {model.__table__ for model in _indexed_models()}
+    for table in tables:
+        for index in table.indexes:
+            index.create(connection, checkfirst=True)
+    db.session.commit()
+    return added
@@ -6,15 +6,57 @@ Book, Article, GalleryImage, ContactMessage, UserActivity, and User.
 These models are used by Flask-SQLAlchemy to interact with the database.
 """
 from datetime import datetime
+from flask import current_app, has_app_context
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from database import db
+from arabic import index_text
+from images import responsive_sources
+from pdfs import apply_info
+from storage import track_upload_columns
 import json
-from sqlalchemy import event, DDL, Index
-from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy import and_, event, DDL, Index, inspect, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
+from sqlalchemy.orm import deferred, load_only
 import os
 
 
+# JSONB on PostgreSQL, where it can be indexed and queried; JSON text elsewhere.
+# Python None is stored as SQL NULL rather than a JSON 'null'.
+JSONType = db.JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql')
+
+
+def json_contains(column, values):
+    """Builds a filter matching rows whose JSON object contains ``values``.
+
+    On PostgreSQL this is ``column @> values``, which uses the column's GIN
+    index. Elsewhere each key is compared with a typed JSON path lookup.
+    Must be called inside an application context.
+
+    Args:
+        column: A :data:`JSONType` column.
+        values (dict): Top-level keys and the strings, numbers or booleans
+            they must hold.
+
+    Returns:
+        The SQL expression.
+    """
+    if db.engine.dialect.name == 'postgresql':
+        return type_coerce(column, JSONB).contains(values)
+    clauses = []
+    for key, value in values.items():
+        element = column[key]
+        if isinstance(value, bool):
+            clauses.append(element.as_boolean() == value)
+        elif isinstance(value, int):
+            clauses.append(element.as_integer() == value)
+        elif isinstance(value, float):
+            clauses.append(element.as_float() == value)
+        else:
+            clauses.append(element.as_string() == value)
+    return and_(*clauses)
+
+
 def _normalize_media_url(path, subfolder, default_url):
     """Normalize stored media paths to usable URLs.
 
@@ -55,6 +97,38 @@ def _normalize_media_url(path, subfolder, default_url):
     return f'/static/uploads/{subfolder}/{filename}'
 
 
+def _upload_folder():
+    return current_app.config.get('UPLOAD_FOLDER', 'static/uploads') if has_app_context() else 'static/uploads'
+
+
+def _responsive(url):
+    """Returns the ``(srcset, sources)`` of an uploaded image URL (see images.py)."""
+    return responsive_sources(url, _upload_folder())
+
+
+def _isoformat(value):
+    """Formats an optional datetime as ISO 8601."""
+    return value.isoformat() if value else None
+
+
+def _serialize(values, fields=None):
+    """Evaluates the entries of a lazy serialization mapping.
+
+    Only the requested entries are evaluated, so columns that were not
+    loaded for a sparse fieldset are never touched.
+
+    Args:
+        values (dict): Maps each key to a callable producing its value.
+        fields (Iterable[str], optional): The keys to include; all when None.
+
+    Returns:
+        dict: The serialized values.
+    """
+    if fields is None:
+        return {key: get() for key, get in values.items()}
+    return {key: values[key]() for key in fields if key in values}
+
+
 class Book(db.Model):
     """Represents a book or publication in the database."""
     id = db.Column(db.Integer, primary_key=True)
@@ -64,42 +138,77 @@ class Book(db.Model):
     cover = db.Column(db.String(500), nullable=False)
     download = db.Column(db.String(500), nullable=False)
     description = db.Column(db.Text, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Counted in batches by the download counter (see downloads.py)
+    download_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Read from the PDF by the pdf_metadata job (see pdfs.py)
+    page_count = db.Column(db.Integer, nullable=True)
+    file_size = db.Column(db.BigInteger, nullable=True)
+    preview = db.Column(db.String(500), nullable=True)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Normalized, stemmed copies of the searchable text (see arabic.py);
+    # deferred so regular loads never transfer the duplicated body
+    normalized_title = deferred(db.Column(db.Text, nullable=True))
+    normalized_body = deferred(db.Column(db.Text, nullable=True))
+
+    # Walked newest first by keyset pagination (see pagination.py)
+    __table_args__ = (
+        Index('ix_book_created_at_id', 'created_at', 'id'),
+    )
 
     if 'postgresql' in os.environ.get('DATABASE_URL', ''):
         __ts_vector__ = db.Column(TSVECTOR, nullable=True)
-        __table_args__ = (
+        __table_args__ += (
             Index('ix_book_ts_vector', __ts_vector__, postgresql_using='gin'),
         )
 
-    def to_dict(self):
+    API_FIELDS = ('id', 'title', 'language', 'category', 'cover', 'srcset', 'sources',
+                  'download', 'download_url', 'downloads', 'pages', 'file_size', 'preview',
+                  'description', 'created_at', 'updated_at')
+    # Serialized fields computed from a column with another name
+    FIELD_COLUMNS = {'srcset': 'cover', 'sources': 'cover', 'download_url': 'download', 'downloads': 'download_count',
+                     'pages': 'page_count'}
+    SEARCH_BODY_FIELDS = ('description',)
+
+    def to_dict(self, fields=None):
         """
         Serializes the Book object to a dictionary, ensuring the cover image
         URL is always valid and points to the correct uploads directory.
+
+        Args:
+            fields (Iterable[str], optional): Restricts the output to these keys.
         """
-        cover_url = _normalize_media_url(
+        cover = lambda: _normalize_media_url(
             self.cover,
             'books',
             '/static/img/default/default-cover.jpg'
         )
-
-        return {
-            'id': self.id,
-            'title': self.title,
-            'language': self.language,
-            'category': self.category,
-            'cover': cover_url,
-            'download': self.download,
-            'description': self.description,
-            'created_at': self.created_at.isoformat()
-        }
+        return _serialize({
+            'id': lambda: self.id,
+            'title': lambda: self.title,
+            'language': lambda: self.language,
+            'category': lambda: self.category,
+            'cover': cover,
+            'srcset': lambda: _responsive(cover())[0],
+            'sources': lambda: _responsive(cover())[1],
+            'download': lambda: self.download,
+            'download_url': lambda: f'/books/{self.id}/download' if self.download and self.download != '#' else None,
+            'downloads': lambda: self.download_count or 0,
+            'pages': lambda: self.page_count,
+            'file_size': lambda: self.file_size,
+            'preview': lambda: self.preview,
+            'description': lambda: self.description,
+            'created_at': lambda: self.created_at.isoformat(),
+            'updated_at': lambda: _isoformat(self.updated_at)
+        }, fields)
 
 if 'postgresql' in os.environ.get('DATABASE_URL', ''):
     book_trigger_sql = DDL("""
         CREATE OR REPLACE FUNCTION book_ts_vector_trigger() RETURNS trigger AS $$
         begin
             new.__ts_vector__ :=
-                to_tsvector('arabic', new.title || ' ' || new.description);
+                to_tsvector('simple', coalesce(new.normalized_title, '') || ' ' ||
+                                      coalesce(new.normalized_body, ''));
             return new;
         end
         $$ LANGUAGE plpgsql;
@@ -119,41 +228,78 @@ class Article(db.Model):
     content = db.Column(db.Text, nullable=False)
     category = db.Column(db.String(50), nullable=True)
     image = db.Column(db.String(500), nullable=True)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    # Normalized, stemmed copies of the searchable text (see arabic.py);
+    # deferred so regular loads never transfer the duplicated body
+    normalized_title = deferred(db.Column(db.Text, nullable=True))
+    normalized_body = deferred(db.Column(db.Text, nullable=True))
+
+    # Walked newest first by keyset pagination (see pagination.py)
+    __table_args__ = (
+        Index('ix_article_created_at_id', 'created_at', 'id'),
+    )
 
     if 'postgresql' in os.environ.get('DATABASE_URL', ''):
         __ts_vector__ = db.Column(TSVECTOR, nullable=True)
-        __table_args__ = (
+        __table_args__ += (
             Index('ix_article_ts_vector', __ts_vector__, postgresql_using='gin'),
         )
 
-    def to_dict(self):
+    API_FIELDS = ('id', 'title', 'summary', 'content', 'category', 'image', 'srcset',
+                  'sources', 'created_at', 'updated_at')
+    SUMMARY_FIELDS = ('id', 'title', 'summary', 'category', 'image', 'srcset', 'sources',
+                      'created_at', 'updated_at')
+    FIELD_COLUMNS = {'srcset': 'image', 'sources': 'image'}
+    SEARCH_BODY_FIELDS = ('summary', 'content')
+
+    @classmethod
+    def summary_query(cls):
+        """Returns a query that loads only the columns used by list views.
+
+        The ``content`` body stays deferred, so article cards and list APIs
+        never transfer it from the database.
+        """
+        columns = {cls.FIELD_COLUMNS.get(name, name) for name in cls.SUMMARY_FIELDS}
+        return cls.query.options(load_only(*(getattr(cls, name) for name in sorted(columns))))
+
+    def to_dict(self, fields=None):
         """
         Serializes the Article object to a dictionary, ensuring the image
         URL is always valid and points to the correct uploads directory.
+
+        Args:
+            fields (Iterable[str], optional): Restricts the output to these keys.
         """
-        image_url = _normalize_media_url(
+        image = lambda: _normalize_media_url(
             self.image,
             'articles',
             '/static/img/default/article-default.jpg'
         )
-
-        return {
-            'id': self.id,
-            'title': self.title,
-            'summary': self.summary,
-            'content': self.content,
-            'category': self.category if self.category else 'عام',
-            'image': image_url,
-            'created_at': self.created_at.strftime('%Y-%m-%d')
-        }
+        return _serialize({
+            'id': lambda: self.id,
+            'title': lambda: self.title,
+            'summary': lambda: self.summary,
+            'content': lambda: self.content,
+            'category': lambda: self.category if self.category else 'عام',
+            'image': image,
+            'srcset': lambda: _responsive(image())[0],
+            'sources': lambda: _responsive(image())[1],
+            'created_at': lambda: self.created_at.strftime('%Y-%m-%d'),
+            'updated_at': lambda: _isoformat(self.updated_at)
+        }, fields)
+
+    def to_summary_dict(self):
+        """Serializes the Article without its ``content`` body for list views."""
+        return self.to_dict(self.SUMMARY_FIELDS)
 
 if 'postgresql' in os.environ.get('DATABASE_URL', ''):
     article_trigger_sql = DDL("""
         CREATE OR REPLACE FUNCTION article_ts_vector_trigger() RETURNS trigger AS $$
         begin
             new.__ts_vector__ :=
-                to_tsvector('arabic', new.title || ' ' || new.summary || ' ' || new.content);
+                to_tsvector('simple', coalesce(new.normalized_title, '') || ' ' ||
+                                      coalesce(new.normalized_body, ''));
             return new;
         end
         $$ LANGUAGE plpgsql;
@@ -165,6 +311,42 @@ if 'postgresql' in os.environ.get('DATABASE_URL', ''):
     event.listen(Article.__table__, 'after_create', article_trigger_sql)
 
 
+def update_search_text(target):
+    """Recomputes the normalized search columns of a Book or Article."""
+    target.normalized_title = index_text(target.title)
+    target.normalized_body = index_text(*(getattr(target, name) for name in target.SEARCH_BODY_FIELDS))
+
+
+def _normalize_on_insert(mapper, connection, target):
+    update_search_text(target)
+
+
+def _normalize_on_update(mapper, connection, target):
+    """Normalizes again only when a searchable column changed."""
+    attrs = inspect(target).attrs
+    if any(attrs[name].history.has_changes() for name in ('title',) + target.SEARCH_BODY_FIELDS):
+        update_search_text(target)
+
+
+for _searchable_model in (Book, Article):
+    event.listen(_searchable_model, 'before_insert', _normalize_on_insert)
+    event.listen(_searchable_model, 'before_update', _normalize_on_update)
+
+
+def _apply_pdf_info_on_insert(mapper, connection, target):
+    apply_info(target, _upload_folder())
+
+
+def _apply_pdf_info_on_update(mapper, connection, target):
+    """Takes the new PDF's details, already extracted or not, when the PDF changed."""
+    if inspect(target).attrs.download.history.has_changes():
+        apply_info(target, _upload_folder())
+
+
+event.listen(Book, 'before_insert', _apply_pdf_info_on_insert)
+event.listen(Book, 'before_update', _apply_pdf_info_on_update)
+
+
 class GalleryImage(db.Model):
     """Represents an image in the gallery.
 
@@ -173,28 +355,79 @@ class GalleryImage(db.Model):
         url (str): The URL of the image file.
         caption (str): A caption or description for the image.
         created_at (datetime): The timestamp when the image was added.
+        updated_at (datetime): The timestamp of the last modification.
     """
     id = db.Column(db.Integer, primary_key=True)
     url = db.Column(db.String(500), nullable=False)
     caption = db.Column(db.String(255), nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
-    def to_dict(self):
+    # Walked newest first by keyset pagination (see pagination.py)
+    __table_args__ = (
+        Index('ix_gallery_image_created_at_id', 'created_at', 'id'),
+    )
+
+    API_FIELDS = ('id', 'url', 'srcset', 'sources', 'caption', 'updated_at')
+    FIELD_COLUMNS = {'srcset': 'url', 'sources': 'url'}
+
+    def to_dict(self, fields=None):
         """
         Serializes the GalleryImage object to a dictionary, ensuring the image
         URL is always valid and points to the correct uploads directory.
+
+        Args:
+            fields (Iterable[str], optional): Restricts the output to these keys.
         """
-        image_url = _normalize_media_url(
+        url = lambda: _normalize_media_url(
             self.url,
             'gallery',
             '/static/img/default/default-cover.jpg'
         )
+        return _serialize({
+            'id': lambda: self.id,
+            'url': url,
+            'srcset': lambda: _responsive(url())[0],
+            'sources': lambda: _responsive(url())[1],
+            'caption': lambda: self.caption,
+            'updated_at': lambda: _isoformat(self.updated_at)
+        }, fields)
 
-        return {
-            'id': self.id,
-            'url': image_url,
-            'caption': self.caption
-        }
+
+class Tombstone(db.Model):
+    """Records the deletion of a synced content row.
+
+    Rows are written automatically when a Book, Article or GalleryImage is
+    deleted, so incremental sync clients can learn about removals.
+
+    Attributes:
+        id (int): The primary key for the tombstone.
+        table_name (str): The table the deleted row belonged to.
+        record_id (int): The primary key of the deleted row.
+        deleted_at (datetime): The timestamp of the deletion.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    table_name = db.Column(db.String(50), nullable=False)
+    record_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index('ix_tombstone_table_deleted_at', 'table_name', 'deleted_at'),
+    )
+
+
+def _record_tombstone(mapper, connection, target):
+    """Writes a tombstone in the same transaction as the deletion."""
+    connection.execute(Tombstone.__table__.insert().values(
+        table_name=target.__tablename__,
+        record_id=target.id,
+        deleted_at=datetime.utcnow(),
+    ))
+
+
+for _synced_model in (Book, Article, GalleryImage):
+    event.listen(_synced_model, 'after_delete', _record_tombstone)
+    track_upload_columns(_synced_model)
 
 
 class ContactMessage(db.Model):
@@ -238,7 +471,7 @@ class UserActivity(db.Model):
         content_id (int): The ID of the content related to the activity.
         content_type (str): The type of content (e.g., 'book', 'article').
         content_title (str): The title of the related content.
-        activity_data (str): Optional JSON metadata for the activity.
+        activity_data (dict): Optional metadata for the activity.
         created_at (datetime): The timestamp when the activity occurred.
         user (User): The relationship to the User model.
     """
@@ -248,11 +481,22 @@ class UserActivity(db.Model):
     content_id = db.Column(db.Integer, nullable=True)
     content_type = db.Column(db.String(50), nullable=True)
     content_title = db.Column(db.String(255), nullable=True)
-    activity_data = db.Column(db.Text, nullable=True)
+    activity_data = db.Column(JSONType, nullable=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     user = db.relationship('User', backref=db.backref('activities', lazy=True))
 
+    # On PostgreSQL the table may be partitioned by month (see retention.py)
+    __table_args__ = (
+        Index('ix_user_activity_user_created_at', 'user_id', 'created_at'),
+        Index('ix_user_activity_content', 'content_type', 'content_id'),
+    )
+    if 'postgresql' in os.environ.get('DATABASE_URL', ''):
+        __table_args__ += (
+            Index('ix_user_activity_data', 'activity_data', postgresql_using='gin',
+                  postgresql_ops={'activity_data': 'jsonb_path_ops'}),
+        )
+
     def to_dict(self):
         """Serializes the UserActivity object to a dictionary.
 
@@ -270,14 +514,154 @@ class UserActivity(db.Model):
         }
 
         if self.activity_data:
-            try:
-                result['activity_data'] = json.loads(self.activity_data)
-            except json.JSONDecodeError:
-                result['activity_data'] = None
+            result['activity_data'] = self.activity_data
 
         return result
 
 
+class ActivityRollup(db.Model):
+    """Base for the activity counts of one user per time bucket.
+
+    Rows are keyed by user, bucket, content type and activity type, and are
+    kept up to date by the activity buffer (see ``rollups.py``). Activities
+    without a content type are counted under ``''``.
+
+    Attributes:
+        id (int): The primary key for the count.
+        user_id (int): The user who performed the activities.
+        bucket (datetime): The start of the hour or day counted.
+        content_type (str): The type of content involved, or ''.
+        activity_type (str): The type of activity counted.
+        count (int): How many activities the bucket holds.
+    """
+    __abstract__ = True
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    bucket = db.Column(db.DateTime, nullable=False)
+    content_type = db.Column(db.String(50), nullable=False, default='')
+    activity_type = db.Column(db.String(50), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class HourlyActivityRollup(ActivityRollup):
+    """Activity counts per user and hour."""
+    __tablename__ = 'activity_rollup_hourly'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'bucket', 'content_type', 'activity_type',
+                            name='uq_activity_rollup_hourly_key'),
+        Index('ix_activity_rollup_hourly_bucket', 'bucket'),
+    )
+
+
+class DailyActivityRollup(ActivityRollup):
+    """Activity counts per user and day."""
+    __tablename__ = 'activity_rollup_daily'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'bucket', 'content_type', 'activity_type',
+                            name='uq_activity_rollup_daily_key'),
+        Index('ix_activity_rollup_daily_bucket', 'bucket'),
+    )
+
+
+class TotalActivityRollup(db.Model):
+    """A user's all-time count of one activity type.
+
+    Kept up to date by the activity buffer with the other rollups, so a
+    user's statistics are read from one row per activity type however long
+    their history is.
+
+    Attributes:
+        id (int): The primary key for the count.
+        user_id (int): The user who performed the activities.
+        activity_type (str): The type of activity counted.
+        count (int): How many activities of the type the user had.
+    """
+    __tablename__ = 'activity_rollup_total'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    activity_type = db.Column(db.String(50), nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'activity_type', name='uq_activity_rollup_total_key'),
+    )
+
+
+class ActiveDaysRollup(db.Model):
+    """The number of days on which a user had any activity.
+
+    Incremented when the daily rollup gets the first row of a user's day.
+
+    Attributes:
+        id (int): The primary key for the count.
+        user_id (int): The user counted.
+        active_days (int): The number of days with activity.
+    """
+    __tablename__ = 'activity_rollup_active_days'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False, unique=True)
+    active_days = db.Column(db.Integer, nullable=False, default=0)
+
+
+class ContentActivityRollup(db.Model):
+    """Counts a user's activities on one content item.
+
+    Kept up to date by the activity buffer like the time-bucketed rollups.
+    It is the user-item matrix the recommender is built from, and each
+    user's reading history when recommendations are served.
+
+    Attributes:
+        id (int): The primary key for the count.
+        user_id (int): The user who performed the activities.
+        content_type (str): The type of content, e.g. 'book' or 'article'.
+        content_id (int): The ID of the content.
+        count (int): How many activities the user had on the content.
+        last_at (datetime): When the latest of them happened.
+    """
+    __tablename__ = 'activity_rollup_content'
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id', ondelete='CASCADE'), nullable=False)
+    content_type = db.Column(db.String(50), nullable=False)
+    content_id = db.Column(db.Integer, nullable=False)
+    count = db.Column(db.Integer, nullable=False, default=0)
+    last_at = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'content_type', 'content_id', name='uq_activity_rollup_content_key'),
+        Index('ix_activity_rollup_content_user_last_at', 'user_id', 'last_at'),
+    )
+
+
+class ItemNeighbor(db.Model):
+    """A content item similar to another one, precomputed by the recommender.
+
+    Attributes:
+        id (int): The primary key for the pair.
+        item_type (str): The type of the item, 'book' or 'article'.
+        item_id (int): The ID of the item.
+        neighbor_type (str): The type of the similar item.
+        neighbor_id (int): The ID of the similar item.
+        score (float): The similarity of the two items.
+        reason (str): 'co_view' when readers of one read the other,
+            otherwise 'category'.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    item_type = db.Column(db.String(20), nullable=False)
+    item_id = db.Column(db.Integer, nullable=False)
+    neighbor_type = db.Column(db.String(20), nullable=False)
+    neighbor_id = db.Column(db.Integer, nullable=False)
+    score = db.Column(db.Float, nullable=False)
+    reason = db.Column(db.String(20), nullable=False)
+
+    __table_args__ = (
+        Index('ix_item_neighbor_item', 'item_type', 'item_id'),
+    )
+
+
 class User(UserMixin, db.Model):
     """Represents a user of the application.
 
@@ -292,7 +676,7 @@ class User(UserMixin, db.Model):
         created_at (datetime): The timestamp when the user account was created.
         last_login (datetime): The timestamp of the user's last login.
         active (bool): Whether the user's account is active.
-        preferences (str): A JSON string for storing user preferences.
+        preferences (dict): The user's preferences.
     """
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), unique=True, nullable=False)
@@ -302,7 +686,13 @@ class User(UserMixin, db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     last_login = db.Column(db.DateTime, nullable=True)
     active = db.Column(db.Boolean, default=True)
-    preferences = db.Column(db.Text, nullable=True)
+    preferences = db.Column(JSONType, nullable=True)
+
+    if 'postgresql' in os.environ.get('DATABASE_URL', ''):
+        __table_args__ = (
+            Index('ix_user_preferences', 'preferences', postgresql_using='gin',
+                  postgresql_ops={'preferences': 'jsonb_path_ops'}),
+        )
 
     def set_password(self, password):
         """Hashes and sets the user's password.
@@ -343,23 +733,20 @@ class User(UserMixin, db.Model):
         """Retrieves user preferences as a dictionary.
 
         Returns:
-            dict: The user's preferences, or an empty dictionary if none are set
-                  or if there is a JSON decoding error.
+            dict: The user's preferences, or an empty dictionary if none are set.
         """
-        if not self.preferences:
-            return {}
-        try:
-            return json.loads(self.preferences)
-        except json.JSONDecodeError:
-            return {}
+        return dict(self.preferences or {})
 
     def set_preferences(self, preferences_dict):
-        """Saves a dictionary of user preferences as a JSON string.
+        """Saves a dictionary of user preferences.
+
+        The dictionary is copied, since changes made to it in place would not
+        be detected and saved.
 
         Args:
             preferences_dict (dict): The dictionary of preferences to save.
         """
-        self.preferences = json.dumps(preferences_dict)
+        self.preferences = dict(preferences_dict)
 
     def record_activity(self, activity_type, content_id=None, content_type=None,
                         content_title=None, metadata=None):
@@ -370,7 +757,7 @@ class User(UserMixin, db.Model):
             content_id (int, optional): The ID of related content.
             content_type (str, optional): The type of related content.
             content_title (str, optional): The title of related content.
-            metadata (dict, optional): Extra data to store as a JSON string.
+            metadata (dict, optional): Extra data to store with the activity.
 
         Returns:
             UserActivity: The newly created UserActivity object.
@@ -381,7 +768,7 @@ class User(UserMixin, db.Model):
             content_id=content_id,
             content_type=content_type,
             content_title=content_title,
-            activity_data=json.dumps(metadata) if metadata else None
+            activity_data=metadata or None
         )
         db.session.add(activity)
         return activity
@@ -406,9 +793,104 @@ class User(UserMixin, db.Model):
 
         # Include preferences if available
         if self.preferences:
+            result['preferences'] = self.preferences
+
+        return result
+
+class Job(db.Model):
+    """Represents a unit of background work run by the job queue (see jobs.py).
+
+    Attributes:
+        id (int): The primary key for the job.
+        name (str): The registered task that runs the job.
+        payload (str): JSON keyword arguments for the task.
+        status (str): 'queued', 'running', 'succeeded' or 'failed'.
+        attempts (int): How many times the job has been started.
+        max_attempts (int): How many attempts are made before giving up.
+        run_after (datetime): The earliest time the job may (re)start.
+        started_at (datetime): When the current or last attempt started.
+        result (str): The task's JSON result once it succeeded.
+        error (str): The error of the last failed attempt.
+        created_at (datetime): The timestamp when the job was enqueued.
+        updated_at (datetime): The timestamp of the last status change, or of
+            the last heartbeat while the job runs.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    result = db.Column(db.Text, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index('ix_job_status_run_after', 'status', 'run_after'),
+    )
+
+    def to_dict(self):
+        """Serializes the Job object to a dictionary.
+
+        Returns:
+            dict: A dictionary representation of the job.
+        """
+        result = {
+            'id': self.id,
+            'name': self.name,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'error': self.error,
+            'created_at': _isoformat(self.created_at),
+            'updated_at': _isoformat(self.updated_at)
+        }
+        for key in ('payload', 'result'):
+            value = getattr(self, key)
             try:
-                result['preferences'] = json.loads(self.preferences)
+                result[key] = json.loads(value) if value else None
             except json.JSONDecodeError:
-                result['preferences'] = {}
+                result[key] = None
+        return result
 
-        return result
\ No newline at end of file
+
+class UploadSession(db.Model):
+    """Tracks a resumable, chunked file upload in progress.
+
+    The received bytes are written to a partial file named after the
+    session id until the upload is completed or abandoned.
+
+    Attributes:
+        id (str): The random session identifier.
+        user_id (int): The foreign key of the user uploading the file.
+        filename (str): The client's original file name.
+        size (int): The declared total size in bytes.
+        received (int): The number of bytes stored so far.
+        created_at (datetime): The timestamp when the upload started.
+        updated_at (datetime): The timestamp of the last stored chunk.
+    """
+    id = db.Column(db.String(32), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    size = db.Column(db.BigInteger, nullable=False)
+    received = db.Column(db.BigInteger, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    def to_dict(self):
+        """Serializes the UploadSession object to a dictionary.
+
+        Returns:
+            dict: A dictionary representation of the upload's progress.
+        """
+        return {
+            'id': self.id,
+            'filename': self.filename,
+            'size': self.size,
+            'offset': self.received,
+            'created_at': _isoformat(self.created_at),
+            'updated_at': _isoformat(self.updated_at)
+        }
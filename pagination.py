@@ -0,0 +1,186 @@
+"""
+Keyset (cursor) pagination helpers for the JSON list endpoints.
+
+Collections are ordered newest first on ``(created_at, id)`` and a page is
+selected with a ``WHERE`` clause on that pair instead of ``OFFSET``, so the
+database can walk the index from the cursor and every page costs the same
+regardless of how deep the client has scrolled.
+"""
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import load_only
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class PaginationError(ValueError):
+    """Raised when a client supplies an invalid ``limit`` or ``cursor``."""
+
+
+def encode_cursor(created_at, item_id):
+    """Encodes the sort key of the last row on a page into an opaque token.
+
+    Args:
+        created_at (datetime): The creation timestamp of the row.
+        item_id (int): The primary key of the row.
+
+    Returns:
+        str: A URL-safe cursor token.
+    """
+    raw = f'{created_at.isoformat()}|{item_id}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(token):
+    """Decodes a cursor token produced by :func:`encode_cursor`.
+
+    Args:
+        token (str): The cursor token sent by the client.
+
+    Returns:
+        tuple: A ``(created_at, id)`` pair.
+
+    Raises:
+        PaginationError: If the token is malformed.
+    """
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8')
+        created_at, item_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(item_id)
+    except (binascii.Error, UnicodeError, ValueError):
+        raise PaginationError('Invalid cursor')
+
+
+def parse_limit(value):
+    """Parses the ``limit`` query parameter, clamping it to the page bounds.
+
+    Args:
+        value (str | None): The raw query parameter.
+
+    Returns:
+        int | None: The page size, or None when no limit was requested.
+
+    Raises:
+        PaginationError: If the value is not a positive integer.
+    """
+    if value is None or value == '':
+        return None
+    try:
+        limit = int(value)
+    except ValueError:
+        raise PaginationError('Invalid limit')
+    if limit < 1:
+        raise PaginationError('Invalid limit')
+    return min(limit, MAX_PAGE_SIZE)
+
+
+def parse_fields(value, allowed):
+    """Parses a sparse fieldset such as ``fields=id,title,cover``.
+
+    Args:
+        value (str | None): The raw query parameter.
+        allowed (Iterable[str]): The keys the resource's dictionary exposes.
+
+    Returns:
+        list | None: The requested keys in order, or None for all fields.
+
+    Raises:
+        PaginationError: If an unknown field is requested.
+    """
+    if not value:
+        return None
+    fields = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = [name for name in fields if name not in allowed]
+    if unknown:
+        raise PaginationError(f'Unknown fields: {", ".join(unknown)}')
+    if 'id' not in fields:
+        fields.insert(0, 'id')
+    return fields
+
+
+def parse_json_filter(value):
+    """Parses a JSON object filter such as ``data={"page":2}``.
+
+    Args:
+        value (str | None): The raw query parameter.
+
+    Returns:
+        dict | None: The keys and values to match, or None for no filter.
+
+    Raises:
+        PaginationError: If the value is not a JSON object of strings,
+            numbers and booleans.
+    """
+    if not value:
+        return None
+    try:
+        values = json.loads(value)
+    except ValueError:
+        raise PaginationError('Invalid JSON filter')
+    if not isinstance(values, dict) or not values \
+            or not all(isinstance(item, (str, int, float, bool)) for item in values.values()):
+        raise PaginationError('A JSON filter must be an object of strings, numbers and booleans')
+    return values
+
+
+def load_columns(model, fields):
+    """Builds a loader option that only fetches the columns backing ``fields``.
+
+    Args:
+        model: The SQLAlchemy model being queried.
+        fields (list | None): The requested sparse fieldset.
+
+    Returns:
+        The ``load_only`` option, or None when every column is needed.
+    """
+    if fields is None:
+        return None
+    derived = getattr(model, 'FIELD_COLUMNS', {})
+    columns = {'id', 'created_at'} | {derived.get(name, name) for name in fields}
+    attributes = [getattr(model, name) for name in sorted(columns)
+                  if name in model.__table__.columns]
+    return load_only(*attributes)
+
+
+def paginate(query, model, limit=None, cursor=None):
+    """Applies newest-first keyset pagination to a query.
+
+    Args:
+        query: The SQLAlchemy query to paginate.
+        model: The model exposing ``created_at`` and ``id`` columns.
+        limit (int, optional): The page size. When None, all rows are
+            returned unless a cursor is given, in which case
+            ``DEFAULT_PAGE_SIZE`` applies.
+        cursor (str, optional): The token returned with the previous page.
+
+    Returns:
+        tuple: ``(items, next_cursor)`` where ``next_cursor`` is None on the
+        last page.
+
+    Raises:
+        PaginationError: If the cursor is malformed.
+    """
+    query = query.order_by(model.created_at.desc(), model.id.desc())
+    if cursor:
+        created_at, item_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < item_id),
+        ))
+    if limit is None:
+        if not cursor:
+            return query.all(), None
+        limit = DEFAULT_PAGE_SIZE
+
+    rows = query.limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor(last.created_at, last.id)
@@ -0,0 +1,211 @@
+"""
+Page counts, file sizes and first-page previews for uploaded book PDFs.
+
+Each uploaded PDF is read once by the ``pdf_metadata`` background job. The
+job records its page count and size, renders the first page as a JPEG
+preview stored like any other upload, and writes the results to an info
+file next to the PDF. Books store the same values in their ``page_count``,
+``file_size`` and ``preview`` columns, copied from the info file when a
+book is saved, or by the job when it finishes after the book was saved, so
+catalogue pages never open the PDF.
+
+Previews need PyMuPDF, a dependency of the project; if it is not
+installed, a warning is logged and only the page count (read from the
+PDF's page tree) and the size are recorded.
+
+Usage (metadata for existing uploads):
+    python pdfs.py
+"""
+import io
+import json
+import logging
+import mmap
+import os
+import re
+import zlib
+
+from PIL import Image
+
+from jobs import task
+
+try:
+    import fitz
+except ImportError:  # pragma: no cover - optional dependency
+    fitz = None
+
+logger = logging.getLogger(__name__)
+
+PREVIEW_WIDTH = 640
+UPLOADS_URL = '/static/uploads/'
+INFO_FOLDER = 'variants'
+
+# Page tree roots and compressed object streams, for counting pages without PyMuPDF
+_PAGES_COUNT = re.compile(rb'/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b')
+_OBJECT_STREAM = re.compile(rb'<<(?:(?!>>).)*?/Type\s*/ObjStm(?:(?!>>).)*?>>\s*stream\r?\n', re.DOTALL)
+
+
+def info_path(path):
+    """Returns the info file recording what was extracted from a PDF."""
+    folder, filename = os.path.split(path)
+    return os.path.join(folder, INFO_FOLDER, f'{os.path.splitext(filename)[0]}-pdf.json')
+
+
+def load_info(path):
+    """Returns the extracted info of a PDF, or None if it was not read yet."""
+    try:
+        with open(info_path(path), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def remove_info(path):
+    """Deletes a PDF's info file, if any."""
+    try:
+        os.remove(info_path(path))
+    except FileNotFoundError:
+        pass
+
+
+def count_pages(path):
+    """Reads the page count from a PDF's page tree without a PDF library.
+
+    The file is memory-mapped rather than loaded. Page trees inside
+    compressed object streams are found too; the root holds the largest
+    ``/Count``.
+
+    Returns:
+        int | None: The number of pages, or None when no page tree was found.
+    """
+    counts = []
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        for match in _PAGES_COUNT.finditer(data):
+            counts.append(int(match.group(1) or match.group(2)))
+        for match in _OBJECT_STREAM.finditer(data):
+            if b'/FlateDecode' not in match.group(0):
+                continue
+            end = data.find(b'endstream', match.end())
+            try:
+                content = zlib.decompressobj().decompress(data[match.end():end])
+            except zlib.error:
+                continue
+            counts.extend(int(m.group(1) or m.group(2)) for m in _PAGES_COUNT.finditer(content))
+    return max(counts) if counts else None
+
+
+def render_preview(path, width=PREVIEW_WIDTH):
+    """Renders the first page of a PDF as JPEG bytes, or None without PyMuPDF.
+
+    Returns:
+        tuple: ``(page_count, jpeg)``; ``jpeg`` is None when the first page
+        cannot be rendered.
+    """
+    if fitz is None:
+        logger.warning('PyMuPDF is not installed; no preview rendered for %s', path)
+        return None, None
+    with fitz.open(path) as document:
+        if not document.page_count:
+            return 0, None
+        page = document.load_page(0)
+        zoom = width / page.rect.width
+        pixmap = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), alpha=False)
+        image = Image.frombytes('RGB', (pixmap.width, pixmap.height), pixmap.samples)
+        output = io.BytesIO()
+        image.save(output, 'JPEG', quality=82, optimize=True, progressive=True)
+        return document.page_count, output.getvalue()
+
+
+def extract_info(path, url):
+    """Reads a PDF once and stores its preview and info file.
+
+    Args:
+        path (str): The stored PDF.
+        url (str): The URL the PDF is served from.
+
+    Returns:
+        dict: ``pages``, ``size`` and ``preview`` (a URL or None).
+    """
+    from storage import store_upload
+
+    pages, jpeg = render_preview(path)
+    if pages is None:
+        pages = count_pages(path)
+    preview = None
+    if jpeg is not None:
+        folder = os.path.dirname(path)
+        filename, _ = store_upload(io.BytesIO(jpeg), folder, 'jpg')
+        preview = url.rsplit('/', 1)[0] + f'/{filename}'
+    info = {'pages': pages, 'size': os.path.getsize(path), 'preview': preview}
+
+    target = info_path(path)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    with open(target + '.tmp', 'w', encoding='utf-8') as f:
+        json.dump(info, f)
+    os.replace(target + '.tmp', target)
+    return info
+
+
+def apply_info(book, upload_folder):
+    """Copies the extracted info of a book's PDF onto the book, if known.
+
+    Clears the values when the PDF was not read yet, so a replaced PDF
+    never keeps the previous one's details.
+
+    Returns:
+        bool: Whether info was found.
+    """
+    from downloads import resolve_download
+    from images import upload_path
+
+    kind, path = resolve_download(book.download, upload_folder)
+    info = load_info(path) if kind == 'file' else None
+    if info and info['preview'] and not os.path.exists(upload_path(info['preview'], upload_folder)):
+        info = None
+    book.page_count = info['pages'] if info else None
+    book.file_size = info['size'] if info else None
+    book.preview = info['preview'] if info else None
+    return info is not None
+
+
+@task('pdf_metadata')
+def process_pdf(path, url):
+    """Extracts a PDF's info and fills it in on the books that link to it.
+
+    Runs as a background job inside an application context.
+
+    Args:
+        path (str): The stored PDF.
+        url (str): The URL the PDF is served from.
+
+    Returns:
+        dict: The extracted info.
+    """
+    from database import db
+    from models import Book
+
+    info = extract_info(path, url)
+    Book.query.filter(Book.download.endswith(url.rsplit('/', 1)[-1])).update(
+        {'page_count': info['pages'], 'file_size': info['size'], 'preview': info['preview']},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    return info
+
+
+def main():
+    """Extracts missing info for every uploaded book PDF."""
+    from app import create_app
+
+    app = create_app()
+    folder = os.path.join(app.config['UPLOAD_FOLDER'], 'books')
+    with app.app_context():
+        for filename in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+            path = os.path.join(folder, filename)
+            if not filename.lower().endswith('.pdf') or load_info(path) is not None:
+                continue
+            info = process_pdf(path, f'{UPLOADS_URL}books/{filename}')
+            print(f'{path}: {info["pages"]} pages, preview {info["preview"] or "unavailable"}')
+
+
+if __name__ == '__main__':
+    main()
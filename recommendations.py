@@ -0,0 +1,275 @@
+"""
+Content recommendations for logged-in readers.
+
+Recommendations are item-to-item. An offline build computes, for every book
+and article, the items most similar to it and stores them as
+:class:`models.ItemNeighbor` rows:
+
+* Two items are similar when the same readers looked at both. The user-item
+  matrix is :class:`models.ContentActivityRollup` (see ``rollups.py``),
+  read in batches of users. Co-view counts are turned into cosine
+  similarities: ``co_views / sqrt(readers_a * readers_b)``.
+* Items sharing a category get :data:`CATEGORY_WEIGHT` on top, which also
+  gives new or rarely read items neighbours.
+
+Serving is a lookup. A user's most recent items are read from their content
+rollup and the stored neighbours of those items are merged, weighting
+recent items more and leaving out what the user has already seen. Popular
+books and new articles fill up the list for users with little history. The
+activity log itself is never read on a request.
+
+The build runs as the ``build_recommendations`` job, with
+``flask build-recommendations`` or with ``python recommendations.py``;
+schedule it, e.g. nightly.
+"""
+import math
+from collections import Counter, defaultdict
+from datetime import datetime
+from itertools import combinations
+
+import click
+from sqlalchemy import delete, insert, select
+
+from database import db
+from jobs import task
+from pagination import load_columns
+
+RECOMMENDED_TYPES = ('book', 'article')
+
+# Neighbours stored per item
+TOP_NEIGHBORS = 20
+
+# Similarity of two items that only share a category
+CATEGORY_WEIGHT = 0.1
+
+# Newest items of a category considered as neighbours of its other items
+CATEGORY_CANDIDATES = 50
+
+# Users read at a time, and the most recent items counted per user
+USER_BATCH_SIZE = 1000
+MAX_ITEMS_PER_USER = 200
+
+# Recent items of a user whose neighbours are merged
+PROFILE_SIZE = 20
+
+DEFAULT_RECOMMENDATIONS = 10
+MAX_RECOMMENDATIONS = 50
+
+_FIELDS = {
+    'book': ('id', 'title', 'category', 'cover', 'download_url'),
+    'article': ('id', 'title', 'summary', 'category', 'image'),
+}
+
+
+def _content_models():
+    from models import Article, Book
+
+    return {'book': Book, 'article': Article}
+
+
+def _catalog():
+    """Returns the category and creation time of every recommendable item."""
+    catalog = {}
+    for item_type, model in _content_models().items():
+        for item_id, category, created_at in db.session.execute(select(model.id, model.category, model.created_at)):
+            catalog[(item_type, item_id)] = ((category or '').strip(), created_at)
+    return catalog
+
+
+def count_co_views(catalog):
+    """Counts the readers of each item and of each pair of items.
+
+    Returns:
+        tuple[Counter, Counter]: Readers per item, and per ``(item, item)``
+        pair sorted in ascending order.
+    """
+    from models import ContentActivityRollup as rollup
+
+    readers, co_views = Counter(), Counter()
+    last_user = 0
+    while True:
+        user_ids = db.session.scalars(
+            select(rollup.user_id).distinct().where(rollup.user_id > last_user)
+            .order_by(rollup.user_id).limit(USER_BATCH_SIZE)
+        ).all()
+        if not user_ids:
+            break
+        last_user = user_ids[-1]
+        history = defaultdict(list)
+        rows = db.session.execute(
+            select(rollup.user_id, rollup.content_type, rollup.content_id)
+            .where(rollup.user_id.in_(user_ids), rollup.content_type.in_(RECOMMENDED_TYPES))
+            .order_by(rollup.user_id, rollup.last_at.desc())
+        )
+        for user_id, content_type, content_id in rows:
+            item = (content_type, content_id)
+            if item in catalog and len(history[user_id]) < MAX_ITEMS_PER_USER:
+                history[user_id].append(item)
+        for items in history.values():
+            readers.update(items)
+            co_views.update(combinations(sorted(items), 2))
+    return readers, co_views
+
+
+def compute_neighbors():
+    """Computes the most similar items of every book and article.
+
+    Returns:
+        dict: Maps each item to a list of ``(neighbour, score, reason)``,
+        best first.
+    """
+    catalog = _catalog()
+    readers, co_views = count_co_views(catalog)
+    co_viewed = defaultdict(dict)
+    for (a, b), count in co_views.items():
+        co_viewed[a][b] = co_viewed[b][a] = count / math.sqrt(readers[a] * readers[b])
+
+    scores = defaultdict(dict, {item: dict(similar) for item, similar in co_viewed.items()})
+    by_category = defaultdict(list)
+    for item, (category, created_at) in catalog.items():
+        if category:
+            by_category[category].append((created_at or datetime.min, item))
+    for members in by_category.values():
+        newest = [item for _, item in sorted(members, reverse=True)[:CATEGORY_CANDIDATES]]
+        for _, item in members:
+            for candidate in newest:
+                if candidate != item:
+                    scores[item][candidate] = scores[item].get(candidate, 0) + CATEGORY_WEIGHT
+
+    neighbors = {}
+    for item, candidates in scores.items():
+        best = sorted(candidates.items(), key=lambda pair: (-pair[1], pair[0]))[:TOP_NEIGHBORS]
+        neighbors[item] = [(neighbor, score, 'co_view' if neighbor in co_viewed[item] else 'category')
+                           for neighbor, score in best]
+    return neighbors
+
+
+def build_recommendations():
+    """Recomputes and stores the neighbours of every item.
+
+    Must be called inside an application context. The stored neighbours are
+    replaced in one transaction.
+
+    Returns:
+        int: The number of items that have neighbours.
+    """
+    from models import ItemNeighbor
+
+    neighbors = compute_neighbors()
+    rows = [{'item_type': item[0], 'item_id': item[1], 'neighbor_type': neighbor[0], 'neighbor_id': neighbor[1],
+             'score': score, 'reason': reason}
+            for item, similar in neighbors.items() for neighbor, score, reason in similar]
+    table = ItemNeighbor.__table__
+    db.session.execute(delete(table))
+    for start in range(0, len(rows), 1000):
+        db.session.execute(insert(table), rows[start:start + 1000])
+    db.session.commit()
+    return len(neighbors)
+
+
+@task('build_recommendations', max_attempts=1)
+def build_recommendations_task():
+    """Rebuilds the stored neighbours in the background."""
+    return {'items': build_recommendations()}
+
+
+# --- Serving ---
+def _by_type(items):
+    grouped = defaultdict(list)
+    for item_type, item_id in items:
+        grouped[item_type].append(item_id)
+    return grouped
+
+
+def _load_items(items):
+    """Serializes existing items, keyed by ``(type, id)``; deleted ones are left out."""
+    loaded = {}
+    for item_type, ids in _by_type(items).items():
+        model = _content_models()[item_type]
+        fields = _FIELDS[item_type]
+        for row in model.query.options(load_columns(model, fields)).filter(model.id.in_(ids)):
+            loaded[(item_type, row.id)] = {'type': item_type, **row.to_dict(fields)}
+    return loaded
+
+
+def _popular(limit, exclude):
+    """Returns the most downloaded books and the newest articles, alternating."""
+    models = _content_models()
+    lists = [
+        [('book', item_id) for item_id in db.session.scalars(
+            select(models['book'].id).order_by(models['book'].download_count.desc(), models['book'].id.desc())
+            .limit(limit + len(exclude)))],
+        [('article', item_id) for item_id in db.session.scalars(
+            select(models['article'].id).order_by(models['article'].created_at.desc()).limit(limit + len(exclude)))],
+    ]
+    merged = [item for pair in zip(*lists) for item in pair]
+    merged += lists[0][len(lists[1]):] + lists[1][len(lists[0]):]
+    return [item for item in merged if item not in exclude][:limit]
+
+
+def recommend(user_id, limit=DEFAULT_RECOMMENDATIONS):
+    """Returns recommended books and articles for a user.
+
+    Args:
+        user_id (int): The user to recommend to.
+        limit (int): The number of recommendations.
+
+    Returns:
+        list[dict]: The items, best first, each with its ``type``,
+        serialized fields, ``score`` and ``reason`` ('co_view', 'category'
+        or 'popular').
+    """
+    from models import ContentActivityRollup as rollup, ItemNeighbor
+
+    profile = db.session.execute(
+        select(rollup.content_type, rollup.content_id)
+        .where(rollup.user_id == user_id, rollup.content_type.in_(RECOMMENDED_TYPES))
+        .order_by(rollup.last_at.desc()).limit(PROFILE_SIZE)
+    ).all()
+    weights = {tuple(item): 1 / math.sqrt(rank + 1) for rank, item in enumerate(profile)}
+
+    scores, reasons = Counter(), {}
+    for item_type, ids in _by_type(weights).items():
+        neighbors = ItemNeighbor.query.filter(ItemNeighbor.item_type == item_type, ItemNeighbor.item_id.in_(ids))
+        for neighbor in neighbors:
+            candidate = (neighbor.neighbor_type, neighbor.neighbor_id)
+            scores[candidate] += weights[(item_type, neighbor.item_id)] * neighbor.score
+            if reasons.get(candidate) != 'co_view':
+                reasons[candidate] = neighbor.reason
+
+    seen = set(weights)
+    for item_type, ids in _by_type(scores).items():
+        seen.update((item_type, item_id) for item_id in db.session.scalars(
+            select(rollup.content_id).where(rollup.user_id == user_id, rollup.content_type == item_type,
+                                            rollup.content_id.in_(ids))))
+    ranked = [(item, score) for item, score in scores.most_common() if item not in seen]
+
+    # Fetch extra items, since neighbours of deleted items are only dropped by the next build
+    candidates = ranked[:limit * 2]
+    if len(candidates) < limit * 2:
+        chosen = {item for item, _ in candidates}
+        candidates += [(item, 0.0) for item in _popular(limit * 2 - len(candidates), seen | chosen)]
+    loaded = _load_items([item for item, _ in candidates])
+    return [{**loaded[item], 'score': round(score, 4), 'reason': reasons.get(item, 'popular')}
+            for item, score in candidates if item in loaded][:limit]
+
+
+def init_recommendations(app):
+    """Registers the ``flask build-recommendations`` command."""
+
+    @app.cli.command('build-recommendations')
+    def build_recommendations_command():
+        """Recomputes the content recommendations."""
+        click.echo(f'Stored neighbours for {build_recommendations()} items')
+
+
+def main():
+    """Builds the recommendations of the configured database."""
+    from app import create_app
+
+    with create_app().app_context():
+        print(f'Stored neighbours for {build_recommendations()} items')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,317 @@
+"""
+Retention and partitioning of the user activity log.
+
+Statistics and recommendations read the activity rollups (see
+``rollups.py``), which already count every recorded activity, so raw
+``UserActivity`` rows are only needed for recent history. The archive job
+moves the months that ended more than ``ACTIVITY_RETENTION_DAYS`` ago out of
+the table into gzip-compressed JSON-lines files, one per month, in
+``ACTIVITY_ARCHIVE_FOLDER``. Rebuilding the rollups reads these archives
+along with the table, so history is never lost from the counts.
+
+On PostgreSQL the table can be converted once to monthly range partitions
+with ``flask partition-activity``. Archiving then drops whole partitions
+instead of deleting rows, and creates the partitions of the coming months.
+Rows that reached the default partition because their month had none yet
+are moved into that month's partition when it is created.
+
+Each chunk of rows is written to its archive before it is deleted, in ID
+order. Since a month is archived whole, the IDs in its file only go up,
+except after a crash between the write and the delete, when the chunk is
+archived again; readers skip those IDs as not greater than the last one.
+
+Usage:
+    flask archive-activity [--days N]
+    flask partition-activity
+"""
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import delete, select, text
+
+from database import db
+from jobs import task
+
+logger = logging.getLogger(__name__)
+
+# Rows exported and deleted at a time
+ARCHIVE_CHUNK_SIZE = 5000
+
+# Monthly partitions created ahead of the current month
+PARTITIONS_AHEAD = 3
+
+_ARCHIVE_FILE = re.compile(r'^activity-(\d{4})-(\d{2})\.jsonl\.gz$')
+_PARTITION = re.compile(r'^user_activity_p(\d{4})_(\d{2})$')
+
+
+def _table():
+    from models import UserActivity
+
+    return UserActivity.__table__
+
+
+def _month_start(moment):
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _next_month(month):
+    return (month + timedelta(days=32)).replace(day=1)
+
+
+# --- Archives ---
+def archive_path(folder, month):
+    """Returns the archive file holding the activities of a month."""
+    return os.path.join(folder, f'activity-{month:%Y-%m}.jsonl.gz')
+
+
+def _write_archive(folder, rows):
+    """Appends rows to their monthly archives.
+
+    Each append adds a gzip member, which gzip readers treat as a
+    continuation of the same file.
+    """
+    by_month = {}
+    for row in rows:
+        by_month.setdefault(_month_start(row['created_at']), []).append(row)
+    os.makedirs(folder, exist_ok=True)
+    for month, month_rows in by_month.items():
+        lines = ''.join(json.dumps({**row, 'created_at': row['created_at'].isoformat()}, ensure_ascii=False) + '\n'
+                        for row in month_rows)
+        with open(archive_path(folder, month), 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='wb') as f:
+                f.write(lines.encode('utf-8'))
+            raw.flush()
+            os.fsync(raw.fileno())
+
+
+def read_archives(folder):
+    """Yields every archived activity once, oldest month first.
+
+    Args:
+        folder (str | None): The archive folder; nothing is read when None
+            or missing.
+
+    Yields:
+        dict: The activity's columns, with ``created_at`` as a datetime.
+    """
+    if not folder or not os.path.isdir(folder):
+        return
+    for filename in sorted(os.listdir(folder)):
+        if not _ARCHIVE_FILE.match(filename):
+            continue
+        last_id = 0
+        with gzip.open(os.path.join(folder, filename), 'rt', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    row = json.loads(line)
+                    row['created_at'] = datetime.fromisoformat(row['created_at'])
+                except (ValueError, KeyError, TypeError):
+                    continue  # A line cut short by a crash
+                if row['id'] <= last_id:
+                    continue  # Archived again after a crash
+                last_id = row['id']
+                yield row
+
+
+# --- Partitions (PostgreSQL) ---
+def is_partitioned(connection):
+    """Tells whether the activity table is partitioned."""
+    if connection.dialect.name != 'postgresql':
+        return False
+    return bool(connection.scalar(text(
+        "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+        "WHERE c.relname = 'user_activity' AND c.relnamespace = to_regnamespace(current_schema())::oid"
+    )))
+
+
+def _partitions(connection):
+    """Maps the start of each monthly partition's range to its name."""
+    names = connection.scalars(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'user_activity'::regclass"
+    ))
+    partitions = {}
+    for name in names:
+        match = _PARTITION.match(name)
+        if match:
+            partitions[datetime(int(match.group(1)), int(match.group(2)), 1)] = name
+    return partitions
+
+
+def _create_partition(connection, month):
+    """Creates the partition of one month, moving its rows out of the default partition.
+
+    Rows land in ``user_activity_default`` when no partition covers their
+    month yet, e.g. if archiving did not run for over :data:`PARTITIONS_AHEAD`
+    months. PostgreSQL refuses to create a partition whose rows the default
+    one holds, so the default is detached while they are moved.
+    """
+    bounds = {'start': month, 'end': _next_month(month)}
+    create = text(
+        f"CREATE TABLE user_activity_p{month:%Y_%m} PARTITION OF user_activity "
+        f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_next_month(month):%Y-%m-%d}')"
+    )
+    stranded = connection.scalar(text("SELECT to_regclass('user_activity_default') IS NOT NULL")) and \
+        connection.scalar(text(
+            'SELECT EXISTS (SELECT 1 FROM user_activity_default WHERE created_at >= :start AND created_at < :end)'
+        ), bounds)
+    if not stranded:
+        connection.execute(create)
+        return
+    connection.execute(text('ALTER TABLE user_activity DETACH PARTITION user_activity_default'))
+    connection.execute(create)
+    moved = connection.execute(text(
+        'WITH moved AS (DELETE FROM user_activity_default WHERE created_at >= :start AND created_at < :end '
+        'RETURNING *) INSERT INTO user_activity SELECT * FROM moved'
+    ), bounds).rowcount
+    connection.execute(text('ALTER TABLE user_activity ATTACH PARTITION user_activity_default DEFAULT'))
+    logger.warning('Moved %d activity rows of %s out of the default partition', moved, f'{month:%Y-%m}')
+
+
+def create_partitions(connection, first, last):
+    """Creates the monthly partitions from ``first`` through ``last``, if missing."""
+    existing = _partitions(connection)
+    month = _month_start(first)
+    while month <= last:
+        if month not in existing:
+            _create_partition(connection, month)
+        month = _next_month(month)
+
+
+def partition_activity_table():
+    """Converts the activity table into monthly range partitions.
+
+    Runs in one transaction: the table is renamed, a partitioned table
+    with the same columns takes its place, the rows are copied and the old
+    table is dropped. The ID sequence is kept. Since the primary key of a
+    partitioned table must include the partition key, it becomes
+    ``(id, created_at)``.
+
+    Must be called inside an application context.
+
+    Returns:
+        bool: False if the table was already partitioned.
+
+    Raises:
+        RuntimeError: If the database is not PostgreSQL.
+    """
+    with db.engine.begin() as connection:
+        if connection.dialect.name != 'postgresql':
+            raise RuntimeError('Partitioning the activity table requires PostgreSQL')
+        if is_partitioned(connection):
+            return False
+        sequence = connection.scalar(text("SELECT pg_get_serial_sequence('user_activity', 'id')"))
+        oldest = connection.scalar(text('SELECT min(created_at) FROM user_activity')) or datetime.utcnow()
+        connection.execute(text('UPDATE user_activity SET created_at = now() WHERE created_at IS NULL'))
+        connection.execute(text('ALTER TABLE user_activity RENAME TO user_activity_unpartitioned'))
+        if sequence:
+            connection.execute(text(f'ALTER SEQUENCE {sequence} OWNED BY NONE'))
+        connection.execute(text(
+            'CREATE TABLE user_activity (LIKE user_activity_unpartitioned INCLUDING DEFAULTS) '
+            'PARTITION BY RANGE (created_at)'
+        ))
+        connection.execute(text('ALTER TABLE user_activity ALTER COLUMN created_at SET NOT NULL'))
+        connection.execute(text('ALTER TABLE user_activity ADD PRIMARY KEY (id, created_at)'))
+        connection.execute(text('ALTER TABLE user_activity ADD FOREIGN KEY (user_id) REFERENCES "user" (id)'))
+        connection.execute(text('CREATE TABLE user_activity_default PARTITION OF user_activity DEFAULT'))
+        create_partitions(connection, oldest, _month_start(datetime.utcnow()) + timedelta(days=31 * PARTITIONS_AHEAD))
+        connection.execute(text('INSERT INTO user_activity SELECT * FROM user_activity_unpartitioned'))
+        connection.execute(text('DROP TABLE user_activity_unpartitioned'))
+        if sequence:
+            connection.execute(text(f'ALTER SEQUENCE {sequence} OWNED BY user_activity.id'))
+        for index in _table().indexes:
+            index.create(connection)
+    return True
+
+
+# --- Retention ---
+ARCHIVED_COLUMNS = ('id', 'user_id', 'activity_type', 'content_id', 'content_type', 'content_title',
+                    'activity_data', 'created_at')
+
+
+def archive_activity(cutoff, folder):
+    """Moves the months that ended by ``cutoff`` from the table to the archives.
+
+    Only whole months are archived, so each monthly file is written in one
+    pass in ID order. On a partitioned table, those partitions are archived
+    and dropped, and upcoming partitions are created.
+
+    Must be called inside an application context.
+
+    Returns:
+        int: The number of activities archived.
+    """
+    cutoff = _month_start(cutoff)
+    table = _table()
+    archived = 0
+    with db.engine.begin() as connection:
+        partitioned = is_partitioned(connection)
+        if partitioned:
+            create_partitions(connection, datetime.utcnow(),
+                              _month_start(datetime.utcnow()) + timedelta(days=31 * PARTITIONS_AHEAD))
+    if partitioned:
+        with db.engine.connect() as connection:
+            expired = [name for month, name in sorted(_partitions(connection).items())
+                       if _next_month(month) <= cutoff]
+        for name in expired:
+            with db.engine.begin() as connection:
+                last_id = 0
+                while True:
+                    rows = connection.execute(text(
+                        f'SELECT {", ".join(ARCHIVED_COLUMNS)} FROM {name} WHERE id > :last_id ORDER BY id LIMIT :limit'
+                    ), {'last_id': last_id, 'limit': ARCHIVE_CHUNK_SIZE}).mappings().all()
+                    if not rows:
+                        break
+                    _write_archive(folder, [dict(row) for row in rows])
+                    archived += len(rows)
+                    last_id = rows[-1]['id']
+                connection.execute(text(f'DROP TABLE {name}'))
+
+    while True:
+        with db.engine.begin() as connection:
+            rows = connection.execute(
+                select(*(table.c[name] for name in ARCHIVED_COLUMNS)).where(table.c.created_at < cutoff).order_by(table.c.id).limit(ARCHIVE_CHUNK_SIZE)
+            ).mappings().all()
+            if not rows:
+                break
+            _write_archive(folder, [dict(row) for row in rows])
+            connection.execute(delete(table).where(table.c.id.in_([row['id'] for row in rows])))
+        archived += len(rows)
+    return archived
+
+
+@task('archive_activity', max_attempts=1)
+def archive_activity_task(days=None):
+    """Archives activities older than the retention period."""
+    from flask import current_app
+
+    days = days or current_app.config['ACTIVITY_RETENTION_DAYS']
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    return {'archived': archive_activity(cutoff, current_app.config['ACTIVITY_ARCHIVE_FOLDER'])}
+
+
+def init_retention(app):
+    """Registers the ``flask archive-activity`` and ``flask partition-activity`` commands."""
+
+    @app.cli.command('archive-activity')
+    @click.option('--days', type=int, default=None, help='Keep this many days instead of ACTIVITY_RETENTION_DAYS.')
+    def archive_activity_command(days):
+        """Moves old user activity into compressed monthly archives."""
+        days = days or app.config['ACTIVITY_RETENTION_DAYS']
+        folder = app.config['ACTIVITY_ARCHIVE_FOLDER']
+        count = archive_activity(datetime.utcnow() - timedelta(days=days), folder)
+        click.echo(f'Archived {count} activities older than {days} days into {folder}')
+
+    @app.cli.command('partition-activity')
+    def partition_activity_command():
+        """Converts the activity table into monthly partitions (PostgreSQL)."""
+        try:
+            converted = partition_activity_table()
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        click.echo('Partitioned the activity table by month' if converted else 'Already partitioned')
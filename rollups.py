@@ -0,0 +1,298 @@
+"""
+Rollups of user activity.
+
+``UserActivity`` grows with every view, so statistics are not computed from
+it. Instead, :class:`models.HourlyActivityRollup` and
+:class:`models.DailyActivityRollup` count activities per user, bucket,
+content type and activity type, :class:`models.TotalActivityRollup` and
+:class:`models.ActiveDaysRollup` keep each user's all-time totals, and
+:class:`models.ContentActivityRollup` counts activities per user and
+content item. The activity buffer (see
+``activity.py``) adds each batch to the counts in the same transaction that
+inserts it, so every event is counted exactly once. The statistics
+endpoints read only the rollups, and their cost depends on the number of
+buckets asked for rather than on the amount of history.
+
+Activities written some other way, or before the rollups existed, are
+counted by ``flask rebuild-activity-rollups``, which recomputes the counts
+from the raw table and the archives of old activity (see ``retention.py``).
+"""
+from collections import Counter
+from datetime import datetime, timedelta
+
+import click
+from sqlalchemy import case, delete, func, insert, select, update
+
+from database import db
+
+PERIODS = ('hour', 'day')
+
+# Raw activities read at a time when rebuilding
+REBUILD_CHUNK_SIZE = 5000
+
+# Activity types shown on the user journey page
+STATISTICS = {
+    'books_viewed': 'view_book',
+    'articles_viewed': 'view_article',
+    'downloads': 'download_book',
+}
+
+
+def _models():
+    from models import (ActiveDaysRollup, ContentActivityRollup, DailyActivityRollup, HourlyActivityRollup,
+                        TotalActivityRollup)
+
+    return {'hour': HourlyActivityRollup, 'day': DailyActivityRollup, 'content': ContentActivityRollup,
+            'total': TotalActivityRollup, 'active_days': ActiveDaysRollup}
+
+
+def bucket_start(moment, period):
+    """Returns the start of the hour or day containing ``moment``."""
+    if period == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def count_activities(rows):
+    """Counts activity rows per rollup key.
+
+    Args:
+        rows (Iterable[dict]): Activities with ``user_id``, ``created_at``,
+            ``content_type`` and ``activity_type``.
+
+    Returns:
+        dict: Maps each period to a ``Counter`` of ``(user_id, bucket,
+        content_type, activity_type)`` keys.
+    """
+    counts = {period: Counter() for period in PERIODS}
+    for row in rows:
+        for period in PERIODS:
+            key = (row['user_id'], bucket_start(row['created_at'], period),
+                   row['content_type'] or '', row['activity_type'])
+            counts[period][key] += 1
+    return counts
+
+
+def count_content(rows):
+    """Counts activity rows per user and content item.
+
+    Returns:
+        dict: Maps ``(user_id, content_type, content_id)`` to the number of
+        activities and the time of the latest one.
+    """
+    counts = {}
+    for row in rows:
+        if not row['content_type'] or row['content_id'] is None:
+            continue
+        key = (row['user_id'], row['content_type'], row['content_id'])
+        count, last_at = counts.get(key, (0, row['created_at']))
+        counts[key] = (count + 1, max(last_at, row['created_at']))
+    return counts
+
+
+def _upsert(connection, table, keys, rows, merge):
+    """Inserts rows, merging them into the stored rows with the same keys.
+
+    PostgreSQL and SQLite use ``INSERT ... ON CONFLICT``; other databases
+    update each key and insert the missing ones.
+
+    Args:
+        table: The rollup table.
+        keys (tuple[str]): The columns of its unique constraint.
+        rows (list[dict]): The new values.
+        merge (callable): Given the new values (``excluded``, or a row),
+            returns the ``SET`` clause applied to an existing row.
+    """
+    if not rows:
+        return
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        statement = dialect_insert(table)
+        connection.execute(statement.on_conflict_do_update(index_elements=list(keys),
+                                                           set_=merge(statement.excluded)), rows)
+        return
+    for row in rows:
+        result = connection.execute(update(table).where(*(table.c[key] == row[key] for key in keys))
+                                    .values(merge(row)))
+        if result.rowcount == 0:
+            connection.execute(insert(table).values(row))
+
+
+def _new_days(connection, keys):
+    """Returns the ``(user_id, day)`` pairs among the daily rollup keys that have no row yet.
+
+    Two processes flushing a user's first events of a day at the same time
+    may both count the day; a rebuild corrects that.
+    """
+    table = _models()['day'].__table__
+    days = {(user_id, bucket) for user_id, bucket, _, _ in keys}
+    if not days:
+        return set()
+    existing = connection.execute(
+        select(table.c.user_id, table.c.bucket).distinct()
+        .where(table.c.user_id.in_({user_id for user_id, _ in days}), table.c.bucket.in_({day for _, day in days}))
+    ).all()
+    return days - {tuple(row) for row in existing}
+
+
+def add_to_rollups(connection, rows):
+    """Adds newly inserted activities to the rollups.
+
+    Must run in the transaction that inserts ``rows``.
+    """
+    counts = count_activities(rows)
+    # Read before the daily rollup gets this batch's rows
+    new_days = Counter(user_id for user_id, _ in _new_days(connection, counts['day']))
+    for period, counter in counts.items():
+        table = _models()[period].__table__
+        _upsert(connection, table, ('user_id', 'bucket', 'content_type', 'activity_type'), [
+            {'user_id': user_id, 'bucket': bucket, 'content_type': content_type,
+             'activity_type': activity_type, 'count': count}
+            for (user_id, bucket, content_type, activity_type), count in counter.items()
+        ], lambda new, table=table: {'count': table.c.count + new['count']})
+
+    totals = Counter()
+    for (user_id, _, _, activity_type), count in counts['day'].items():
+        totals[(user_id, activity_type)] += count
+    table = _models()['total'].__table__
+    _upsert(connection, table, ('user_id', 'activity_type'), [
+        {'user_id': user_id, 'activity_type': activity_type, 'count': count}
+        for (user_id, activity_type), count in totals.items()
+    ], lambda new, table=table: {'count': table.c.count + new['count']})
+
+    table = _models()['active_days'].__table__
+    _upsert(connection, table, ('user_id',), [
+        {'user_id': user_id, 'active_days': days} for user_id, days in new_days.items()
+    ], lambda new, table=table: {'active_days': table.c.active_days + new['active_days']})
+
+    table = _models()['content'].__table__
+    _upsert(connection, table, ('user_id', 'content_type', 'content_id'), [
+        {'user_id': user_id, 'content_type': content_type, 'content_id': content_id,
+         'count': count, 'last_at': last_at}
+        for (user_id, content_type, content_id), (count, last_at) in count_content(rows).items()
+    ], lambda new: {'count': table.c.count + new['count'],
+                    'last_at': case((table.c.last_at < new['last_at'], new['last_at']), else_=table.c.last_at)})
+
+
+def rebuild_rollups(archive_folder=None):
+    """Recomputes every rollup from the ``UserActivity`` table and its archives.
+
+    Must be called inside an application context. The rollups are emptied,
+    then refilled and committed a chunk at a time, so statistics read
+    during a rebuild are incomplete. Activities recorded once it started are
+    counted by the activity buffer as usual.
+
+    Args:
+        archive_folder (str, optional): The folder of activities archived
+            out of the table (see ``retention.py``).
+
+    Returns:
+        int: The number of activities counted.
+    """
+    from models import UserActivity
+    from retention import _month_start, read_archives
+
+    table = UserActivity.__table__
+    columns = (table.c.id, table.c.user_id, table.c.created_at, table.c.content_type, table.c.content_id,
+               table.c.activity_type)
+    with db.engine.begin() as connection:
+        for model in _models().values():
+            connection.execute(delete(model.__table__))
+        last_table_id = connection.scalar(select(func.max(table.c.id))) or 0
+
+    # The highest archived ID of each month; rows archived just before a
+    # crash may still be in the table
+    total, archived = 0, {}
+    chunk = []
+    for row in read_archives(archive_folder):
+        chunk.append(row)
+        month = _month_start(row['created_at'])
+        archived[month] = max(archived.get(month, 0), row['id'])
+        if len(chunk) == REBUILD_CHUNK_SIZE:
+            with db.engine.begin() as connection:
+                add_to_rollups(connection, chunk)
+            total += len(chunk)
+            chunk = []
+    with db.engine.begin() as connection:
+        add_to_rollups(connection, chunk)
+    total += len(chunk)
+
+    last_id = 0
+    while True:
+        with db.engine.begin() as connection:
+            rows = connection.execute(
+                select(*columns).where(table.c.id > last_id, table.c.id <= last_table_id, table.c.created_at.isnot(None))
+                .order_by(table.c.id).limit(REBUILD_CHUNK_SIZE)
+            ).mappings().all()
+            if not rows:
+                break
+            last_id = rows[-1]['id']
+            rows = [row for row in rows if row['id'] > archived.get(_month_start(row['created_at']), 0)]
+            add_to_rollups(connection, rows)
+        total += len(rows)
+    return total
+
+
+# --- Statistics ---
+def user_statistics(user_id):
+    """Returns a user's activity totals from their all-time rollups.
+
+    Reads one row per activity type the user has had, however long their
+    history is.
+
+    Returns:
+        dict: ``books_viewed``, ``articles_viewed``, ``downloads`` and
+        ``active_days``, plus ``activities`` mapping every activity type to
+        its total.
+    """
+    models = _models()
+    totals = dict(db.session.execute(
+        select(models['total'].activity_type, models['total'].count).where(models['total'].user_id == user_id)
+    ).all())
+    active_days = db.session.scalar(
+        select(models['active_days'].active_days).where(models['active_days'].user_id == user_id))
+    statistics = {key: int(totals.get(activity_type, 0)) for key, activity_type in STATISTICS.items()}
+    statistics['active_days'] = active_days or 0
+    statistics['activities'] = {activity_type: int(total) for activity_type, total in totals.items()}
+    return statistics
+
+
+def activity_series(period, buckets, now=None):
+    """Returns site-wide activity counts for the most recent buckets.
+
+    Args:
+        period (str): 'hour' or 'day'.
+        buckets (int): How many buckets to return, ending with the current one.
+        now (datetime, optional): Overrides the current time.
+
+    Returns:
+        list[dict]: One entry per bucket, oldest first, with its ``bucket``
+        start, ``total`` and ``activities`` per type.
+    """
+    model = _models()[period]
+    step = timedelta(hours=1) if period == 'hour' else timedelta(days=1)
+    last = bucket_start(now or datetime.utcnow(), period)
+    first = last - step * (buckets - 1)
+    series = {first + step * n: Counter() for n in range(buckets)}
+    rows = db.session.execute(
+        select(model.bucket, model.activity_type, func.sum(model.count))
+        .where(model.bucket >= first).group_by(model.bucket, model.activity_type)
+    )
+    for bucket, activity_type, count in rows:
+        if bucket in series:
+            series[bucket][activity_type] += int(count)
+    return [{'bucket': bucket.isoformat(), 'total': sum(counts.values()), 'activities': dict(counts)}
+            for bucket, counts in series.items()]
+
+
+def init_rollups(app):
+    """Registers the ``flask rebuild-activity-rollups`` command."""
+
+    @app.cli.command('rebuild-activity-rollups')
+    def rebuild_rollups_command():
+        """Recomputes the activity rollups from the raw activity table."""
+        click.echo(f'Counted {rebuild_rollups(app.config.get("ACTIVITY_ARCHIVE_FOLDER"))} activities')
@@ -0,0 +1,484 @@
+"""
+Full-text search backends for books and articles.
+
+The backend is chosen from the database dialect:
+
+- PostgreSQL uses the ``__ts_vector__`` columns maintained by the triggers in
+  ``models.py`` and ranks with ``ts_rank``.
+- SQLite uses an FTS5 virtual table, ``search_index``, kept in sync by
+  triggers created alongside the tables, and ranks with ``bm25``.
+
+Both index the ``normalized_title`` and ``normalized_body`` columns, which
+hold the text reduced by :func:`arabic.index_text`, and queries go through
+the same analysis, so spelling variants and diacritics still match.
+
+Each backend ranks books and articles together in a single statement, and
+snippets are only cut from the original text of the requested page, so large
+result sets are never materialized in the web worker. Ranked rows are
+``(kind, id, rank)`` tuples, higher ranks being better, so backends can be
+compared independently of the ORM (see ``search_benchmark.py``).
+"""
+import re
+from collections import Counter, namedtuple
+
+from markupsafe import Markup, escape
+from sqlalchemy import bindparam, event, inspect, text
+
+from arabic import TOKEN_PATTERN, analyze, normalize, stem
+from database import db
+
+SearchHit = namedtuple('SearchHit', ['kind', 'item', 'rank', 'snippet'])
+SearchPage = namedtuple('SearchPage', ['hits', 'total', 'facets'])
+
+# FTS5 rowids encode the document: rowid = id * 2 + kind code
+_KIND_CODES = {'book': 0, 'article': 1}
+_CODE_KINDS = {code: kind for kind, code in _KIND_CODES.items()}
+
+# Title matches weigh more than body matches
+_TITLE_WEIGHT = 4.0
+_BODY_WEIGHT = 1.0
+
+# Articles without a category are shown under the default one
+DEFAULT_CATEGORY = 'عام'
+
+# Private-use characters mark highlighted terms until the snippet is escaped
+HIGHLIGHT_START = '\ue000'
+HIGHLIGHT_STOP = '\ue001'
+_TAG_PATTERN = re.compile(r'<[^>]*>?')
+
+
+def highlight(snippet):
+    """Converts a raw snippet into safe HTML with ``<mark>`` around matches.
+
+    Markup stored in article bodies is stripped, and everything else is
+    escaped.
+    """
+    if not snippet:
+        return Markup('')
+    escaped = str(escape(_TAG_PATTERN.sub('', snippet)))
+    return Markup(escaped.replace(HIGHLIGHT_START, '<mark>').replace(HIGHLIGHT_STOP, '</mark>'))
+
+
+def query_terms(query):
+    """Analyzes a search query into its distinct normalized terms."""
+    return list(dict.fromkeys(analyze(query)))
+
+
+def make_snippet(body, terms, words=24):
+    """Cuts a window of words around the first match in a document body.
+
+    Words are compared after normalization and stemming, so the original
+    spelling is shown while variants are still highlighted.
+
+    Args:
+        body (str | None): The original document text, possibly HTML.
+        terms (Iterable[str]): Normalized query terms.
+        words (int): The maximum number of words in the snippet.
+
+    Returns:
+        str: The raw snippet with matches wrapped in the highlight markers.
+    """
+    body = _TAG_PATTERN.sub(' ', body or '')
+    tokens = list(TOKEN_PATTERN.finditer(body))
+    if not tokens:
+        return ''
+    terms = set(terms)
+    matches = [stem(normalize(token.group())) in terms for token in tokens]
+    first = matches.index(True) if True in matches else 0
+    start = max(0, min(first - words // 4, len(tokens) - words))
+    window = range(start, min(len(tokens), start + words))
+
+    parts = ['…'] if start else []
+    for position in window:
+        token = tokens[position]
+        if position > start:
+            parts.append(body[tokens[position - 1].end():token.start()])
+        parts.append(f'{HIGHLIGHT_START}{token.group()}{HIGHLIGHT_STOP}' if matches[position] else token.group())
+    if window.stop < len(tokens):
+        parts.append('…')
+    return ' '.join(''.join(parts).split())
+
+
+def _models():
+    from models import Article, Book
+
+    return {'book': Book, 'article': Article}
+
+
+# Maps each document kind to its table and the original columns shown in snippets
+_SOURCES = {
+    'book': ('book', ('description',)),
+    'article': ('article', ('summary', 'content')),
+}
+
+
+def _body_expression(columns, prefix=''):
+    return " || ' ' || ".join(f'{prefix}{column}' for column in columns)
+
+
+class SearchBackend:
+    """Base class for search backends.
+
+    Subclasses implement :meth:`_page` and :meth:`_facet_rows`, which receive
+    the query already analyzed into normalized terms.
+
+    Args:
+        bind: The session or connection queries run on; defaults to
+            ``db.session``.
+    """
+
+    name = None
+
+    def __init__(self, bind=None):
+        self.bind = bind if bind is not None else db.session
+
+    def _page(self, terms, limit, offset, kind, category):
+        """Returns ranked ``(kind, id, rank)`` rows for one page."""
+        raise NotImplementedError
+
+    def _facet_rows(self, terms):
+        """Returns ``(kind, category, count)`` rows for every match."""
+        raise NotImplementedError
+
+    def rank(self, query, limit=None, offset=0, kind=None, category=None):
+        """Ranks matching documents.
+
+        Args:
+            query (str): The user's search text.
+            limit (int, optional): The maximum number of results.
+            offset (int): The number of results to skip.
+            kind (str, optional): Restricts results to ``'book'`` or ``'article'``.
+            category (str, optional): Restricts results to one category.
+
+        Returns:
+            list: ``(kind, id, rank)`` tuples, best match first.
+        """
+        terms = query_terms(query)
+        if not terms:
+            return []
+        return self._page(terms, limit, offset, kind, category)
+
+    def facets(self, query, kind=None, category=None):
+        """Counts every match by content type and by category.
+
+        Args:
+            query (str): The user's search text.
+            kind (str, optional): The content type filter applied to results.
+            category (str, optional): The category filter applied to results.
+
+        Returns:
+            tuple: ``({'type': Counter, 'category': Counter}, total)`` where
+            ``total`` counts the matches passing the filters.
+        """
+        facets = {'type': Counter(), 'category': Counter()}
+        total = 0
+        terms = query_terms(query)
+        for row_kind, row_category, count in (self._facet_rows(terms) if terms else ()):
+            facets['type'][row_kind] += count
+            facets['category'][row_category] += count
+            if kind in (None, row_kind) and category in (None, row_category):
+                total += count
+        return facets, total
+
+    def search(self, query, limit=10, offset=0, kind=None, category=None):
+        """Returns one page of loaded results with snippets and facet counts.
+
+        Articles are loaded with the summary projection, never their body.
+
+        Returns:
+            SearchPage: The page's :class:`SearchHit` tuples, the number of
+            results matching the filters and the facet counts.
+        """
+        rows = self.rank(query, limit, offset, kind, category)
+        facets, total = self.facets(query, kind, category)
+        snippets = self._snippets(rows, query_terms(query))
+
+        loaded = {}
+        for model_kind, model in _models().items():
+            ids = [doc_id for row_kind, doc_id, _ in rows if row_kind == model_kind]
+            if not ids:
+                continue
+            items = model.summary_query() if hasattr(model, 'summary_query') else model.query
+            loaded.update({(model_kind, item.id): item for item in items.filter(model.id.in_(ids))})
+        hits = [SearchHit(row_kind, loaded[(row_kind, doc_id)], score,
+                          highlight(snippets.get((row_kind, doc_id))))
+                for row_kind, doc_id, score in rows if (row_kind, doc_id) in loaded]
+        return SearchPage(hits, total, facets)
+
+    def _snippets(self, rows, terms):
+        """Cuts snippets from the original body text of the given rows only."""
+        snippets = {}
+        for kind, (table, columns) in _SOURCES.items():
+            ids = [doc_id for row_kind, doc_id, _ in rows if row_kind == kind]
+            if not ids:
+                continue
+            statement = text(
+                f'SELECT id, {_body_expression(columns)} FROM {table} WHERE id IN :ids'
+            ).bindparams(bindparam('ids', expanding=True))
+            for doc_id, body in self.bind.execute(statement, {'ids': ids}):
+                snippets[(kind, doc_id)] = make_snippet(body, terms)
+        return snippets
+
+    def rebuild(self):
+        """Rebuilds any index the backend maintains outside the content tables."""
+
+
+class PostgresSearchBackend(SearchBackend):
+    """Ranks with ``ts_rank`` over the trigger-maintained tsvector columns."""
+
+    name = 'postgresql'
+
+    # The columns are already normalized and stemmed, so no dictionary is applied
+    _HITS = f"""
+        WITH q AS (SELECT plainto_tsquery('simple', :query) AS query),
+        hits AS (
+            SELECT 'book' AS kind, book.id, COALESCE(book.category, '{DEFAULT_CATEGORY}') AS category,
+                   ts_rank(book.__ts_vector__, q.query) AS rank
+            FROM book, q WHERE book.__ts_vector__ @@ q.query
+            UNION ALL
+            SELECT 'article', article.id, COALESCE(article.category, '{DEFAULT_CATEGORY}'),
+                   ts_rank(article.__ts_vector__, q.query)
+            FROM article, q WHERE article.__ts_vector__ @@ q.query
+        )
+    """
+    def _page(self, terms, limit, offset, kind, category):
+        params = {'query': ' '.join(terms), 'kind': kind, 'category': category, 'offset': offset}
+        sql = self._HITS + (
+            'SELECT kind, id, rank FROM hits '
+            'WHERE (:kind IS NULL OR kind = :kind) AND (:category IS NULL OR category = :category) '
+            'ORDER BY rank DESC, kind, id'
+        )
+        if limit:
+            sql += ' LIMIT :limit'
+            params['limit'] = limit
+        sql += ' OFFSET :offset'
+        rows = self.bind.execute(text(sql), params)
+        return [(row[0], row[1], float(row[2])) for row in rows]
+
+    def _facet_rows(self, terms):
+        sql = self._HITS + 'SELECT kind, category, count(*) FROM hits GROUP BY kind, category'
+        return list(self.bind.execute(text(sql), {'query': ' '.join(terms)}))
+
+
+class SQLiteFTSBackend(SearchBackend):
+    """Ranks with ``bm25`` over the ``search_index`` FTS5 table."""
+
+    name = 'sqlite'
+
+    _JOINS = (
+        'LEFT JOIN book ON search_index.rowid % 2 = 0 AND book.id = search_index.rowid / 2 '
+        'LEFT JOIN article ON search_index.rowid % 2 = 1 AND article.id = search_index.rowid / 2 '
+    )
+    _CATEGORY = f"COALESCE(book.category, article.category, '{DEFAULT_CATEGORY}')"
+
+    @staticmethod
+    def match_expression(terms):
+        """Converts analyzed terms into an FTS5 query matching every term.
+
+        Each term is quoted, so FTS5 operators typed by users are treated
+        as plain text.
+        """
+        return ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+    def _page(self, terms, limit, offset, kind, category):
+        params = {'query': self.match_expression(terms), 'offset': offset}
+        sql = 'SELECT search_index.rowid, rank FROM search_index '
+        conditions = ['search_index MATCH :query']
+        if kind is not None:
+            conditions.append('search_index.rowid % 2 = :code')
+            params['code'] = _KIND_CODES.get(kind, -1)
+        if category is not None:
+            # Only the category filter needs the content tables
+            sql += self._JOINS
+            conditions.append(f'{self._CATEGORY} = :category')
+            params['category'] = category
+        sql += 'WHERE ' + ' AND '.join(conditions) + ' ORDER BY rank'
+        sql += ' LIMIT :limit OFFSET :offset' if limit else ' LIMIT -1 OFFSET :offset'
+        if limit:
+            params['limit'] = limit
+        rows = self.bind.execute(text(sql), params)
+        # FTS5 ranks are bm25 scores, which are negative with the best match lowest
+        return [(_CODE_KINDS[rowid % 2], rowid // 2, -score) for rowid, score in rows]
+
+    def _facet_rows(self, terms):
+        sql = (
+            f'SELECT search_index.rowid % 2 AS code, {self._CATEGORY} AS facet_category, count(*) '
+            f'FROM search_index {self._JOINS}'
+            'WHERE search_index MATCH :query GROUP BY code, facet_category'
+        )
+        rows = self.bind.execute(text(sql), {'query': self.match_expression(terms)})
+        return [(_CODE_KINDS[code], row_category, count) for code, row_category, count in rows]
+
+    def rebuild(self):
+        for statement in _SQLITE_REBUILD:
+            self.bind.execute(text(statement))
+
+
+_BACKENDS = {
+    PostgresSearchBackend.name: PostgresSearchBackend,
+    SQLiteFTSBackend.name: SQLiteFTSBackend,
+}
+
+
+def get_search_backend(bind=None):
+    """Returns the search backend for the application's database dialect.
+
+    Raises:
+        RuntimeError: If the dialect has no search backend.
+    """
+    dialect = db.engine.dialect.name
+    if dialect not in _BACKENDS:
+        raise RuntimeError(f'No search backend for the {dialect} dialect')
+    return _BACKENDS[dialect](bind)
+
+
+# --- SQLite FTS5 schema ---
+# The indexed text is already normalized; combining marks (Mn) stay inside
+# tokens so any that slip through do not split words
+_SQLITE_CREATE_INDEX = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "title, body, tokenize=\"unicode61 remove_diacritics 2 categories 'L* N* Co Mn'\")"
+)
+
+# Makes ORDER BY rank use the weighted bm25 so FTS5 can stop at the LIMIT
+_SQLITE_CONFIGURE_RANK = (
+    f"INSERT INTO search_index(search_index, rank) VALUES ('rank', 'bm25({_TITLE_WEIGHT}, {_BODY_WEIGHT})')"
+)
+
+_SEARCH_COLUMNS = ('normalized_title', 'normalized_body')
+
+
+def _sqlite_triggers():
+    """Returns statements (re)creating the triggers that keep the index in sync.
+
+    Triggers are dropped first so a changed definition replaces the old one.
+    """
+    statements = []
+    for kind, (table, _) in _SOURCES.items():
+        code = _KIND_CODES[kind]
+        insert = (f'INSERT INTO search_index(rowid, title, body) '
+                  f'VALUES (new.id * 2 + {code}, new.normalized_title, new.normalized_body);')
+        delete = f'DELETE FROM search_index WHERE rowid = old.id * 2 + {code};'
+        for name in ('insert', 'update', 'delete'):
+            statements.append(f'DROP TRIGGER IF EXISTS {table}_search_{name}')
+        statements += [
+            f'CREATE TRIGGER {table}_search_insert AFTER INSERT ON {table} '
+            f'BEGIN {insert} END',
+            f'CREATE TRIGGER {table}_search_update AFTER UPDATE OF {", ".join(_SEARCH_COLUMNS)} ON {table} '
+            f'BEGIN {delete} {insert} END',
+            f'CREATE TRIGGER {table}_search_delete AFTER DELETE ON {table} '
+            f'BEGIN {delete} END',
+        ]
+    return statements
+
+
+def _sqlite_rebuild_statements():
+    statements = ['DELETE FROM search_index']
+    for kind, (table, _) in _SOURCES.items():
+        statements.append(
+            f'INSERT INTO search_index(rowid, title, body) '
+            f'SELECT id * 2 + {_KIND_CODES[kind]}, {", ".join(_SEARCH_COLUMNS)} FROM {table}'
+        )
+    return statements
+
+
+_SQLITE_REBUILD = _sqlite_rebuild_statements()
+
+
+def iter_documents(bind=None):
+    """Yields every document's normalized ``(kind, id, title, body)``.
+
+    Args:
+        bind: The session or connection to read from; defaults to
+            ``db.session``.
+    """
+    bind = bind if bind is not None else db.session
+    for kind, (table, _) in _SOURCES.items():
+        rows = bind.execute(text(f'SELECT id, {", ".join(_SEARCH_COLUMNS)} FROM {table}'))
+        for doc_id, doc_title, doc_body in rows:
+            yield kind, doc_id, doc_title, doc_body
+
+
+def index_documents(connection, documents):
+    """Builds a standalone FTS5 index from ``(kind, id, title, body)`` tuples.
+
+    Used to rank a copy of another database's content with
+    :class:`SQLiteFTSBackend`, e.g. for relevance comparisons.
+    """
+    connection.execute(text(_SQLITE_CREATE_INDEX))
+    connection.execute(text(_SQLITE_CONFIGURE_RANK))
+    rows = [{'rowid': doc_id * 2 + _KIND_CODES[kind], 'title': title, 'body': body}
+            for kind, doc_id, title, body in documents]
+    if rows:
+        connection.execute(text('INSERT INTO search_index(rowid, title, body) VALUES (:rowid, :title, :body)'), rows)
+
+
+def create_sqlite_index(connection, populate=True):
+    """Creates the FTS5 table and its sync triggers on a SQLite connection.
+
+    Args:
+        connection: A SQLAlchemy connection to a SQLite database that
+            already has the ``book`` and ``article`` tables.
+        populate (bool): Whether to index rows that already exist when the
+            FTS5 table is first created.
+    """
+    existed = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'search_index'"
+    )).first() is not None
+    connection.execute(text(_SQLITE_CREATE_INDEX))
+    connection.execute(text(_SQLITE_CONFIGURE_RANK))
+    for statement in _sqlite_triggers():
+        connection.execute(text(statement))
+    # Tables created before the normalized columns existed are indexed by
+    # the schema upgrade instead (see install_search_triggers)
+    columns = {column['name'] for column in inspect(connection).get_columns('book')}
+    if populate and not existed and set(_SEARCH_COLUMNS) <= columns:
+        for statement in _SQLITE_REBUILD:
+            connection.execute(text(statement))
+
+
+def install_search_triggers(connection):
+    """Installs the current index triggers for the connection's dialect.
+
+    Existing triggers are replaced, so this is safe to run again after the
+    indexed columns change.
+    """
+    if connection.dialect.name == 'sqlite':
+        create_sqlite_index(connection, populate=False)
+    elif connection.dialect.name == 'postgresql':
+        import models
+
+        for name in ('book_trigger_sql', 'article_trigger_sql'):
+            if hasattr(models, name):
+                connection.execute(getattr(models, name))
+
+
+def reindex_documents(session=None):
+    """Recomputes every document's normalized text through the current triggers.
+
+    Used after the normalization rules or the indexed columns change; the
+    index triggers pick up each rewritten row.
+    """
+    session = session if session is not None else db.session
+    install_search_triggers(session.connection())
+    from models import update_search_text
+
+    for model in _models().values():
+        for item in model.query.all():
+            update_search_text(item)
+        session.flush()
+    for table, _ in _SOURCES.values():
+        # Rewriting the column fires the triggers even for unchanged text
+        session.execute(text(f'UPDATE {table} SET normalized_title = normalized_title'))
+
+
+@event.listens_for(db.metadata, 'after_create')
+def _create_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        create_sqlite_index(connection)
+
+
+@event.listens_for(db.metadata, 'before_drop')
+def _drop_search_index(target, connection, **kw):
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text('DROP TABLE IF EXISTS search_index'))
@@ -0,0 +1,115 @@
+"""
+Benchmarks the search backends and compares their rankings.
+
+Every query runs against the configured database's search backend and
+against an in-memory SQLite FTS5 index built from the same books and
+articles. The script reports latency per backend and how far the two
+rankings agree, which flags relevance regressions when switching backends.
+
+Usage:
+    python search_benchmark.py [--repeat N] [--k K] QUERY [QUERY ...]
+"""
+import argparse
+import statistics
+import time
+
+from sqlalchemy import create_engine
+
+
+def time_queries(backend, queries, repeat=20):
+    """Measures how long ``backend.rank`` takes for each query.
+
+    Args:
+        backend: A search backend.
+        queries (list[str]): The queries to run.
+        repeat (int): How many times each query is run.
+
+    Returns:
+        dict: Median, 95th percentile and maximum latency in milliseconds.
+    """
+    samples = []
+    for query in queries:
+        for _ in range(repeat):
+            start = time.perf_counter()
+            backend.rank(query)
+            samples.append((time.perf_counter() - start) * 1000)
+    if not samples:
+        return {'median_ms': 0.0, 'p95_ms': 0.0, 'max_ms': 0.0}
+    samples.sort()
+    return {
+        'median_ms': statistics.median(samples),
+        'p95_ms': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        'max_ms': samples[-1],
+    }
+
+
+def overlap_at_k(ranked_a, ranked_b, k=10):
+    """Returns the Jaccard overlap of two rankings' top ``k`` documents.
+
+    Args:
+        ranked_a (list): ``(kind, id, rank)`` tuples from one backend.
+        ranked_b (list): ``(kind, id, rank)`` tuples from another backend.
+        k (int): How many top results to compare.
+
+    Returns:
+        float: 1.0 when both top-k sets match (or both are empty), 0.0 when
+        they share nothing.
+    """
+    top_a = {(kind, doc_id) for kind, doc_id, _ in ranked_a[:k]}
+    top_b = {(kind, doc_id) for kind, doc_id, _ in ranked_b[:k]}
+    if not top_a and not top_b:
+        return 1.0
+    return len(top_a & top_b) / len(top_a | top_b)
+
+
+def compare_backends(primary, reference, queries, k=10):
+    """Compares the rankings two backends produce for each query.
+
+    Returns:
+        list: One dict per query with its result counts, top-k overlap and
+        whether both backends agree on the best match.
+    """
+    report = []
+    for query in queries:
+        ranked_a, ranked_b = primary.rank(query), reference.rank(query)
+        report.append({
+            'query': query,
+            'primary_hits': len(ranked_a),
+            'reference_hits': len(ranked_b),
+            'overlap': overlap_at_k(ranked_a, ranked_b, k),
+            'same_top': ranked_a[:1] and ranked_b[:1] and ranked_a[0][:2] == ranked_b[0][:2],
+        })
+    return report
+
+
+def main():
+    """Runs the benchmark from the command line."""
+    from app import create_app
+    from search import SQLiteFTSBackend, get_search_backend, index_documents, iter_documents
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('queries', nargs='+', help='search queries to run')
+    parser.add_argument('--repeat', type=int, default=20, help='runs per query for timing')
+    parser.add_argument('--k', type=int, default=10, help='top results compared for parity')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        primary = get_search_backend()
+        engine = create_engine('sqlite://')
+        with engine.begin() as connection:
+            index_documents(connection, iter_documents())
+        with engine.connect() as connection:
+            reference = SQLiteFTSBackend(connection)
+            for backend in (primary, reference):
+                stats = time_queries(backend, args.queries, args.repeat)
+                print(f'{backend.name:>10}: median {stats["median_ms"]:.3f} ms, '
+                      f'p95 {stats["p95_ms"]:.3f} ms, max {stats["max_ms"]:.3f} ms')
+            print()
+            for row in compare_backends(primary, reference, args.queries, args.k):
+                print(f'{row["query"]!r}: {row["primary_hits"]} vs {row["reference_hits"]} hits, '
+                      f'overlap@{args.k} {row["overlap"]:.2f}, same top: {bool(row["same_top"])}')
+
+
+if __name__ == '__main__':
+    main()
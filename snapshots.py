@@ -0,0 +1,80 @@
+"""
+Pre-rendered, pre-compressed JSON snapshots of public collections.
+
+A snapshot holds one collection response encoded once as JSON and
+compressed with gzip and, when the optional ``brotli`` package is installed,
+Brotli. Snapshots live in the content cache and are rebuilt on the first
+read after the collection changes, so serving a request is a dictionary
+lookup plus a byte copy.
+
+Each encoded body is a different representation, so its strong ETag must
+differ too: :func:`coding_etag` appends the content coding to the ETag of
+the collection. Codings are negotiated against the snapshot being served,
+since one built by a worker without ``brotli`` has no Brotli body.
+"""
+import gzip
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+
+def build_snapshot(payload):
+    """Encodes a payload and precomputes its compressed variants.
+
+    Args:
+        payload (dict): The JSON-serializable response body.
+
+    Returns:
+        dict: Maps each content coding (``'identity'``, ``'gzip'`` and,
+        if available, ``'br'``) to the encoded bytes.
+    """
+    body = current_app.json.dumps(payload).encode('utf-8')
+    snapshot = {
+        'identity': body,
+        'gzip': gzip.compress(body, compresslevel=9, mtime=0),
+    }
+    if brotli is not None:
+        snapshot['br'] = brotli.compress(body, quality=11)
+    return snapshot
+
+
+def negotiate_coding(snapshot):
+    """Returns the content coding to serve the current request with.
+
+    Args:
+        snapshot (dict): The snapshot to be served; only its codings are offered.
+
+    Returns:
+        str | None: ``'br'`` or ``'gzip'``, or None for the identity coding.
+    """
+    offered = [coding for coding in ('br', 'gzip') if coding in snapshot]
+    return request.accept_encodings.best_match(offered, default=None)
+
+
+def coding_etag(etag, coding):
+    """Derives the ETag of one encoded representation from the collection's ETag."""
+    return f'{etag}-{coding}' if coding else etag
+
+
+def snapshot_response(snapshot, coding=None):
+    """Builds a JSON response from a snapshot using the given coding.
+
+    Args:
+        snapshot (dict): A snapshot produced by :func:`build_snapshot`.
+        coding (str, optional): The coding from :func:`negotiate_coding`;
+            None serves the identity body.
+
+    Returns:
+        Response: The response carrying the encoded body.
+    """
+    response = current_app.response_class(
+        snapshot[coding or 'identity'], mimetype='application/json'
+    )
+    if coding:
+        response.headers['Content-Encoding'] = coding
+    response.vary.add('Accept-Encoding')
+    return response
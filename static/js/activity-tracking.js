@@ -82,40 +82,80 @@ function setupGalleryActivityTracking() {
 function trackLoginActivity() {
     if (sessionStorage.getItem('logged_in_this_session')) return;
 
-    fetch('/api/auth-status')
-        .then(response => response.json())
-        .then(data => {
-            if (data.authenticated) {
-                recordActivity('login');
-                sessionStorage.setItem('logged_in_this_session', 'true');
-            }
-        })
-        .catch(error => console.error('Error checking authentication status:', error));
+    isAuthenticated().then(authenticated => {
+        if (authenticated) {
+            recordActivity('login');
+            sessionStorage.setItem('logged_in_this_session', 'true');
+        }
+    });
+}
+
+const ACTIVITY_ENDPOINT = '/api/user/record-activity';
+const ACTIVITY_SEND_DELAY = 2000;
+const ACTIVITY_MAX_BATCH = 100;
+
+let pendingActivities = [];
+let activitySendTimer = null;
+let authStatusRequest = null;
+
+/**
+ * Checks once per page whether the visitor is logged in.
+ * @returns {Promise<boolean>} Whether activities should be recorded.
+ */
+function isAuthenticated() {
+    if (!authStatusRequest) {
+        authStatusRequest = fetch('/api/auth-status')
+            .then(response => response.json())
+            .then(data => Boolean(data.authenticated))
+            .catch(() => false);
+    }
+    return authStatusRequest;
 }
 
 /**
- * Sends an activity record to the server API.
+ * Queues an activity record; queued records are sent to the server in batches.
  * @param {string} activityType - The type of activity (e.g., 'view_book').
  * @param {number} [contentId] - The ID of the related content.
  * @param {string} [contentType] - The type of the related content (e.g., 'book').
  * @param {string} [contentTitle] - The title of the related content.
  */
 async function recordActivity(activityType, contentId, contentType, contentTitle) {
-    try {
-        const authResponse = await fetch('/api/auth-status');
-        const authData = await authResponse.json();
-        if (!authData.authenticated) return;
-
-        await fetch('/api/user/record-activity', {
-            method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ activity_type: activityType, content_id: contentId, content_type: contentType, content_title: contentTitle })
-        });
-        console.log(`Activity recorded: ${activityType}`);
-    } catch (error) {
-        console.error('Error recording activity:', error);
+    if (!(await isAuthenticated())) return;
+
+    pendingActivities.push({ activity_type: activityType, content_id: contentId, content_type: contentType, content_title: contentTitle });
+    if (pendingActivities.length >= ACTIVITY_MAX_BATCH) {
+        sendActivities();
+    } else if (!activitySendTimer) {
+        activitySendTimer = setTimeout(sendActivities, ACTIVITY_SEND_DELAY);
     }
 }
 
+/**
+ * Sends the queued activity records in one request.
+ * @param {boolean} [unloading] - Uses a beacon, which survives leaving the page.
+ */
+function sendActivities(unloading = false) {
+    clearTimeout(activitySendTimer);
+    activitySendTimer = null;
+    while (pendingActivities.length) {
+        const body = JSON.stringify({ events: pendingActivities.splice(0, ACTIVITY_MAX_BATCH) });
+        if (unloading && navigator.sendBeacon) {
+            navigator.sendBeacon(ACTIVITY_ENDPOINT, new Blob([body], { type: 'application/json' }));
+        } else {
+            fetch(ACTIVITY_ENDPOINT, {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body,
+                keepalive: true
+            }).catch(error => console.error('Error recording activity:', error));
+        }
+    }
+}
+
+document.addEventListener('visibilitychange', () => {
+    if (document.visibilityState === 'hidden') sendActivities(true);
+});
+window.addEventListener('pagehide', () => sendActivities(true));
+
 // Initialize tracking when the DOM is loaded.
 document.addEventListener('DOMContentLoaded', setupActivityTracking);
\ No newline at end of file
@@ -69,11 +69,21 @@ function renderArticles(articles) {
     });
 
     document.querySelectorAll('.read-more').forEach(button => {
-        button.addEventListener('click', (e) => {
+        button.addEventListener('click', async (e) => {
             e.preventDefault();
             const articleId = e.target.dataset.articleId;
             const article = articles.find(a => a.id == articleId);
-            if (article) openArticleModal(article);
+            if (!article) return;
+            // The list only carries summaries; load the full body on demand
+            if (article.content === undefined) {
+                try {
+                    const response = await fetch(`/api/articles/${articleId}`);
+                    if (response.ok) Object.assign(article, (await response.json()).article);
+                } catch (error) {
+                    console.error('Error loading article:', error);
+                }
+            }
+            openArticleModal(article);
         });
     });
 
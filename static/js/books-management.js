@@ -134,6 +134,53 @@ async function handleBookFormSubmit(e) {
     }
 }
 
+/**
+ * Uploads a book PDF in chunks through a resumable upload session.
+ * A failed chunk is retried from the offset the server reports, so slow or
+ * flaky connections resume instead of starting over.
+ * @param {File} file - The PDF file to upload.
+ * @param {function(number):void} [onProgress] - Receives the uploaded fraction.
+ * @returns {Promise<Object>} The completed upload, including its file_url.
+ */
+async function uploadPdfInChunks(file, onProgress) {
+    const created = await fetch('/api/upload/book-pdf/sessions', {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ filename: file.name, size: file.size })
+    });
+    const session = await created.json();
+    if (!created.ok) throw new Error(session.error);
+    const sessionUrl = created.headers.get('Location');
+    let offset = session.upload.offset;
+    let failures = 0;
+
+    while (offset < file.size) {
+        try {
+            const chunk = file.slice(offset, offset + session.chunk_size);
+            const response = await fetch(`${sessionUrl}?offset=${offset}`, {
+                method: 'PUT',
+                headers: { 'Content-Type': 'application/octet-stream' },
+                body: chunk
+            });
+            const result = await response.json();
+            if (!response.ok && response.status !== 409) throw new Error(result.error);
+            offset = response.ok ? result.upload.offset : result.offset;
+            failures = 0;
+        } catch (error) {
+            if (++failures > 5) throw error;
+            await new Promise(resolve => setTimeout(resolve, 1000 * failures));
+            const status = await fetch(sessionUrl).then(response => response.json());
+            offset = status.upload.offset;
+        }
+        if (onProgress) onProgress(offset / file.size);
+    }
+
+    const completed = await fetch(`${sessionUrl}/complete`, { method: 'POST' });
+    const result = await completed.json();
+    if (!completed.ok) throw new Error(result.error);
+    return result;
+}
+
 /**
  * Handles file uploads for book covers and PDFs.
  * @param {Event} e - The file input change event.
@@ -149,6 +196,11 @@ async function handleFileUpload(e, type) {
     const previewId = type === 'cover' ? 'coverPreview' : null;
 
     try {
+        if (type === 'pdf') {
+            const result = await uploadPdfInChunks(file);
+            document.getElementById(inputId).value = result.file_url;
+            return;
+        }
         const response = await fetch(endpoint, { method: 'POST', body: formData });
         const result = await response.json();
         if (response.ok) {
@@ -44,7 +44,7 @@ function renderBooks(books, container) {
                     <a href="/books#book-${book.id}" class="btn btn-primary">
                         <i class="fas fa-eye"></i> عرض التفاصيل
                     </a>
-                    <a href="${book.download}" class="btn btn-secondary" target="_blank">
+                    <a href="${book.download_url || book.download}" class="btn btn-secondary" target="_blank">
                         <i class="fas fa-download"></i> تحميل الكتاب
                     </a>
                 </div>
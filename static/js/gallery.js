@@ -3,6 +3,23 @@
  * @description Fetches and displays gallery images, with a simple lightbox effect.
  */
 
+/**
+ * Builds the markup of a grid image, letting the browser pick the smallest
+ * derivative in the best supported format when the API provides them.
+ * @param {Object} image - An image object from the API.
+ * @param {string} loading - The image's loading attribute.
+ * @returns {string} A <picture> element, or a plain <img> without derivatives.
+ */
+function responsiveImage(image, loading) {
+    const sizes = '(max-width: 600px) 100vw, (max-width: 1024px) 50vw, 33vw';
+    const img = `<img src="${image.url}" ${image.srcset ? `srcset="${image.srcset}" sizes="${sizes}"` : ''} alt="${image.caption}" loading="${loading}" data-full-src="${image.url}">`;
+    if (!image.sources || image.sources.length === 0) {
+        return img;
+    }
+    const sources = image.sources.map(source => `<source type="${source.type}" srcset="${source.srcset}" sizes="${sizes}">`);
+    return `<picture>${sources.join('')}${img}</picture>`;
+}
+
 /**
  * Renders gallery images into a grid container.
  * @param {Array<Object>} images - An array of image objects from the API.
@@ -19,7 +36,7 @@ function renderGallery(images, container) {
         const item = document.createElement('div');
         item.className = 'gallery-item';
         item.innerHTML = `
-            <img src="${image.url}" alt="${image.caption}" loading="${index < 3 ? 'eager' : 'lazy'}" data-full-src="${image.url}">
+            ${responsiveImage(image, index < 3 ? 'eager' : 'lazy')}
             <div class="gallery-caption">${image.caption}</div>`;
         item.addEventListener('click', (e) => openLightbox(e.currentTarget.querySelector('img')));
         container.appendChild(item);
@@ -158,6 +158,42 @@ function setupLoginButton() {
     }
 }
 
+/**
+ * Fills the header search box's suggestion list while the user types.
+ * Requests are debounced, and responses for outdated input are ignored.
+ */
+function setupSearchSuggestions() {
+    const input = document.querySelector('.search-form input[name="q"]');
+    const list = document.getElementById('search-suggestions');
+    if (!input || !list) {
+        return;
+    }
+    let timer = null;
+    input.addEventListener('input', () => {
+        clearTimeout(timer);
+        const query = input.value.trim();
+        if (!query) {
+            list.innerHTML = '';
+            return;
+        }
+        timer = setTimeout(() => {
+            fetch(`/api/search/suggest?q=${encodeURIComponent(query)}`)
+                .then(response => response.json())
+                .then(data => {
+                    if (data.query !== input.value.trim()) {
+                        return;
+                    }
+                    list.replaceChildren(...data.suggestions.map(suggestion => {
+                        const option = document.createElement('option');
+                        option.value = suggestion.title;
+                        return option;
+                    }));
+                })
+                .catch(error => console.error('Search suggestions error:', error));
+        }, 150);
+    });
+}
+
 /**
  * Main DOMContentLoaded event listener.
  * Initializes all the site's functionalities.
@@ -168,4 +204,5 @@ document.addEventListener('DOMContentLoaded', function () {
     setupSmoothScrolling();
     setupHeaderScrollEffect();
     setupContactForm();
+    setupSearchSuggestions();
 });
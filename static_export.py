@@ -0,0 +1,226 @@
+"""
+Static export of the public site.
+
+``flask export-static OUTPUT`` renders the public pages, the JSON
+collections and every book, article and gallery item into a directory that
+a plain file server or CDN can serve. Responses are produced by the real
+views through the test client, so exported files match what the app serves.
+The static folder is copied alongside them.
+
+Exports are incremental. The output directory keeps a state file with the
+time of the last export, each table's collection version and a signature
+of every exported file. A collection and its items are only re-rendered when
+the table changed, and then only the items updated since the last export.
+Items that no longer exist are removed. Files whose content is unchanged
+are never rewritten, so their modification times and CDN copies stay
+valid.
+
+Pages are written as ``<path>/index.html`` and JSON as
+``<path>/index.json``. The file server should look up ``$uri``, then
+``$uri/index.html``, then ``$uri/index.json`` (nginx:
+``try_files $uri $uri/index.html $uri/index.json =404;``).
+"""
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime, timedelta
+
+import click
+
+from database import db
+from http_cache import collection_version
+from pagination import MAX_PAGE_SIZE
+
+STATE_FILE = '.export-state.json'
+
+PAGES = ('/', '/books', '/articles', '/gallery', '/responsive-gallery')
+
+# Rows committed while an export runs may carry an older updated_at, so each
+# export re-reads this window (as /api/sync does)
+EXPORT_OVERLAP = timedelta(seconds=5)
+
+
+def _collections():
+    """Lists the exported collections as ``(model, URL, response key, item URL prefix)``."""
+    from models import Article, Book, GalleryImage
+
+    return [
+        (Book, '/api/books', 'books', '/api/books/'),
+        (Article, '/api/articles', 'articles', '/api/articles/'),
+        (GalleryImage, '/api/gallery', 'images', '/api/gallery/'),
+    ]
+
+
+def output_path(url, extension):
+    """Maps a URL path to the file it is exported to, relative to the output directory."""
+    return '/'.join(part for part in (url.strip('/'), f'index.{extension}') if part)
+
+
+class StaticExporter:
+    """Writes the public site into a directory, reusing the previous export.
+
+    Args:
+        app: The Flask application to render.
+        output (str): The export directory.
+        full (bool): Ignores the previous export and renders everything.
+    """
+
+    def __init__(self, app, output, full=False):
+        self.app = app
+        self.output = output
+        self.client = app.test_client()
+        self.state = {} if full else self._load_state()
+        self.files = self.state.get('files', {})
+        self.written = []
+        self.removed = []
+
+    def _load_state(self):
+        try:
+            with open(os.path.join(self.output, STATE_FILE), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, exported_at, versions):
+        self.state = {'exported_at': exported_at.isoformat(), 'versions': versions, 'files': self.files}
+        self._write_file(STATE_FILE, json.dumps(self.state, indent=2, sort_keys=True).encode('utf-8'))
+
+    def _write_file(self, relative, data):
+        path = os.path.join(self.output, *relative.split('/'))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    def write(self, relative, data):
+        """Writes an exported file unless it already holds the same content."""
+        digest = hashlib.sha256(data).hexdigest()
+        if self.files.get(relative) == digest and os.path.exists(os.path.join(self.output, relative)):
+            return False
+        self._write_file(relative, data)
+        self.files[relative] = digest
+        self.written.append(relative)
+        return True
+
+    def remove(self, relative):
+        """Deletes an exported file and forgets it."""
+        path = os.path.join(self.output, *relative.split('/'))
+        if os.path.exists(path):
+            os.remove(path)
+            self.removed.append(relative)
+        self.files.pop(relative, None)
+
+    def render(self, url):
+        """Fetches a URL from the application.
+
+        Raises:
+            click.ClickException: If the view does not answer 200.
+        """
+        response = self.client.get(url)
+        try:
+            if response.status_code != 200:
+                raise click.ClickException(f'{url} returned {response.status_code}')
+            return response.get_data()
+        finally:
+            response.close()
+
+    def export_collection(self, model, url, key, item_prefix, since):
+        """Exports a collection and the items updated since ``since``.
+
+        The collection is exported whole, following its cursors, with
+        ``next_cursor`` left empty since a static server cannot paginate.
+        """
+        items, cursor = [], None
+        while True:
+            query = f'{url}?limit={MAX_PAGE_SIZE}' + (f'&cursor={cursor}' if cursor else '')
+            page = json.loads(self.render(query))
+            items.extend(page[key])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.write(output_path(url, 'json'), json.dumps({key: items, 'next_cursor': None},
+                                                        ensure_ascii=False).encode('utf-8'))
+
+        query = db.session.query(model.id)
+        if since is not None:
+            query = query.filter(model.updated_at >= since)
+        for (item_id,) in query:
+            self.write(output_path(f'{item_prefix}{item_id}', 'json'), self.render(f'{item_prefix}{item_id}'))
+
+        existing = {output_path(f'{item_prefix}{item_id}', 'json') for (item_id,) in db.session.query(model.id)}
+        existing.add(output_path(url, 'json'))
+        prefix = item_prefix.strip('/') + '/'
+        for relative in [name for name in self.files if name.startswith(prefix)]:
+            if relative not in existing:
+                self.remove(relative)
+
+    def copy_static(self):
+        """Copies new or modified static files and removes deleted ones.
+
+        Files are compared by size and modification time, which the copy
+        preserves.
+        """
+        source = self.app.static_folder
+        seen = set()
+        for folder, dirnames, filenames in os.walk(source):
+            dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+            for filename in filenames:
+                if filename.startswith('.') or filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(folder, filename)
+                relative = 'static/' + os.path.relpath(path, source).replace(os.sep, '/')
+                stat = os.stat(path)
+                signature = f'{stat.st_size}:{int(stat.st_mtime)}'
+                seen.add(relative)
+                target = os.path.join(self.output, *relative.split('/'))
+                if self.files.get(relative) == signature and os.path.exists(target):
+                    continue
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copy2(path, target)
+                self.files[relative] = signature
+                self.written.append(relative)
+        for relative in [name for name in self.files if name.startswith('static/') and name not in seen]:
+            self.remove(relative)
+
+    def run(self):
+        """Runs the export.
+
+        Returns:
+            StaticExporter: The exporter, whose ``written`` and ``removed``
+            list the files that changed.
+        """
+        exported_at = datetime.utcnow()
+        last_export = self.state.get('exported_at')
+        since = datetime.fromisoformat(last_export) - EXPORT_OVERLAP if last_export else None
+        previous_versions = self.state.get('versions', {})
+        versions = {}
+
+        with self.app.app_context():
+            for url in PAGES:
+                self.write(output_path(url, 'html'), self.render(url))
+            self.write('service-worker.js', self.render('/service-worker.js'))
+
+            for model, url, key, item_prefix in _collections():
+                last_modified, count = collection_version(model)
+                version = [last_modified.isoformat() if last_modified else None, count]
+                versions[model.__tablename__] = version
+                if previous_versions.get(model.__tablename__) == version and since is not None:
+                    continue
+                self.export_collection(model, url, key, item_prefix, since)
+
+            self.copy_static()
+            self._save_state(exported_at, versions)
+        return self
+
+
+def init_static_export(app):
+    """Registers the ``flask export-static`` command."""
+
+    @app.cli.command('export-static')
+    @click.argument('output', type=click.Path(file_okay=False))
+    @click.option('--full', is_flag=True, help='Render everything instead of only what changed.')
+    def export_static_command(output, full):
+        """Exports the public pages and JSON APIs to OUTPUT."""
+        exporter = StaticExporter(app, output, full=full).run()
+        click.echo(f'{len(exporter.written)} files written, {len(exporter.removed)} removed in {output}')
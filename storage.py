@@ -0,0 +1,313 @@
+"""
+Content-addressed storage for uploaded files.
+
+Uploads are hashed with SHA-256 while they are copied to disk and stored
+as ``<hash>.<ext>`` in their uploads folder, so the same file uploaded twice
+is kept once and its URL never changes meaning. That makes the URLs safe to
+cache forever (see :func:`is_immutable_path`).
+
+A blob is referenced by the Book, Article and GalleryImage columns listed
+in :data:`UPLOAD_COLUMNS`. When a commit deletes a row or replaces one of
+those URLs, the blobs it pointed to are released: if no row references
+them any more, the file and its image derivatives are removed.
+
+Blobs released within :data:`RELEASE_GRACE_SECONDS` of being written are
+kept at that point. The ``sweep_uploads`` job, also run with
+``flask sweep-uploads``, removes every unreferenced blob older than the
+grace period; schedule it, e.g. daily.
+"""
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from itertools import chain
+
+import click
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, inspect, or_, select
+from sqlalchemy.orm import Session
+
+from database import db
+from jobs import task
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+UPLOADS_URL = '/static/uploads/'
+
+# Upload URL columns per table
+UPLOAD_COLUMNS = {
+    'book': ('cover', 'download', 'preview'),
+    'article': ('image',),
+    'gallery_image': ('url',),
+}
+
+# Blobs written this recently are kept even when unreferenced, so a record
+# being created for a just-uploaded (or re-uploaded) file never loses it
+RELEASE_GRACE_SECONDS = 3600
+
+_CONTENT_ADDRESSED = re.compile(r'^[0-9a-f]{64}\.[a-z0-9]+$')
+_IMMUTABLE_PATH = re.compile(r'^/static/uploads/[^/]+/(variants/)?[0-9a-f]{64}(-\d+)?\.[a-z0-9]+$')
+
+
+def is_immutable_path(path):
+    """Tells whether a request path names a content-addressed upload or derivative."""
+    return bool(_IMMUTABLE_PATH.match(path))
+
+
+def store_upload(stream, folder, extension):
+    """Copies an upload to disk under the SHA-256 of its content.
+
+    The data is hashed while it is written to a temporary file in the
+    target folder, then renamed into place, so the whole file is never held
+    in memory and readers never see a partial blob.
+
+    Args:
+        stream: A binary file-like object positioned at the start.
+        folder (str): The uploads folder to store the blob in.
+        extension (str): The file extension, without the dot.
+
+    Returns:
+        tuple: ``(filename, created)`` where ``created`` is False when an
+        identical blob was already stored.
+    """
+    os.makedirs(folder, exist_ok=True)
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(dir=folder, prefix='.upload-', delete=False) as temporary:
+        for chunk in iter(lambda: stream.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+            temporary.write(chunk)
+    return commit_blob(temporary.name, folder, digest.hexdigest(), extension)
+
+
+def commit_blob(temporary_path, folder, hexdigest, extension):
+    """Moves a fully written temporary file to its content-addressed name.
+
+    Returns:
+        tuple: ``(filename, created)`` as for :func:`store_upload`.
+    """
+    os.makedirs(folder, exist_ok=True)
+    filename = f'{hexdigest}.{extension.lower()}'
+    target = os.path.join(folder, filename)
+    if os.path.exists(target):
+        os.remove(temporary_path)
+        # Restart the grace period so a pending release keeps the blob
+        os.utime(target)
+        return filename, False
+    os.replace(temporary_path, target)
+    return filename, True
+
+
+def write_chunk(path, offset, stream, limit):
+    """Writes a chunk of a resumable upload to its partial file.
+
+    Anything after ``offset`` is discarded first, so a chunk interrupted
+    mid-transfer can simply be sent again. The chunk is copied from the
+    stream in small blocks and never held in memory as a whole.
+
+    Args:
+        path (str): The partial file.
+        offset (int): Where the chunk starts in the file.
+        stream: A binary file-like object with the chunk's bytes.
+        limit (int): The most bytes the chunk may contain.
+
+    Returns:
+        int: The number of bytes written.
+
+    Raises:
+        ValueError: If the chunk is longer than ``limit``; nothing of it is kept.
+    """
+    written = 0
+    with open(path, 'r+b' if os.path.exists(path) else 'w+b') as f:
+        f.truncate(offset)
+        f.seek(offset)
+        for block in iter(lambda: stream.read(CHUNK_SIZE), b''):
+            written += len(block)
+            if written > limit:
+                f.truncate(offset)
+                raise ValueError('Chunk exceeds the declared upload size')
+            f.write(block)
+    return written
+
+
+def hash_file(path):
+    """Returns the SHA-256 hex digest of a file, read in blocks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _upload_folder():
+    if has_app_context():
+        return current_app.config.get('UPLOAD_FOLDER', 'static/uploads')
+    return 'static/uploads'
+
+
+def _blob_path(url):
+    """Maps a content-addressed upload URL to its file, or None for other URLs."""
+    if not url or not url.startswith(UPLOADS_URL):
+        return None
+    parts = url[len(UPLOADS_URL):].split('/')
+    if len(parts) != 2 or not _CONTENT_ADDRESSED.match(parts[1]):
+        return None
+    return os.path.join(_upload_folder(), *parts)
+
+
+def reference_count(connection, url):
+    """Counts the rows that reference an upload URL."""
+    from models import Article, Book, GalleryImage
+
+    models = {'book': Book, 'article': Article, 'gallery_image': GalleryImage}
+    filename = url.rsplit('/', 1)[-1]
+    total = 0
+    for table, columns in UPLOAD_COLUMNS.items():
+        model = models[table]
+        # Rows may store the full URL or just the file name
+        condition = or_(*(getattr(model, column).endswith(filename, autoescape=True) for column in columns))
+        total += connection.execute(select(func.count()).select_from(model).where(condition)).scalar()
+    return total
+
+
+def release_uploads(urls):
+    """Deletes the blobs among ``urls`` that no row references any more.
+
+    Returns:
+        list: The URLs whose files were removed.
+    """
+    removed = []
+    with db.engine.connect() as connection:
+        for url in sorted(set(urls)):
+            path = _blob_path(url)
+            if path is None or not os.path.exists(path):
+                continue
+            if time.time() - os.path.getmtime(path) < RELEASE_GRACE_SECONDS:
+                continue
+            if reference_count(connection, url):
+                continue
+            _remove_blob(path)
+            removed.append(url)
+    return removed
+
+
+def _remove_blob(path):
+    from images import remove_variants
+    from pdfs import remove_info
+
+    os.remove(path)
+    remove_variants(path)
+    remove_info(path)
+
+
+def referenced_filenames(connection):
+    """Returns the file names of every upload a row references."""
+    from models import Article, Book, GalleryImage
+
+    models = {'book': Book, 'article': Article, 'gallery_image': GalleryImage}
+    filenames = set()
+    for table, columns in UPLOAD_COLUMNS.items():
+        model = models[table]
+        for row in connection.execute(select(*(getattr(model, column) for column in columns))):
+            filenames.update(value.rsplit('/', 1)[-1] for value in row if value)
+    return filenames
+
+
+def sweep_uploads(folder=None):
+    """Deletes the blobs no row references that are past the grace period.
+
+    Catches the blobs :func:`release_uploads` kept because they were
+    released too soon after being written. Must be called inside an
+    application context.
+
+    Args:
+        folder (str, optional): The uploads folder; defaults to
+            ``UPLOAD_FOLDER``.
+
+    Returns:
+        list: The paths of the removed files.
+    """
+    folder = folder or _upload_folder()
+    with db.engine.connect() as connection:
+        referenced = referenced_filenames(connection)
+    removed = []
+    cutoff = time.time() - RELEASE_GRACE_SECONDS
+    for subfolder in sorted(os.listdir(folder)) if os.path.isdir(folder) else []:
+        if not os.path.isdir(os.path.join(folder, subfolder)):
+            continue
+        for filename in sorted(os.listdir(os.path.join(folder, subfolder))):
+            path = os.path.join(folder, subfolder, filename)
+            if not _CONTENT_ADDRESSED.match(filename) or filename in referenced:
+                continue
+            if os.path.getmtime(path) >= cutoff:
+                continue
+            _remove_blob(path)
+            removed.append(path)
+    return removed
+
+
+@task('sweep_uploads', max_attempts=1)
+def sweep_uploads_task():
+    """Deletes unreferenced blobs in the background."""
+    return {'removed': len(sweep_uploads())}
+
+
+def init_storage(app):
+    """Registers the ``flask sweep-uploads`` command."""
+
+    @app.cli.command('sweep-uploads')
+    def sweep_uploads_command():
+        """Deletes uploaded files that no book, article or image uses."""
+        click.echo(f'Removed {len(sweep_uploads())} unreferenced uploads')
+
+
+# --- Releasing blobs on commit ---
+def _load_replaced_url(target, value, oldvalue, initiator):
+    """Does nothing; registering it makes assignments load the replaced value."""
+
+
+def track_upload_columns(model):
+    """Keeps the previous URL in the history when a model's upload columns change.
+
+    Without active history, assigning to an expired attribute would not
+    load the old value, and its blob could never be released.
+    """
+    for column in UPLOAD_COLUMNS[model.__tablename__]:
+        event.listen(getattr(model, column), 'set', _load_replaced_url, active_history=True)
+
+
+def _released_urls(session):
+    return session.info.setdefault('released_uploads', set())
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_released_urls(session, flush_context):
+    """Remembers upload URLs that deleted or updated rows stopped referencing."""
+    for obj in chain(session.deleted, session.dirty):
+        columns = UPLOAD_COLUMNS.get(getattr(obj, '__tablename__', None), ())
+        state = inspect(obj)
+        for column in columns:
+            attribute = state.attrs[column]
+            # Deleted rows release their current URL, updated rows the replaced one
+            values = [attribute.loaded_value] if obj in session.deleted else attribute.history.deleted
+            _released_urls(session).update(value for value in values if isinstance(value, str))
+
+
+@event.listens_for(Session, 'after_commit')
+def _release_committed_urls(session):
+    """Frees blobs the committed transaction left without references."""
+    urls = session.info.pop('released_uploads', None)
+    if not urls or not has_app_context():
+        return
+    try:
+        release_uploads(urls)
+    except Exception:
+        logger.exception('Failed to release uploads %s', sorted(urls))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_released_urls(session):
+    """Forgets releases from a rolled back transaction."""
+    session.info.pop('released_uploads', None)
@@ -0,0 +1,220 @@
+"""
+In-memory prefix index for search-as-you-type suggestions.
+
+Book and article titles and their categories are normalized with
+:func:`arabic.normalize` and kept in a sorted list of terms, so a prefix
+lookup is a binary search followed by a short scan. Each title is indexed
+as a whole and word by word, with and without its definite article, so
+typing any word of a title suggests it.
+
+The index lives in each worker's memory. Before answering, at most once
+per ``refresh_interval`` seconds, it compares the content cache's versions
+of the book and article tables (see ``cache.py``) with those it last saw,
+so edits committed by any worker or process are noticed without querying
+the database on every keystroke. When they changed, only the rows updated
+since the last refresh and the deletions recorded as tombstones are
+re-read, without a full rebuild.
+"""
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy.orm import load_only
+
+from arabic import TOKEN_PATTERN, normalize, strip_prefixes
+from database import db
+
+# Suggestion kinds, in the order they are listed for equally good matches
+_KIND_ORDER = {'book': 0, 'article': 1, 'category': 2}
+
+# How a term was derived from its document, best match first
+_WHOLE_TITLE, _TITLE_WORD = 0, 1
+
+# Rows committed while a refresh runs may carry an older updated_at, so each
+# refresh re-reads this window (as /api/sync does)
+REFRESH_OVERLAP = timedelta(seconds=5)
+
+# Bounds the work per lookup for very short prefixes
+_MAX_SCANNED_TERMS = 200
+
+
+def _normalize_prefix(text):
+    return ' '.join(normalize(text).split())
+
+
+def _title_terms(title):
+    """Returns ``(term, match)`` pairs indexing a title as a whole and by word."""
+    normalized = _normalize_prefix(title)
+    terms = {(normalized, _WHOLE_TITLE)}
+    for word in TOKEN_PATTERN.findall(normalized):
+        terms.add((word, _TITLE_WORD))
+        terms.add((strip_prefixes(word), _TITLE_WORD))
+    return terms
+
+
+class PrefixIndex:
+    """A sorted-array prefix index of titles and categories.
+
+    Documents are ``(kind, id)`` pairs; categories are indexed once however
+    many documents use them.
+
+    Args:
+        refresh_interval (float): Seconds :meth:`refresh` trusts the index
+            before comparing table versions again.
+    """
+
+    def __init__(self, refresh_interval=1.0):
+        self.refresh_interval = refresh_interval
+        self._checked_at = None
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._terms = []
+        self._documents = {}
+        self._categories = {}
+        self._versions = None
+        self._synced_at = None
+
+    def __len__(self):
+        return len(self._documents)
+
+    def _insert(self, key, terms):
+        for term, match in terms:
+            insort(self._terms, (term, match, key))
+
+    def _delete(self, key, terms):
+        for term, match in terms:
+            position = bisect_left(self._terms, (term, match, key))
+            if position < len(self._terms) and self._terms[position] == (term, match, key):
+                del self._terms[position]
+
+    def _add_category(self, category):
+        if not category:
+            return
+        count = self._categories.get(category, 0)
+        self._categories[category] = count + 1
+        if not count:
+            self._insert(('category', category), {(_normalize_prefix(category), _WHOLE_TITLE)})
+
+    def _remove_category(self, category):
+        if not category:
+            return
+        count = self._categories.pop(category, 0) - 1
+        if count > 0:
+            self._categories[category] = count
+        elif count == 0:
+            self._delete(('category', category), {(_normalize_prefix(category), _WHOLE_TITLE)})
+
+    def _discard(self, key):
+        document = self._documents.pop(key, None)
+        if document is not None:
+            title, category, terms = document
+            self._delete(key, terms)
+            self._remove_category(category)
+
+    def add(self, kind, doc_id, title, category=None):
+        """Indexes a document, replacing any previous version of it."""
+        key = (kind, doc_id)
+        terms = _title_terms(title)
+        with self._lock:
+            self._discard(key)
+            self._documents[key] = (title, category, terms)
+            self._insert(key, terms)
+            self._add_category(category)
+
+    def remove(self, kind, doc_id):
+        """Removes a document from the index if present."""
+        with self._lock:
+            self._discard((kind, doc_id))
+
+    def suggest(self, prefix, limit=8):
+        """Returns the documents and categories whose terms start with ``prefix``.
+
+        Whole-title matches come before matches on a later word, then
+        shorter titles before longer ones.
+
+        Args:
+            prefix (str): The text typed so far.
+            limit (int): The maximum number of suggestions.
+
+        Returns:
+            list[dict]: Suggestions with ``type``, ``title`` and, for books
+            and articles, ``id``.
+        """
+        prefix = _normalize_prefix(prefix)
+        if not prefix:
+            return []
+        best = {}
+        with self._lock:
+            position = bisect_left(self._terms, (prefix,))
+            for term, match, key in self._terms[position:position + _MAX_SCANNED_TERMS]:
+                if not term.startswith(prefix):
+                    break
+                best[key] = min(match, best.get(key, match))
+            titles = {key: key[1] if key[0] == 'category' else self._documents[key][0] for key in best}
+
+        ranked = sorted(best, key=lambda key: (best[key], len(titles[key]), _KIND_ORDER[key[0]], titles[key]))
+        suggestions = []
+        for kind, doc_id in ranked[:limit]:
+            suggestion = {'type': kind, 'title': titles[(kind, doc_id)]}
+            if kind != 'category':
+                suggestion['id'] = doc_id
+            suggestions.append(suggestion)
+        return suggestions
+
+    def refresh(self):
+        """Brings the index up to date with committed content.
+
+        Must be called inside an application context. Does nothing within
+        ``refresh_interval`` seconds of the last check. Concurrent refreshes
+        wait for each other, so the rows of one are never applied twice.
+
+        Returns:
+            PrefixIndex: The index itself, for chaining.
+        """
+        from models import Article, Book, Tombstone
+
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.refresh_interval:
+            return self
+        self._checked_at = now
+        models = (('book', Book), ('article', Article))
+        cache = current_app.extensions['content_cache']
+        versions = tuple(cache.version(model.__tablename__) for _, model in models)
+        if versions == self._versions:
+            return self
+        with self._refresh_lock:
+            if versions == self._versions:
+                return self
+            since = self._synced_at - REFRESH_OVERLAP if self._synced_at else None
+            synced_at = datetime.utcnow()
+
+            for kind, model in models:
+                query = model.query.options(load_only(model.id, model.title, model.category))
+                if since is not None:
+                    query = query.filter(model.updated_at >= since)
+                    for (record_id,) in db.session.query(Tombstone.record_id).filter(
+                        Tombstone.table_name == model.__tablename__, Tombstone.deleted_at >= since
+                    ):
+                        self.remove(kind, record_id)
+                for item in query:
+                    self.add(kind, item.id, item.title, item.category)
+
+            self._versions = versions
+            self._synced_at = synced_at
+        return self
+
+
+def init_suggest_index(app):
+    """Creates the application's suggestion index and registers it as an extension.
+
+    The index is filled on the first refresh. ``SUGGEST_REFRESH_INTERVAL``
+    sets the seconds between its checks for changed content.
+
+    Returns:
+        PrefixIndex: The index instance.
+    """
+    index = PrefixIndex(app.config.get('SUGGEST_REFRESH_INTERVAL', 1.0))
+    app.extensions['suggest_index'] = index
+    return index
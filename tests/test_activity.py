@@ -0,0 +1,117 @@
+import json
+import os
+import shutil
+import tempfile
+import time
+import unittest
+import sys
+
+# Add the parent directory to the sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from activity import ActivityBuffer
+from app import create_app
+from database import db
+from models import User, UserActivity
+from rollups import user_statistics
+
+
+class ActivityIngestionTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up a logged-in user and a buffer that only flushes when told to."""
+        self.app = create_app('testing')
+        self.buffer = self.app.extensions['activity_buffer']
+        self.buffer.flush_interval = 60
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            user = User(username='reader', email='reader@example.com')
+            user.set_password('password')
+            db.session.add(user)
+            db.session.commit()
+            self.user_id = user.id
+        self.client.post('/login', data=json.dumps({'username': 'reader', 'password': 'password'}),
+                         content_type='application/json')
+
+    def tearDown(self):
+        """Stop the buffer and tear down the database."""
+        self.buffer.stop()
+        with self.app.app_context():
+            db.drop_all()
+
+    def post(self, body):
+        return self.client.post('/api/user/record-activity', data=json.dumps(body), content_type='application/json')
+
+    def stored(self):
+        with self.app.app_context():
+            return UserActivity.query.order_by(UserActivity.id).all()
+
+    def test_events_are_buffered_then_written_together(self):
+        """Test that single and batched events are accepted and written on flush."""
+        response = self.post({'activity_type': 'view_book', 'content_id': '3', 'content_type': 'book',
+                              'content_title': 'كتاب'})
+        self.assertEqual(response.status_code, 202)
+        response = self.post({'events': [{'activity_type': 'view_article', 'content_id': 4},
+                                         {'activity_type': 'view_gallery', 'metadata': {'page': 2}}]})
+        self.assertEqual(response.get_json(), {'accepted': 2})
+        self.assertEqual(self.stored(), [])
+
+        self.assertEqual(self.buffer.flush(), 3)
+        activities = self.stored()
+        self.assertEqual([a.activity_type for a in activities], ['view_book', 'view_article', 'view_gallery'])
+        self.assertEqual(activities[0].content_id, 3)
+        self.assertEqual(activities[0].user_id, self.user_id)
+        self.assertEqual(activities[2].activity_data, {'page': 2})
+
+    def test_full_batch_is_flushed_in_the_background(self):
+        """Test that reaching the batch size wakes the flushing thread."""
+        self.buffer.batch_size = 3
+        self.post([{'activity_type': 'view_book'}] * 3)
+        deadline = time.monotonic() + 5
+        while self.buffer.pending() and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(len(self.stored()), 3)
+
+    def test_invalid_events_are_rejected(self):
+        """Test that malformed or oversized batches are refused whole."""
+        self.assertEqual(self.post({'content_id': 1}).status_code, 400)
+        self.assertEqual(self.post([{'activity_type': 'view_book', 'content_id': 'x'}]).status_code, 400)
+        self.assertEqual(self.post([{'activity_type': 'view_book'}] * 101).status_code, 400)
+        self.assertEqual(self.buffer.pending(), 0)
+
+    def test_spooled_events_are_written_once(self):
+        """Test that events spooled by a running buffer are not replayed by that buffer."""
+        spool = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool)
+        buffer = ActivityBuffer(self.app, flush_interval=60, spool_folder=spool)
+        buffer.add(self.user_id, [{'activity_type': 'view_book', 'content_id': 1, 'content_type': 'book',
+                                   'content_title': None, 'activity_data': None}])
+        self.assertEqual(buffer.pending(), 1)
+        buffer.stop()
+        self.assertEqual([a.content_id for a in self.stored()], [1])
+        with self.app.app_context():
+            self.assertEqual(user_statistics(self.user_id)['books_viewed'], 1)
+        self.assertEqual(os.listdir(spool), [])
+
+    def test_spooled_events_survive_a_crash(self):
+        """Test that events spooled by a process that did not flush are replayed."""
+        spool = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, spool)
+        crashed = ActivityBuffer(self.app, spool_folder=spool)
+        crashed.add(self.user_id, [{'activity_type': 'view_book', 'content_id': 1, 'content_type': None,
+                                    'content_title': None, 'activity_data': None}])
+        # The process dies: its thread stops and its memory is lost
+        crashed._stopping.set()
+        crashed._wakeup.set()
+        crashed._pending.clear()
+
+        replacement = ActivityBuffer(self.app, spool_folder=spool)
+        replacement.start()
+        self.assertEqual(replacement.pending(), 1)
+        replacement.stop()
+        self.assertEqual([a.content_id for a in self.stored()], [1])
+        self.assertEqual(os.listdir(spool), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,7 +1,10 @@
+import gzip
 import os
 import unittest
 import sys
 import json
+from datetime import datetime
+from unittest import mock
 
 # Add the parent directory to the sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
@@ -335,6 +338,115 @@ class AppTestCase(unittest.TestCase):
         self.assertEqual(len(data['books']), 1)
         self.assertEqual(data['books'][0]['title'], 'Test Book')
 
+    def test_get_books_api_pagination(self):
+        """Test keyset pagination of the GET /api/books endpoint."""
+        for i in range(4):
+            db.session.add(Book(
+                title=f'Paged Book {i}', language='English', category='Testing',
+                cover='cover.jpg', download='#', description='Paged.'
+            ))
+        db.session.commit()
+
+        seen = []
+        cursor = None
+        while True:
+            url = '/api/books?limit=2' + (f'&cursor={cursor}' if cursor else '')
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            data = response.get_json()
+            self.assertLessEqual(len(data['books']), 2)
+            seen.extend(book['id'] for book in data['books'])
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(seen, [5, 4, 3, 2, 1])
+
+    def test_get_books_api_invalid_cursor(self):
+        """Test that a malformed cursor is rejected."""
+        response = self.client.get('/api/books?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/books?limit=0')
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_articles_api_omits_content(self):
+        """Test that article lists carry summaries and the detail carries the body."""
+        response = self.client.get('/api/articles')
+        article = response.get_json()['articles'][0]
+        self.assertNotIn('content', article)
+        self.assertEqual(article['summary'], 'A summary of the test article.')
+
+        response = self.client.get('/api/articles?fields=content')
+        self.assertEqual(response.status_code, 400)
+
+        response = self.client.get(f"/api/articles/{article['id']}")
+        self.assertEqual(response.get_json()['article']['content'], 'The full content of the test article.')
+
+    def test_get_articles_api_sparse_fields(self):
+        """Test sparse field selection on the GET /api/articles endpoint."""
+        response = self.client.get('/api/articles?fields=title,image')
+        self.assertEqual(response.status_code, 200)
+        article = response.get_json()['articles'][0]
+        self.assertEqual(set(article), {'id', 'title', 'image'})
+
+        response = self.client.get('/api/articles?fields=title,secret')
+        self.assertEqual(response.status_code, 400)
+
+    def test_get_books_api_conditional(self):
+        """Test ETag revalidation of the GET /api/books endpoint."""
+        response = self.client.get('/api/books')
+        etag = response.headers['ETag']
+        self.assertIn('public', response.headers['Cache-Control'])
+        self.assertIsNotNone(response.headers.get('Last-Modified'))
+
+        response = self.client.get('/api/books', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+        self.login('editor', 'editorpassword')
+        self.client.put('/api/books/1', data=json.dumps(dict(title='Edited')), content_type='application/json')
+        response = self.client.get('/api/books', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_get_gallery_api_compressed(self):
+        """Test that list snapshots are served gzip-encoded on request."""
+        response = self.client.get('/api/gallery', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        data = json.loads(gzip.decompress(response.data))
+        self.assertEqual(data['images'][0]['caption'], 'A test gallery image.')
+
+        gzip_etag = response.headers['ETag']
+
+        response = self.client.get('/api/gallery')
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(len(response.get_json()['images']), 1)
+        self.assertNotEqual(response.headers['ETag'], gzip_etag)
+        response = self.client.get('/api/gallery', headers={'If-None-Match': gzip_etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_get_gallery_api_unavailable_coding(self):
+        """Test that a coding missing from the cached snapshot is not named in the ETag."""
+        # Built by a worker without brotli, then served by one with it
+        with mock.patch('snapshots.brotli', None):
+            identity_etag = self.client.get('/api/gallery').headers['ETag']
+        with mock.patch('snapshots.brotli', mock.Mock()):
+            response = self.client.get('/api/gallery', headers={'Accept-Encoding': 'br'})
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertEqual(response.headers['ETag'], identity_etag)
+        self.assertEqual(len(response.get_json()['images']), 1)
+
+    def test_get_book_api_conditional(self):
+        """Test ETag revalidation of the GET /api/books/<book_id> endpoint."""
+        response = self.client.get('/api/books/1')
+        response = self.client.get('/api/books/1', headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    def test_pages_are_not_stored(self):
+        """Test that routes without a cache policy stay no-store."""
+        response = self.client.get('/api/auth-status')
+        self.assertIn('no-store', response.headers['Cache-Control'])
+
     def test_get_book_api(self):
         """Test the GET /api/books/<book_id> endpoint."""
         response = self.client.get('/api/books/1')
@@ -472,6 +584,31 @@ class AppTestCase(unittest.TestCase):
         data = response.get_json()
         self.assertEqual(data['message'], 'Image deleted')
 
+    def test_sync_api(self):
+        """Test the GET /api/sync endpoint."""
+        response = self.client.get('/api/sync')
+        self.assertEqual(response.status_code, 200)
+        data = response.get_json()
+        self.assertEqual(len(data['books']['changed']), 1)
+        self.assertNotIn('content', data['articles']['changed'][0])
+
+        # Age every row so only the edits below count as recent
+        for model in (Book, Article, GalleryImage):
+            model.query.update({'updated_at': datetime(2000, 1, 1)})
+        db.session.commit()
+
+        self.login('editor', 'editorpassword')
+        self.client.put('/api/books/1', data=json.dumps(dict(title='Synced')), content_type='application/json')
+        self.client.delete('/api/articles/1')
+
+        data = self.client.get('/api/sync?since=2001-01-01T00:00:00Z').get_json()
+        self.assertEqual([book['title'] for book in data['books']['changed']], ['Synced'])
+        self.assertEqual(data['articles'], {'changed': [], 'deleted': [1]})
+        self.assertEqual(data['gallery'], {'changed': [], 'deleted': []})
+
+        response = self.client.get('/api/sync?since=yesterday')
+        self.assertEqual(response.status_code, 400)
+
     def test_submit_contact_api(self):
         """Test the POST /api/contact endpoint."""
         response = self.client.post('/api/contact', data=json.dumps(dict(
@@ -0,0 +1,42 @@
+import os
+import unittest
+import sys
+
+# Add the parent directory to the sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from arabic import analyze, index_text, normalize, stem
+
+
+class ArabicNormalizationTestCase(unittest.TestCase):
+    def test_normalize_removes_diacritics_and_tatweel(self):
+        """Test that tashkeel and tatweel are removed."""
+        self.assertEqual(normalize('مُصْطَفَى الطّـحّان'), 'مصطفي الطحان')
+
+    def test_normalize_unifies_letter_variants(self):
+        """Test that alef, taa marbuta, alef maqsura and hamza variants are unified."""
+        self.assertEqual(normalize('أإآٱ ة ى ؤ ئ'), 'اااا ه ي و ي')
+        self.assertEqual(normalize(None), '')
+
+    def test_stem_strips_light_affixes(self):
+        """Test that common prefixes and suffixes are stripped."""
+        self.assertEqual(stem('والاسلام'), 'اسلام')
+        self.assertEqual(stem('بالمدرسه'), 'مدرس')
+        self.assertEqual(stem('المسلمون'), 'مسلم')
+        self.assertEqual(stem('كتابها'), 'كتاب')
+        # Short words and words without Arabic letters are kept
+        self.assertEqual(stem('ال'), 'ال')
+        self.assertEqual(stem('hello'), 'hello')
+
+    def test_variants_share_terms(self):
+        """Test that spelling variants of a word analyze to the same term."""
+        self.assertEqual(analyze('الإسلاميّة'), analyze('الاسلامية'))
+        self.assertEqual(analyze('الإسلامية'), analyze('الإسلامي'))
+
+    def test_index_text_ignores_markup(self):
+        """Test that HTML tags are not indexed."""
+        self.assertEqual(index_text('<p>الدعوة</p>', 'Fiqh'), 'دعو fiqh')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+
+# Add the parent directory to the sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import assets
+from app import create_app
+
+STATIC = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'static')
+
+
+class MinifyTestCase(unittest.TestCase):
+    def test_minify_js_keeps_literals(self):
+        """Test that comments go while strings, templates and regexes stay intact."""
+        source = (
+            "// leading comment\n"
+            "const url = 'https://example.com/*x*/'; /* block */\n"
+            "const html = `<a href=\"${item.url || `//${host}`}\">  // text</a>`;\n"
+            "const quote = text.replace(/'/g, \"\\\\'\").split(/\\/\\//);\n"
+            "let n = a / b / c;\n"
+            "return\n"
+            "value\n"
+        )
+        result = assets.minify_js(source)
+        self.assertNotIn('leading comment', result)
+        self.assertNotIn('block', result)
+        self.assertIn("'https://example.com/*x*/'", result)
+        self.assertIn('`<a href="${item.url || `//${host}`}">  // text</a>`', result)
+        self.assertIn("replace(/'/g,\"\\\\'\").split(/\\/\\//)", result)
+        self.assertIn('n=a/b/c;', result)
+        self.assertIn('return\nvalue', result)
+
+    def test_minify_css_rewrites_relative_urls(self):
+        """Test that whitespace and comments go and relative URLs become absolute."""
+        source = "/* theme */\n.hero {\n  background: url('../img/hero.jpg');\n  color: red;\n}\n.a :hover { margin: 0 auto; }"
+        self.assertEqual(assets.minify_css(source, 'css/style.css'),
+                         ".hero{background:url('/static/img/hero.jpg');color:red}.a :hover{margin:0 auto}")
+
+
+class BuildTestCase(unittest.TestCase):
+    def setUp(self):
+        """Copy the stylesheets and scripts into a temporary static folder."""
+        self.static_folder = tempfile.mkdtemp()
+        for kind in ('css', 'js'):
+            shutil.copytree(os.path.join(STATIC, kind), os.path.join(self.static_folder, kind))
+
+    def tearDown(self):
+        shutil.rmtree(self.static_folder)
+
+    def built(self):
+        folder = os.path.join(self.static_folder, 'dist', 'js')
+        return sorted(name for name in os.listdir(folder) if name.startswith('main.'))
+
+    def test_build_fingerprints_bundles(self):
+        """Test that every asset and bundle is built under a content hash."""
+        manifest = assets.build_assets(self.static_folder)
+        self.assertTrue(assets.is_fingerprinted(f"/static/{manifest['js/main.js']}"))
+        self.assertIn('js/home.js', manifest)
+        self.assertNotIn('js/service-worker.js', manifest)
+        self.assertEqual(assets.load_manifest(self.static_folder), manifest)
+
+        with open(os.path.join(self.static_folder, 'dist', 'service-worker.js'), encoding='utf-8') as f:
+            worker = f.read()
+        self.assertNotIn('tahhan-site-cache-v2', worker)
+        self.assertIn(f"'/static/{manifest['js/home.js']}'", worker)
+
+    def test_rebuild_only_replaces_changed_files(self):
+        """Test that unchanged files keep their name and old builds are pruned."""
+        first = assets.build_assets(self.static_folder)
+        self.assertEqual(assets.build_assets(self.static_folder), first)
+
+        with open(os.path.join(self.static_folder, 'js', 'main.js'), 'a', encoding='utf-8') as f:
+            f.write('\nconsole.log("changed");\n')
+        second = assets.build_assets(self.static_folder)
+        self.assertNotEqual(second['js/main.js'], first['js/main.js'])
+        self.assertEqual(second['js/books.js'], first['js/books.js'])
+        # The previous build stays for pages rendered before the deployment
+        self.assertEqual(len(self.built()), 2)
+
+        with open(os.path.join(self.static_folder, 'js', 'main.js'), 'a', encoding='utf-8') as f:
+            f.write('console.log("again");\n')
+        assets.build_assets(self.static_folder)
+        self.assertEqual(len(self.built()), 2)
+        self.assertNotIn(os.path.basename(first['js/main.js']), self.built())
+
+    def test_templates_use_manifest(self):
+        """Test that pages link built assets, which are cached forever."""
+        manifest = assets.build_assets(self.static_folder)
+        app = create_app('testing')
+        app.static_folder = self.static_folder
+        client = app.test_client()
+        with app.test_request_context():
+            self.assertEqual(assets.asset_urls('js/home.js')[0], '/static/js/scroll-animations.js')
+            app.extensions['assets'] = manifest
+            self.assertEqual(assets.asset_url('css/style.css'), f"/static/{manifest['css/style.css']}")
+            self.assertEqual(assets.asset_urls('js/home.js'), [f"/static/{manifest['js/home.js']}"])
+
+        response = client.get(f"/static/{manifest['js/main.js']}")
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+        response.close()
+        response = client.get('/service-worker.js')
+        self.assertEqual(response.mimetype, 'application/javascript')
+        self.assertIn(manifest['js/main.js'], response.get_data(as_text=True))
+        response.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
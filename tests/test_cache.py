@@ -0,0 +1,141 @@
+import os
+import unittest
+import sys
+import time
+from datetime import datetime
+
+# Add the parent directory to the sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import delete, event, insert, update
+
+from app import create_app
+from cache import ContentCache, LocalSharedClient, MemoryBackend, SharedBackend
+from database import db
+from models import Book, Tombstone
+
+
+class CacheBackendTestCase(unittest.TestCase):
+    def test_memory_backend_evicts_least_recently_used(self):
+        """Test that the memory backend keeps at most max_entries entries."""
+        backend = MemoryBackend(max_entries=2)
+        backend.set('a', 1)
+        backend.set('b', 2)
+        backend.get('a')
+        backend.set('c', 3)
+        self.assertEqual(backend.get('a'), 1)
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('c'), 3)
+
+    def test_memory_backend_expires_entries(self):
+        """Test that entries are not served after their TTL."""
+        backend = MemoryBackend()
+        backend.set('a', 1, ttl=0.01)
+        time.sleep(0.02)
+        self.assertIsNone(backend.get('a'))
+
+    def test_invalidation_with_both_backends(self):
+        """Test that invalidating a tag hides entries built from it."""
+        for backend in (MemoryBackend(), SharedBackend(LocalSharedClient())):
+            with self.subTest(backend=type(backend).__name__):
+                cache = ContentCache(backend)
+                calls = []
+                compute = lambda: calls.append(1) or len(calls)
+                self.assertEqual(cache.get_or_set('key', ('book',), compute), 1)
+                self.assertEqual(cache.get_or_set('key', ('book',), compute), 1)
+                cache.invalidate('article')
+                self.assertEqual(cache.get_or_set('key', ('book',), compute), 1)
+                cache.invalidate('book')
+                self.assertEqual(cache.get_or_set('key', ('book',), compute), 2)
+
+
+class CacheInvalidationTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up a test client and a test database."""
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+
+    def tearDown(self):
+        """Tear down the database."""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def add_book(self, title):
+        db.session.add(Book(
+            title=title, language='English', category='Testing',
+            cover='cover.jpg', download='#', description='Cached.'
+        ))
+        db.session.commit()
+
+    def test_commit_invalidates_cached_list(self):
+        """Test that committing a Book refreshes the cached /api/books payload."""
+        self.add_book('First')
+        self.assertEqual(len(self.client.get('/api/books').get_json()['books']), 1)
+        self.add_book('Second')
+        self.assertEqual(len(self.client.get('/api/books').get_json()['books']), 2)
+
+    def test_other_processes_writes_are_seen(self):
+        """Test that the in-process cache notices commits it did not make once its check interval passes."""
+        cache = self.app.extensions['content_cache']
+        self.add_book('First')
+        self.add_book('Deleted')
+        self.assertEqual(len(self.client.get('/api/books').get_json()['books']), 2)
+        # Another worker's commits never bump this process's counters
+        with db.engine.begin() as connection:
+            connection.execute(insert(Book.__table__).values(
+                title='Second', language='English', category='Testing', cover='cover.jpg', download='#',
+                description='Elsewhere.'))
+        self.assertEqual(len(self.client.get('/api/books').get_json()['books']), 2)
+        cache.check_interval = 0
+        self.assertEqual(len(self.client.get('/api/books').get_json()['books']), 3)
+
+        # Deletions are seen through the tombstones they leave
+        with db.engine.begin() as connection:
+            connection.execute(delete(Book.__table__).where(Book.__table__.c.title == 'Deleted'))
+            connection.execute(insert(Tombstone.__table__).values(
+                table_name='book', record_id=2, deleted_at=datetime.utcnow()))
+        self.assertEqual(len(self.client.get('/api/books').get_json()['books']), 2)
+
+    def test_warm_reads_skip_the_database(self):
+        """Test that cached lists are served without queries within the check interval."""
+        self.add_book('First')
+        self.client.get('/api/books')
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            self.assertEqual(self.client.get('/api/books').status_code, 200)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(statements, [])
+
+    def test_bulk_update_invalidates(self):
+        """Test that UPDATE statements run through the session invalidate their table."""
+        self.add_book('First')
+        cache = self.app.extensions['content_cache']
+        before = cache.backend.counter('book')
+        db.session.execute(update(Book).values(title='Renamed'))
+        db.session.commit()
+        self.assertEqual(cache.backend.counter('book'), before + 1)
+
+    def test_rollback_keeps_cache(self):
+        """Test that rolled back changes do not invalidate the cache."""
+        cache = self.app.extensions['content_cache']
+        db.session.add(Book(
+            title='Discarded', language='English', category='Testing',
+            cover='cover.jpg', download='#', description='Rolled back.'
+        ))
+        db.session.flush()
+        db.session.rollback()
+        self.assertEqual(cache.backend.counter('book'), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
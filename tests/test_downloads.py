@@ -0,0 +1,123 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+
+# Add the parent directory to the sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from database import db
+from models import Book, Job
+from storage import store_upload
+
+PDF = b'%PDF-1.4\n' + bytes(range(256)) * 20
+
+
+class DownloadTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up a book whose PDF is stored in a temporary uploads folder."""
+        self.upload_folder = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['UPLOAD_FOLDER'] = self.upload_folder
+        self.counter = self.app.extensions['download_counter']
+        self.counter.flush_interval = 60
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        filename, _ = store_upload(io.BytesIO(PDF), os.path.join(self.upload_folder, 'books'), 'pdf')
+        self.book = Book(title='كتاب الدعوة', language='ar', category='دعوة', cover='c.jpg',
+                         download=f'/static/uploads/books/{filename}', description='d')
+        db.session.add(self.book)
+        db.session.commit()
+        self.url = f'/books/{self.book.id}/download'
+
+    def tearDown(self):
+        """Tear down the database and the uploads folder."""
+        self.counter.stop()
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.upload_folder)
+
+    def downloads(self):
+        self.counter.flush()
+        db.session.expire_all()
+        return db.session.get(Book, self.book.id).download_count
+
+    def test_download_sends_pdf_with_strong_etag(self):
+        """Test that the whole file is sent inline with a content-hash ETag."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, PDF)
+        self.assertEqual(response.mimetype, 'application/pdf')
+        self.assertEqual(response.headers['ETag'], f'"{hashlib.sha256(PDF).hexdigest()}"')
+        self.assertEqual(response.headers['Accept-Ranges'], 'bytes')
+        self.assertIn('inline', response.headers['Content-Disposition'])
+        self.assertIn("filename*=UTF-8''", response.headers['Content-Disposition'])
+        self.assertIn('must-revalidate', response.headers['Cache-Control'])
+
+        cached = self.client.get(self.url, headers={'If-None-Match': response.headers['ETag']})
+        self.assertEqual(cached.status_code, 304)
+        response.close()
+
+    def test_range_requests_return_partial_content(self):
+        """Test that ranges are answered with 206 and only the first one is counted."""
+        response = self.client.get(self.url, headers={'Range': 'bytes=0-99'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, PDF[:100])
+        self.assertEqual(response.headers['Content-Range'], f'bytes 0-99/{len(PDF)}')
+        self.assertIn('must-revalidate', response.headers['Cache-Control'])
+
+        response = self.client.get(self.url, headers={'Range': 'bytes=100-', 'If-Range': response.headers['ETag']})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.data, PDF[100:])
+        self.assertEqual(self.downloads(), 1)
+
+        response = self.client.get(self.url, headers={'Range': f'bytes={len(PDF) + 10}-'})
+        self.assertEqual(response.status_code, 416)
+
+    def test_downloads_are_counted_without_touching_updated_at(self):
+        """Test that counting leaves the book's modification time and cache alone."""
+        updated_at = self.book.updated_at
+        version = self.app.extensions['content_cache'].backend.counter('book')
+        for _ in range(3):
+            self.client.get(self.url).close()
+        self.client.head(self.url)
+        self.assertEqual(self.counter.pending(), 3)
+        self.assertEqual(Job.query.count(), 0)
+        self.assertEqual(self.downloads(), 3)
+        self.assertEqual(self.counter.pending(), 0)
+        self.assertEqual(db.session.get(Book, self.book.id).updated_at, updated_at)
+        self.assertEqual(self.app.extensions['content_cache'].backend.counter('book'), version)
+        self.assertEqual(self.client.get(f'/api/books/{self.book.id}').get_json()['book']['download_url'], self.url)
+
+    def test_accel_redirect_delegates_to_nginx(self):
+        """Test that a configured prefix hands the transfer to the front-end server."""
+        self.app.config['X_ACCEL_REDIRECT_PREFIX'] = '/protected-uploads/'
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, b'')
+        self.assertEqual(response.headers['X-Accel-Redirect'],
+                         '/protected-uploads/books/' + self.book.download.rsplit('/', 1)[-1])
+
+    def test_external_and_missing_downloads(self):
+        """Test that external links redirect and unsafe or missing files are not found."""
+        self.book.download = 'https://example.com/book.pdf'
+        db.session.commit()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(response.headers['Location'], 'https://example.com/book.pdf')
+
+        for download in ('#', '/static/uploads/../../app.py', '/static/uploads/books/missing.pdf'):
+            self.book.download = download
+            db.session.commit()
+            self.assertEqual(self.client.get(self.url).status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
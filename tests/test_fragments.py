@@ -0,0 +1,85 @@
+import os
+import unittest
+import sys
+
+# Add the parent directory to the sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import render_template_string
+from sqlalchemy import event
+
+from app import create_app
+from database import db
+from models import Article
+
+TEMPLATE = "{% cache 'greeting', deps=['article'] %}Hello {{ name }}{% endcache %} / {{ name }}"
+
+
+class FragmentCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up the application and an empty database."""
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+
+    def tearDown(self):
+        """Tear down the database."""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_fragment_is_reused_until_its_table_changes(self):
+        """Test that a cached fragment survives renders but not a commit to its deps."""
+        with self.app.test_request_context():
+            self.assertEqual(render_template_string(TEMPLATE, name='a'), 'Hello a / a')
+            # Only the part outside the block follows the context
+            self.assertEqual(render_template_string(TEMPLATE, name='b'), 'Hello a / b')
+
+            db.session.add(Article(title='t', summary='s', content='c'))
+            db.session.commit()
+            self.assertEqual(render_template_string(TEMPLATE, name='c'), 'Hello c / c')
+
+    def test_fragment_output_is_not_escaped_twice(self):
+        """Test that cached markup is inserted as is."""
+        template = "{% cache 'markup' %}<b>{{ text }}</b>{% endcache %}"
+        with self.app.test_request_context():
+            for _ in range(2):
+                self.assertEqual(render_template_string(template, text='<i>'), '<b>&lt;i&gt;</b>')
+
+    def test_invalid_options_are_rejected(self):
+        """Test that unknown options and untracked tables are errors."""
+        from jinja2 import TemplateSyntaxError
+
+        with self.app.test_request_context():
+            with self.assertRaises(TemplateSyntaxError):
+                render_template_string("{% cache 'x', tables=['article'] %}{% endcache %}")
+            with self.assertRaises(ValueError):
+                render_template_string("{% cache 'x', deps=['user'] %}{% endcache %}")
+
+    def test_index_lists_new_articles(self):
+        """Test that the home page's cached article cards follow edits."""
+        self.assertNotIn('مقال جديد', self.client.get('/').get_data(as_text=True))
+        db.session.add(Article(title='مقال جديد', summary='s', content='c', category='فكر'))
+        db.session.commit()
+        self.assertIn('مقال جديد', self.client.get('/').get_data(as_text=True))
+
+    def test_index_reuses_article_cards(self):
+        """Test that the home page is rendered each time without loading the cached articles."""
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        self.client.get('/')
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            self.assertEqual(self.client.get('/').status_code, 200)
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertFalse([s for s in statements if 'article' in s])
+
+
+if __name__ == '__main__':
+    unittest.main()
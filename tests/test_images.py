@@ -0,0 +1,108 @@
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+from datetime import datetime
+
+# Add the parent directory to the sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PIL import Image
+
+from app import create_app
+from database import db
+from images import generate_variants, manifest_path, process_upload, responsive_sources
+from models import GalleryImage
+
+
+class ImageVariantsTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up a temporary uploads folder and a test database."""
+        self.upload_folder = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.upload_folder, 'gallery'))
+        self.app = create_app('testing')
+        self.app.config['UPLOAD_FOLDER'] = self.upload_folder
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+
+    def tearDown(self):
+        """Tear down the database and the uploads folder."""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.upload_folder)
+
+    def save_image(self, filename, size, mode='RGB', image_format='JPEG'):
+        path = os.path.join(self.upload_folder, 'gallery', filename)
+        Image.new(mode, size, 'red').save(path, image_format)
+        return path
+
+    def test_generate_variants(self):
+        """Test that smaller widths are written in the original and modern formats."""
+        path = self.save_image('photo.jpg', (1000, 500))
+        manifest = generate_variants(path)
+        self.assertEqual((manifest['width'], manifest['height']), (1000, 500))
+        self.assertEqual(sorted(manifest['files']['image/jpeg'], key=int), ['320', '640'])
+        self.assertEqual(sorted(manifest['files']['image/webp'], key=int), ['320', '640', '1000'])
+        self.assertTrue(os.path.exists(manifest_path(path)))
+        with Image.open(os.path.join(self.upload_folder, 'gallery', 'variants', 'photo-320.webp')) as variant:
+            self.assertEqual(variant.size, (320, 160))
+
+    def test_transparent_png_keeps_png_fallback(self):
+        """Test that non-JPEG uploads keep PNG copies with their alpha channel."""
+        path = self.save_image('logo.png', (400, 400), mode='RGBA', image_format='PNG')
+        manifest = generate_variants(path)
+        self.assertEqual(list(manifest['files']['image/png']), ['320'])
+        with Image.open(os.path.join(self.upload_folder, 'gallery', 'variants', 'logo-320.png')) as variant:
+            self.assertEqual(variant.mode, 'RGBA')
+
+    def test_responsive_sources(self):
+        """Test the srcset strings built from a manifest."""
+        url = '/static/uploads/gallery/photo.jpg'
+        self.assertEqual(responsive_sources(url, self.upload_folder), (None, []))
+        generate_variants(self.save_image('photo.jpg', (700, 700)))
+        srcset, sources = responsive_sources(url, self.upload_folder)
+        self.assertEqual(srcset, '/static/uploads/gallery/variants/photo-320.jpg 320w, '
+                                 '/static/uploads/gallery/variants/photo-640.jpg 640w, '
+                                 '/static/uploads/gallery/photo.jpg 700w')
+        self.assertIn({'type': 'image/webp',
+                       'srcset': '/static/uploads/gallery/variants/photo-320.webp 320w, '
+                                 '/static/uploads/gallery/variants/photo-640.webp 640w, '
+                                 '/static/uploads/gallery/variants/photo-700.webp 700w'}, sources)
+        self.assertEqual(responsive_sources('https://example.com/a.jpg'), (None, []))
+
+    def test_processing_refreshes_referencing_rows(self):
+        """Test that rows showing an image expose its srcset once derivatives exist."""
+        url = '/static/uploads/gallery/shot.jpg'
+        path = self.save_image('shot.jpg', (800, 600))
+        db.session.add(GalleryImage(url=url, caption='صورة'))
+        db.session.commit()
+        before = self.client.get('/api/gallery')
+        self.assertIsNone(before.get_json()['images'][0]['srcset'])
+
+        process_upload(path, url)
+        after = self.client.get('/api/gallery', headers={'If-None-Match': before.headers['ETag']})
+        self.assertEqual(after.status_code, 200)
+        image = after.get_json()['images'][0]
+        self.assertTrue(image['srcset'].startswith('/static/uploads/gallery/variants/shot-320.jpg 320w'))
+        self.assertTrue(any(source['type'] == 'image/webp' for source in image['sources']))
+
+    def test_refresh_matches_file_names_literally(self):
+        """Test that LIKE wildcards in a legacy file name only match that file."""
+        old = datetime(2020, 1, 1)
+        path = self.save_image('shot_1.jpg', (400, 300))
+        for filename in ('shot_1.jpg', 'shotX1.jpg'):
+            db.session.add(GalleryImage(url=f'/static/uploads/gallery/{filename}', caption='صورة', updated_at=old))
+        db.session.commit()
+
+        process_upload(path, '/static/uploads/gallery/shot_1.jpg')
+        db.session.expire_all()
+        touched = [image.url for image in GalleryImage.query if image.updated_at != old]
+        self.assertEqual(touched, ['/static/uploads/gallery/shot_1.jpg'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,218 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import sys
+from datetime import datetime, timedelta
+from unittest import mock
+
+# Add the parent directory to the sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PIL import Image
+
+from app import create_app
+from database import db
+from jobs import TASKS, JobQueue, task
+from models import Job, User
+
+CALLS = []
+
+
+@task('test_echo')
+def echo(value):
+    CALLS.append(value)
+    return {'value': value}
+
+
+@task('test_flaky', max_attempts=2)
+def flaky(failures):
+    CALLS.append(failures)
+    if len(CALLS) <= failures:
+        raise RuntimeError('temporary failure')
+    return len(CALLS)
+
+
+@task('test_slow')
+def slow(seconds):
+    time.sleep(seconds)
+    CALLS.append(seconds)
+
+
+class JobQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up a test client and a test database."""
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        CALLS.clear()
+
+    def tearDown(self):
+        """Tear down the database."""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def run_in_context(self, f, *args):
+        with self.app.app_context():
+            f(*args)
+
+    def test_eager_queue_retries_until_success(self):
+        """Test that failed attempts are retried up to max_attempts."""
+        queue = JobQueue(self.app, eager=True)
+        job = queue.enqueue('test_flaky', {'failures': 1})
+        self.assertEqual((job.status, job.attempts), ('succeeded', 2))
+        self.assertEqual(job.to_dict()['result'], 2)
+
+        CALLS.clear()
+        job = queue.enqueue('test_flaky', {'failures': 5})
+        self.assertEqual((job.status, job.attempts), ('failed', 2))
+        self.assertEqual(job.error, 'RuntimeError: temporary failure')
+
+    def test_worker_threads_run_jobs(self):
+        """Test that enqueued jobs finish in the background."""
+        queue = JobQueue(self.app, workers=2, poll_interval=0.05)
+        try:
+            job_ids = [queue.enqueue('test_echo', {'value': number}).id for number in range(3)]
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline:
+                db.session.expire_all()
+                if all(db.session.get(Job, job_id).status == 'succeeded' for job_id in job_ids):
+                    break
+                time.sleep(0.05)
+        finally:
+            queue.stop(timeout=5)
+        self.assertEqual(sorted(CALLS), [0, 1, 2])
+        self.assertEqual(db.session.get(Job, job_ids[0]).to_dict()['result'], {'value': 0})
+
+    def test_jobs_are_claimed_once(self):
+        """Test that a job cannot be claimed by two workers."""
+        queue = JobQueue(self.app)
+        job = Job(name='test_echo', payload=json.dumps({'value': 1}))
+        db.session.add(job)
+        db.session.commit()
+        self.assertTrue(queue._claim(job.id))
+        self.assertFalse(queue._claim(job.id))
+
+    def test_delayed_and_stale_jobs(self):
+        """Test that delayed jobs wait and stale running jobs are requeued."""
+        queue = JobQueue(self.app)
+        Job.query.delete()
+        db.session.add(Job(name='test_echo', payload='{"value": "later"}',
+                           run_after=datetime.utcnow() + timedelta(hours=1)))
+        db.session.add(Job(name='test_echo', payload='{"value": "lost"}', status='running', attempts=1,
+                           started_at=datetime.utcnow() - timedelta(hours=1),
+                           updated_at=datetime.utcnow() - timedelta(hours=1)))
+        db.session.commit()
+        self.assertEqual(queue.run_pending(), 0)
+        self.assertEqual(queue.recover_stale(), 1)
+        self.assertEqual(queue.run_pending(), 1)
+        self.assertEqual(CALLS, ['lost'])
+
+    def test_maintenance_prunes_finished_jobs(self):
+        """Test that workers periodically requeue stale jobs and delete old finished ones."""
+        queue = JobQueue(self.app, retention_days=7)
+        Job.query.delete()
+        old = datetime.utcnow() - timedelta(days=8)
+        for status in ('succeeded', 'failed', 'queued'):
+            db.session.add(Job(name='test_echo', payload='{"value": 1}', status=status, updated_at=old))
+        db.session.add(Job(name='test_echo', payload='{"value": 2}', status='succeeded'))
+        db.session.commit()
+        self.assertTrue(queue.maintain())
+        self.assertEqual(sorted(job.status for job in Job.query), ['queued', 'succeeded'])
+
+        db.session.add(Job(name='test_echo', payload='{"value": "lost"}', status='running', attempts=1,
+                           started_at=datetime.utcnow() - timedelta(hours=1),
+                           updated_at=datetime.utcnow() - timedelta(hours=1)))
+        db.session.commit()
+        self.assertFalse(queue.maintain())
+        queue._maintained_at -= 3600
+        self.assertTrue(queue.maintain())
+        self.assertEqual(Job.query.filter_by(status='running').count(), 0)
+
+    def test_long_jobs_send_heartbeats(self):
+        """Test that a job running longer than STALE_AFTER is not recovered as stale."""
+        queue = JobQueue(self.app)
+        job = Job(name='test_slow', payload=json.dumps({'seconds': 0.5}))
+        db.session.add(job)
+        db.session.commit()
+        job_id = job.id
+        self.assertTrue(queue._claim(job_id))
+        with mock.patch('jobs.HEARTBEAT_INTERVAL', 0.05), mock.patch('jobs.STALE_AFTER', timedelta(seconds=0.3)):
+            worker = threading.Thread(target=self.run_in_context, args=(queue._run, job_id))
+            worker.start()
+            try:
+                time.sleep(0.4)
+                self.assertEqual(queue.recover_stale(), 0)
+            finally:
+                worker.join(5)
+        db.session.expire_all()
+        self.assertEqual((db.session.get(Job, job_id).status, CALLS), ('succeeded', [0.5]))
+
+    def test_unknown_task(self):
+        """Test that only registered tasks can be enqueued."""
+        with self.assertRaises(KeyError):
+            JobQueue(self.app).enqueue('missing')
+        self.assertIn('image_variants', TASKS)
+
+
+class JobsApiTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up an admin session, an eager queue and a temporary uploads folder."""
+        self.upload_folder = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['UPLOAD_FOLDER'] = self.upload_folder
+        self.app.extensions['job_queue'].eager = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        admin = User(username='admin', email='admin@example.com', role='admin')
+        admin.set_password('password')
+        db.session.add(admin)
+        db.session.commit()
+        self.client.post('/login', data=json.dumps({'username': 'admin', 'password': 'password'}),
+                         content_type='application/json')
+        CALLS.clear()
+
+    def tearDown(self):
+        """Tear down the database and the uploads folder."""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.upload_folder)
+
+    def test_enqueue_and_status(self):
+        """Test enqueueing a job and reading its status."""
+        response = self.client.post('/api/jobs', json={'name': 'test_echo', 'payload': {'value': 'x'}})
+        self.assertEqual(response.status_code, 202)
+        status = self.client.get(response.headers['Location']).get_json()['job']
+        self.assertEqual((status['status'], status['result']), ('succeeded', {'value': 'x'}))
+
+        self.assertEqual(self.client.post('/api/jobs', json={'name': 'missing'}).status_code, 400)
+        self.assertEqual(self.client.post('/api/jobs', json={'name': 'test_echo', 'max_attempts': 0}).status_code, 400)
+        self.assertEqual(self.client.get('/api/jobs/999').status_code, 404)
+
+    def test_image_upload_enqueues_variants(self):
+        """Test that image uploads return at once with the derivative job."""
+        data = io.BytesIO()
+        Image.new('RGB', (700, 400), 'blue').save(data, 'JPEG')
+        data.seek(0)
+        response = self.client.post('/api/upload/gallery-image', data={'file': (data, 'photo.jpg')},
+                                    content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 201)
+        body = response.get_json()
+        self.assertEqual(body['job']['name'], 'image_variants')
+        self.assertEqual(body['job']['status'], 'succeeded')
+        filename = body['file_url'].rsplit('/', 1)[-1].rsplit('.', 1)[0]
+        self.assertTrue(os.path.exists(os.path.join(self.upload_folder, 'gallery', 'variants', f'{filename}-320.webp')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,106 @@
+import json
+import os
+import unittest
+import sys
+
+# Add the parent directory to the sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import JSON, inspect, text
+
+from app import create_app
+from database import db
+from migrations import upgrade_schema
+from models import User, UserActivity
+
+
+class JSONColumnsTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up an admin and a reader with activity metadata."""
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            for username, role, preferences in (('admin', 'admin', None),
+                                                ('reader', 'user', {'preferred_language': 'ar', 'notifications': True})):
+                user = User(username=username, email=f'{username}@example.com', role=role)
+                user.set_password('password')
+                if preferences:
+                    user.set_preferences(preferences)
+                db.session.add(user)
+            db.session.commit()
+            reader = User.query.filter_by(username='reader').one()
+            self.reader_id = reader.id
+            for page in (1, 2, 3):
+                reader.record_activity('view_book', content_id=page, content_type='book',
+                                       metadata={'page': page, 'source': 'search' if page == 2 else 'list'})
+            reader.record_activity('login')
+            db.session.commit()
+
+    def tearDown(self):
+        """Tear down the database."""
+        with self.app.app_context():
+            db.drop_all()
+
+    def login(self, username):
+        self.client.post('/login', data=json.dumps({'username': username, 'password': 'password'}),
+                         content_type='application/json')
+
+    def test_values_are_stored_as_json(self):
+        """Test that metadata and preferences round-trip as objects, without a text copy."""
+        with self.app.app_context():
+            activity = UserActivity.query.filter_by(content_id=2).one()
+            self.assertEqual(activity.activity_data, {'page': 2, 'source': 'search'})
+            self.assertEqual(activity.to_dict()['activity_data'], {'page': 2, 'source': 'search'})
+            self.assertIsNone(UserActivity.query.filter_by(activity_type='login').one().activity_data)
+            self.assertEqual(db.session.scalar(text("SELECT json_extract(activity_data, '$.page') FROM user_activity "
+                                                    "WHERE content_id = 2")), 2)
+            reader = db.session.get(User, self.reader_id)
+            self.assertEqual(reader.get_preferences(), {'preferred_language': 'ar', 'notifications': True})
+            self.assertEqual(reader.to_dict()['preferences'], reader.get_preferences())
+
+    def test_filter_activities_by_metadata(self):
+        """Test that the activity list filters on metadata keys in SQL."""
+        self.login('reader')
+        response = self.client.get('/api/user/activities?data=' + json.dumps({'source': 'list'}))
+        self.assertEqual([a['content_id'] for a in response.get_json()['activities']], [3, 1])
+        response = self.client.get('/api/user/activities?data=' + json.dumps({'page': 2, 'source': 'search'}))
+        self.assertEqual([a['content_id'] for a in response.get_json()['activities']], [2])
+        self.assertEqual(self.client.get('/api/user/activities?data=[1]').status_code, 400)
+        self.assertEqual(self.client.get('/api/user/activities?data={').status_code, 400)
+
+    def test_filter_users_by_preferences(self):
+        """Test that admins can list the users with given preferences."""
+        self.login('admin')
+        response = self.client.get('/api/users?preferences=' + json.dumps({'preferred_language': 'ar'}))
+        self.assertEqual([u['username'] for u in response.get_json()['users']], ['reader'])
+        response = self.client.get('/api/users?preferences=' + json.dumps({'notifications': False}))
+        self.assertEqual(response.get_json()['users'], [])
+
+    def test_text_columns_are_converted(self):
+        """Test that databases storing JSON as text are migrated, keeping the values."""
+        with self.app.app_context():
+            for table, column in (('user_activity', 'activity_data'), ('user', 'preferences')):
+                db.session.execute(text(f'ALTER TABLE "{table}" DROP COLUMN {column}'))
+                db.session.execute(text(f'ALTER TABLE "{table}" ADD COLUMN {column} TEXT'))
+            db.session.execute(text("UPDATE user_activity SET activity_data = '{\"page\": 1}' WHERE content_id = 1"))
+            db.session.execute(text("UPDATE user_activity SET activity_data = 'not json' WHERE content_id = 2"))
+            db.session.execute(text("UPDATE \"user\" SET preferences = '{\"theme\": \"dark\"}' WHERE id = :id"),
+                               {'id': self.reader_id})
+            db.session.commit()
+
+            added = upgrade_schema()
+            self.assertIn('user_activity.activity_data', added)
+            self.assertIn('user.preferences', added)
+            columns = {column['name']: column['type'] for column in inspect(db.engine).get_columns('user_activity')}
+            self.assertIsInstance(columns['activity_data'], JSON)
+            self.assertNotIn('activity_data_json', columns)
+            db.session.expire_all()
+            data = {a.content_id: a.activity_data for a in UserActivity.query.filter_by(activity_type='view_book')}
+            self.assertEqual(data, {1: {'page': 1}, 2: None, 3: None})
+            self.assertEqual(db.session.get(User, self.reader_id).get_preferences(), {'theme': 'dark'})
+            self.assertEqual(upgrade_schema(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import unittest
+import sys
+
+# Add the parent directory to the sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import inspect, text
+
+from app import create_app
+from database import db
+from migrations import upgrade_schema
+from models import Book
+
+
+class UpgradeSchemaTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up the application and a book."""
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        db.session.add(Book(title='كتاب', language='ar', category='فكر', cover='/static/c.jpg',
+                            download='/static/b.pdf', description='d'))
+        db.session.commit()
+
+    def tearDown(self):
+        """Tear down the database."""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_missing_columns_are_added(self):
+        """Test that columns added to a model after its table existed are created and backfilled."""
+        for column in ('download_count', 'preview'):
+            db.session.execute(text(f'ALTER TABLE book DROP COLUMN {column}'))
+        db.session.commit()
+
+        added = upgrade_schema()
+        self.assertIn('book.download_count', added)
+        self.assertIn('book.preview', added)
+        columns = {column['name'] for column in inspect(db.engine).get_columns('book')}
+        self.assertTrue({'download_count', 'preview'} <= columns)
+        self.assertEqual(db.session.execute(text('SELECT download_count FROM book')).scalar(), 0)
+        self.assertEqual(upgrade_schema(), [])
+
+    def test_missing_creation_times_are_filled(self):
+        """Test that legacy rows without created_at are backfilled and can be paged."""
+        db.session.execute(text('DROP TABLE gallery_image'))
+        db.session.execute(text('CREATE TABLE gallery_image (id INTEGER PRIMARY KEY, url VARCHAR(500) NOT NULL, '
+                                'caption VARCHAR(255) NOT NULL, created_at DATETIME, updated_at DATETIME)'))
+        for number in range(3):
+            db.session.execute(text('INSERT INTO gallery_image (url, caption) VALUES (:url, :caption)'),
+                               {'url': f'/static/uploads/gallery/{number}.jpg', 'caption': str(number)})
+        db.session.commit()
+
+        upgrade_schema()
+        self.assertEqual(db.session.execute(
+            text('SELECT count(*) FROM gallery_image WHERE created_at IS NULL')).scalar(), 0)
+        indexes = {index['name'] for index in inspect(db.engine).get_indexes('gallery_image')}
+        self.assertIn('ix_gallery_image_created_at_id', indexes)
+
+        client = self.app.test_client()
+        response = client.get('/api/gallery?limit=2')
+        self.assertEqual(response.status_code, 200)
+        page = response.get_json()
+        self.assertEqual(len(page['images']), 2)
+        response = client.get('/api/gallery', query_string={'limit': 2, 'cursor': page['next_cursor']})
+        self.assertEqual(len(response.get_json()['images']), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
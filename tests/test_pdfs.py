@@ -0,0 +1,126 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import zlib
+import sys
+
+# Add the parent directory to the sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from PIL import Image
+
+import pdfs
+from app import create_app
+from database import db
+from models import Book, User
+from storage import store_upload
+
+
+def make_pdf(pages):
+    """Builds a real PDF with the given number of blank pages."""
+    images = [Image.new('RGB', (60, 80), 'white') for _ in range(pages)]
+    output = io.BytesIO()
+    images[0].save(output, 'PDF', save_all=True, append_images=images[1:])
+    return output.getvalue()
+
+
+class PdfInfoTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up an editor session, an eager queue and a temporary uploads folder."""
+        self.upload_folder = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['UPLOAD_FOLDER'] = self.upload_folder
+        self.app.extensions['job_queue'].eager = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        editor = User(username='editor', email='editor@example.com', role='editor')
+        editor.set_password('password')
+        db.session.add(editor)
+        db.session.commit()
+        self.client.post('/login', data=json.dumps({'username': 'editor', 'password': 'password'}),
+                         content_type='application/json')
+
+    def tearDown(self):
+        """Tear down the database and the uploads folder."""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.upload_folder)
+
+    def add_book(self, download):
+        response = self.client.post('/api/books', data=json.dumps({
+            'title': 'كتاب', 'language': 'ar', 'category': 'فقه', 'cover': 'c.jpg',
+            'download': download, 'description': 'd',
+        }), content_type='application/json')
+        return response.get_json()['book']
+
+    def test_count_pages_reads_page_tree(self):
+        """Test that pages are counted in plain and compressed page trees."""
+        path = os.path.join(self.upload_folder, 'book.pdf')
+        with open(path, 'wb') as f:
+            f.write(make_pdf(3))
+        self.assertEqual(pdfs.count_pages(path), 3)
+
+        objects = zlib.compress(b'1 0 2 40 << /Type /Pages /Kids [3 0 R] /Count 12 >> << /Type /Page >>')
+        with open(path, 'wb') as f:
+            f.write(b'%PDF-1.5\n5 0 obj\n<< /Type /ObjStm /N 2 /First 8 /Filter /FlateDecode /Length '
+                    + str(len(objects)).encode() + b' >>\nstream\n' + objects + b'\nendstream\nendobj\n%%EOF\n')
+        self.assertEqual(pdfs.count_pages(path), 12)
+
+        with open(path, 'wb') as f:
+            f.write(b'%PDF-1.4 truncated')
+        self.assertIsNone(pdfs.count_pages(path))
+
+    def test_upload_extracts_info_for_later_books(self):
+        """Test that a book saved after the upload gets the extracted details."""
+        data = make_pdf(4)
+        response = self.client.post('/api/upload/book-pdf', data={'file': (io.BytesIO(data), 'a.pdf')},
+                                    content_type='multipart/form-data')
+        self.assertEqual(response.status_code, 201)
+        body = response.get_json()
+        self.assertEqual(body['job']['status'], 'succeeded')
+        self.assertEqual(body['job']['result']['pages'], 4)
+
+        book = self.add_book(body['file_url'])
+        self.assertEqual((book['pages'], book['file_size']), (4, len(data)))
+
+        # The same PDF uploaded again is not read twice
+        response = self.client.post('/api/upload/book-pdf', data={'file': (io.BytesIO(data), 'b.pdf')},
+                                    content_type='multipart/form-data')
+        self.assertNotIn('job', response.get_json())
+
+    def test_job_fills_in_books_saved_before_it_ran(self):
+        """Test that a finished job updates books that already link to the PDF."""
+        folder = os.path.join(self.upload_folder, 'books')
+        filename, _ = store_upload(io.BytesIO(make_pdf(2)), folder, 'pdf')
+        url = f'/static/uploads/books/{filename}'
+        book = self.add_book(url)
+        self.assertIsNone(book['pages'])
+
+        pdfs.process_pdf(os.path.join(folder, filename), url)
+        db.session.expire_all()
+        self.assertEqual(db.session.get(Book, book['id']).page_count, 2)
+
+        # Pointing the book at another PDF drops the old details
+        response = self.client.put(f'/api/books/{book["id"]}', data=json.dumps({'download': 'https://example.com/a.pdf'}),
+                                   content_type='application/json')
+        self.assertIsNone(response.get_json()['book']['pages'])
+
+    @unittest.skipIf(pdfs.fitz is None, 'PyMuPDF is not installed')
+    def test_preview_renders_first_page(self):
+        """Test that the first page is stored as a JPEG preview."""
+        folder = os.path.join(self.upload_folder, 'books')
+        filename, _ = store_upload(io.BytesIO(make_pdf(1)), folder, 'pdf')
+        info = pdfs.process_pdf(os.path.join(folder, filename), f'/static/uploads/books/{filename}')
+        self.assertTrue(info['preview'].endswith('.jpg'))
+        with Image.open(os.path.join(folder, info['preview'].rsplit('/', 1)[-1])) as preview:
+            self.assertEqual(preview.width, pdfs.PREVIEW_WIDTH)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+import json
+import os
+import unittest
+import sys
+
+# Add the parent directory to the sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import event
+
+from app import create_app
+from database import db
+from models import Article, Book, ItemNeighbor, User
+from recommendations import build_recommendations, recommend
+
+
+class RecommendationTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up books, articles and three readers."""
+        self.app = create_app('testing')
+        self.buffer = self.app.extensions['activity_buffer']
+        self.buffer.flush_interval = 60
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            for title, category in (('أ', 'فقه'), ('ب', 'فقه'), ('ج', 'دعوة'), ('د', 'تاريخ')):
+                db.session.add(Book(title=title, language='ar', category=category, cover='c.jpg',
+                                    download='b.pdf', description='-'))
+            for title, category in (('مقال ١', 'دعوة'), ('مقال ٢', None)):
+                db.session.add(Article(title=title, summary='-', content='-', category=category))
+            for username in ('reader', 'other', 'newcomer'):
+                user = User(username=username, email=f'{username}@example.com')
+                user.set_password('password')
+                db.session.add(user)
+            db.session.commit()
+            self.books = {book.title: book.id for book in Book.query}
+            self.articles = {article.title: article.id for article in Article.query}
+            self.users = {user.username: user.id for user in User.query}
+        self.client.post('/login', data=json.dumps({'username': 'reader', 'password': 'password'}),
+                         content_type='application/json')
+
+    def tearDown(self):
+        """Stop the buffer and tear down the database."""
+        self.buffer.stop()
+        with self.app.app_context():
+            db.drop_all()
+
+    def view(self, username, *items):
+        self.buffer.add(self.users[username], [
+            {'activity_type': f'view_{item_type}', 'content_type': item_type, 'content_id': item_id,
+             'content_title': None, 'activity_data': None}
+            for item_type, item_id in items
+        ])
+        self.buffer.flush()
+
+    def test_co_viewed_items_are_recommended_first(self):
+        """Test that items read by readers of the same items rank highest."""
+        self.view('other', ('book', self.books['أ']), ('article', self.articles['مقال ٢']), ('book', self.books['د']))
+        self.view('reader', ('book', self.books['أ']), ('book', self.books['د']))
+        with self.app.app_context():
+            build_recommendations()
+            recommendations = recommend(self.users['reader'])
+
+        first = recommendations[0]
+        self.assertEqual((first['type'], first['id'], first['reason']), ('article', self.articles['مقال ٢'], 'co_view'))
+        # Items the reader has seen are left out
+        shown = {(item['type'], item['id']) for item in recommendations}
+        self.assertNotIn(('book', self.books['أ']), shown)
+        self.assertNotIn(('book', self.books['د']), shown)
+        # The other book on the same topic comes next
+        self.assertEqual((recommendations[1]['id'], recommendations[1]['reason']), (self.books['ب'], 'category'))
+
+    def test_categories_span_books_and_articles(self):
+        """Test that items sharing a category are neighbours without any views."""
+        with self.app.app_context():
+            build_recommendations()
+            neighbors = {(n.neighbor_type, n.neighbor_id) for n in
+                         ItemNeighbor.query.filter_by(item_type='book', item_id=self.books['ج'])}
+        self.assertEqual(neighbors, {('article', self.articles['مقال ١'])})
+
+    def test_new_users_get_popular_items(self):
+        """Test that users without history get the most downloaded books and new articles."""
+        with self.app.app_context():
+            Book.query.filter_by(id=self.books['ج']).update({'download_count': 5})
+            db.session.commit()
+            build_recommendations()
+            recommendations = recommend(self.users['newcomer'], limit=4)
+        self.assertEqual([(item['type'], item['reason']) for item in recommendations][:2],
+                         [('book', 'popular'), ('article', 'popular')])
+        self.assertEqual(recommendations[0]['id'], self.books['ج'])
+        self.assertEqual(len(recommendations), 4)
+
+    def test_endpoint_does_not_read_the_activity_log(self):
+        """Test that serving recommendations only reads rollups and neighbours."""
+        self.view('reader', ('book', self.books['أ']))
+        with self.app.app_context():
+            build_recommendations()
+            engine = db.engine
+        statements = []
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            response = self.client.get('/api/user/recommendations?limit=2')
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+        recommendations = response.get_json()['recommendations']
+        self.assertEqual(recommendations[0]['id'], self.books['ب'])
+        self.assertEqual(len(recommendations), 2)
+        self.assertFalse([statement for statement in statements if 'user_activity' in statement])
+
+
+if __name__ == '__main__':
+    unittest.main()
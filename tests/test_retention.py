@@ -0,0 +1,105 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+from datetime import datetime, timedelta
+
+# Add the parent directory to the sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import inspect, text
+
+from app import create_app
+from database import db
+from migrations import upgrade_schema
+from models import User, UserActivity
+from retention import _write_archive, archive_activity, partition_activity_table, read_archives
+from rollups import rebuild_rollups, user_statistics
+
+
+class ActivityRetentionTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up a reader with activity spread over the last year."""
+        self.archive_folder = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['ACTIVITY_ARCHIVE_FOLDER'] = self.archive_folder
+        self.client = self.app.test_client()
+        self.now = datetime.utcnow()
+        with self.app.app_context():
+            db.create_all()
+            user = User(username='reader', email='reader@example.com')
+            user.set_password('password')
+            db.session.add(user)
+            db.session.commit()
+            self.user_id = user.id
+            for days_ago in (400, 300, 250, 10, 1):
+                db.session.add(UserActivity(user_id=user.id, activity_type='view_book', content_type='book',
+                                            content_id=days_ago, created_at=self.now - timedelta(days=days_ago)))
+            db.session.commit()
+            rebuild_rollups()
+        self.client.post('/login', data=json.dumps({'username': 'reader', 'password': 'password'}),
+                         content_type='application/json')
+
+    def tearDown(self):
+        """Tear down the database and the archive folder."""
+        with self.app.app_context():
+            db.drop_all()
+        shutil.rmtree(self.archive_folder)
+
+    def test_activity_indexes(self):
+        """Test that per-user and per-content lookups are indexed, also on upgraded databases."""
+        with self.app.app_context():
+            db.session.execute(text('DROP INDEX ix_user_activity_content'))
+            db.session.commit()
+            upgrade_schema()
+            indexes = {index['name']: index['column_names'] for index in inspect(db.engine).get_indexes('user_activity')}
+        self.assertEqual(indexes['ix_user_activity_user_created_at'], ['user_id', 'created_at'])
+        self.assertEqual(indexes['ix_user_activity_content'], ['content_type', 'content_id'])
+
+    def test_old_activity_is_archived_without_changing_statistics(self):
+        """Test that archiving moves old rows to compressed files and keeps the counts."""
+        with self.app.app_context():
+            archived = archive_activity(self.now - timedelta(days=180), self.archive_folder)
+            self.assertEqual(archived, 3)
+            self.assertEqual(sorted(a.content_id for a in UserActivity.query), [1, 10])
+            self.assertEqual(sorted(row['content_id'] for row in read_archives(self.archive_folder)), [250, 300, 400])
+            self.assertTrue(all(name.endswith('.jsonl.gz') for name in os.listdir(self.archive_folder)))
+            self.assertEqual(user_statistics(self.user_id)['books_viewed'], 5)
+
+            # Rebuilding counts the archives too, once each
+            self.assertEqual(rebuild_rollups(self.archive_folder), 5)
+            self.assertEqual(user_statistics(self.user_id)['active_days'], 5)
+
+    def test_rows_archived_twice_are_counted_once(self):
+        """Test that a chunk archived again after a crash is not double counted."""
+        with self.app.app_context():
+            rows = [{'id': a.id, 'user_id': a.user_id, 'activity_type': a.activity_type, 'content_id': a.content_id,
+                     'content_type': a.content_type, 'content_title': None, 'activity_data': None,
+                     'created_at': a.created_at} for a in UserActivity.query.filter(UserActivity.content_id == 400)]
+            _write_archive(self.archive_folder, rows)
+            # Crashed before deleting: the row is both archived and in the table
+            self.assertEqual(rebuild_rollups(self.archive_folder), 5)
+            archive_activity(self.now - timedelta(days=180), self.archive_folder)
+            self.assertEqual(len(list(read_archives(self.archive_folder))), 3)
+            self.assertEqual(rebuild_rollups(self.archive_folder), 5)
+
+    def test_partitioning_requires_postgresql(self):
+        """Test that partitioning is refused on other databases."""
+        with self.app.app_context():
+            with self.assertRaises(RuntimeError):
+                partition_activity_table()
+
+    def test_user_activities_are_paginated(self):
+        """Test the user's activity history, newest first."""
+        response = self.client.get('/api/user/activities?limit=3')
+        data = response.get_json()
+        self.assertEqual([a['content_id'] for a in data['activities']], [1, 10, 250])
+        data = self.client.get(f'/api/user/activities?limit=3&cursor={data["next_cursor"]}').get_json()
+        self.assertEqual([a['content_id'] for a in data['activities']], [300, 400])
+        self.assertIsNone(data['next_cursor'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import json
+import os
+import unittest
+import sys
+from datetime import datetime, timedelta
+
+# Add the parent directory to the sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import event
+
+from app import create_app
+from database import db
+from models import DailyActivityRollup, HourlyActivityRollup, User, UserActivity
+from rollups import activity_series, add_to_rollups, rebuild_rollups, user_statistics
+
+
+class ActivityRollupTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up an admin and a reader, each logged in with their own client."""
+        self.app = create_app('testing')
+        self.buffer = self.app.extensions['activity_buffer']
+        self.buffer.flush_interval = 60
+        self.client = self.app.test_client()
+        self.admin = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            for username, role in (('admin', 'admin'), ('reader', 'user')):
+                user = User(username=username, email=f'{username}@example.com', role=role)
+                user.set_password('password')
+                db.session.add(user)
+            db.session.commit()
+            self.reader_id = User.query.filter_by(username='reader').one().id
+        for client, username in ((self.client, 'reader'), (self.admin, 'admin')):
+            client.post('/login', data=json.dumps({'username': username, 'password': 'password'}),
+                        content_type='application/json')
+
+    def tearDown(self):
+        """Stop the buffer and tear down the database."""
+        self.buffer.stop()
+        with self.app.app_context():
+            db.drop_all()
+
+    def record(self, *events):
+        self.client.post('/api/user/record-activity', data=json.dumps(list(events)), content_type='application/json')
+        self.buffer.flush()
+
+    def test_flushed_events_are_counted(self):
+        """Test that the buffer updates both rollups with each batch."""
+        self.record({'activity_type': 'view_book', 'content_type': 'book', 'content_id': 1},
+                    {'activity_type': 'view_book', 'content_type': 'book', 'content_id': 2},
+                    {'activity_type': 'login'})
+        self.record({'activity_type': 'download_book', 'content_type': 'book', 'content_id': 1})
+
+        with self.app.app_context():
+            for model in (HourlyActivityRollup, DailyActivityRollup):
+                counts = {(row.content_type, row.activity_type): row.count for row in model.query}
+                self.assertEqual(counts, {('book', 'view_book'): 2, ('', 'login'): 1, ('book', 'download_book'): 1})
+
+        statistics = self.client.get('/api/user/statistics').get_json()
+        self.assertEqual(statistics['books_viewed'], 2)
+        self.assertEqual(statistics['downloads'], 1)
+        self.assertEqual(statistics['articles_viewed'], 0)
+        self.assertEqual(statistics['active_days'], 1)
+
+    def test_statistics_do_not_read_raw_activity(self):
+        """Test that the statistics endpoints only query the rollups."""
+        self.record({'activity_type': 'view_article', 'content_type': 'article'})
+        statements = []
+        with self.app.app_context():
+            engine = db.engine
+        listener = lambda conn, cursor, statement, *args: statements.append(statement)
+        event.listen(engine, 'before_cursor_execute', listener)
+        try:
+            self.assertEqual(self.client.get('/api/user/statistics').get_json()['articles_viewed'], 1)
+            series = self.admin.get('/api/admin/activity-statistics?period=hour&buckets=3').get_json()['series']
+        finally:
+            event.remove(engine, 'before_cursor_execute', listener)
+        self.assertEqual(sum(entry['total'] for entry in series), 1)
+        self.assertTrue(statements)
+        self.assertFalse([statement for statement in statements if 'user_activity' in statement])
+
+    def test_totals_are_kept_incrementally(self):
+        """Test that all-time totals and active days follow each batch without reading the daily rollup."""
+        day = datetime(2026, 1, 1, 12)
+        activity = {'content_type': 'book', 'content_id': 1, 'content_title': None, 'activity_data': None}
+        batches = [[0, 0], [0, 1], [3]]
+        with self.app.app_context():
+            for days in batches:
+                rows = [{**activity, 'activity_type': 'view_book', 'user_id': self.reader_id,
+                         'created_at': day + timedelta(days=offset)} for offset in days]
+                with db.engine.begin() as connection:
+                    add_to_rollups(connection, rows)
+            statements = []
+            listener = lambda conn, cursor, statement, *args: statements.append(statement)
+            event.listen(db.engine, 'before_cursor_execute', listener)
+            try:
+                statistics = user_statistics(self.reader_id)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', listener)
+        self.assertEqual((statistics['books_viewed'], statistics['active_days']), (5, 3))
+        self.assertFalse([statement for statement in statements if 'activity_rollup_daily' in statement])
+
+    def test_rebuild_counts_history(self):
+        """Test that a rebuild counts activities written outside the buffer."""
+        now = datetime.utcnow()
+        with self.app.app_context():
+            for days_ago in (0, 1, 1, 3):
+                db.session.add(UserActivity(user_id=self.reader_id, activity_type='view_book', content_type='book',
+                                            created_at=now - timedelta(days=days_ago)))
+            db.session.commit()
+            self.assertEqual(rebuild_rollups(), 4)
+            statistics = user_statistics(self.reader_id)
+            self.assertEqual((statistics['books_viewed'], statistics['active_days']), (4, 3))
+            series = activity_series('day', 4, now=now)
+            self.assertEqual([entry['total'] for entry in series], [1, 0, 2, 1])
+
+            # Rebuilding again replaces the counts instead of adding to them
+            rebuild_rollups()
+            self.assertEqual(user_statistics(self.reader_id)['books_viewed'], 4)
+
+    def test_admin_activity_endpoints(self):
+        """Test the admin feeds and their validation."""
+        self.record({'activity_type': 'view_book', 'content_title': 'كتاب'})
+        activities = self.admin.get('/api/admin/recent-activities').get_json()['activities']
+        self.assertEqual([(a['username'], a['content_title']) for a in activities], [('reader', 'كتاب')])
+        self.assertEqual(self.client.get('/api/admin/recent-activities').status_code, 403)
+        self.assertEqual(self.admin.get('/api/admin/activity-statistics?period=week').status_code, 400)
+        self.assertEqual(self.admin.get('/api/admin/activity-statistics?buckets=0').status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,221 @@
+import os
+import unittest
+import sys
+
+# Add the parent directory to the sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import create_engine, event, insert, text
+
+from app import create_app
+from database import db
+from models import Article, Book
+from search import (SQLiteFTSBackend, get_search_backend, highlight, index_documents, iter_documents,
+                    make_snippet, query_terms, reindex_documents)
+from search_benchmark import compare_backends, overlap_at_k, time_queries
+from suggest import PrefixIndex
+
+
+class SearchTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up a test client and a test database with searchable content."""
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        db.session.add(Book(
+            title='الدعوة الإسلامية', language='العربية', category='دعوة',
+            cover='cover.jpg', download='#', description='كتاب عن العمل الإسلامي'
+        ))
+        db.session.add(Article(
+            title='الشباب المسلم', summary='عن الشباب',
+            content='دور الشباب في الدعوة الإسلامية', category='تربية'
+        ))
+        db.session.commit()
+
+    def tearDown(self):
+        """Tear down the database."""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_sqlite_backend_selected(self):
+        """Test that SQLite databases use the FTS5 backend."""
+        self.assertIsInstance(get_search_backend(), SQLiteFTSBackend)
+
+    def test_title_match_outranks_body_match(self):
+        """Test that a match in the title ranks above a match in the body."""
+        ranked = get_search_backend().rank('الدعوة')
+        self.assertEqual([(kind, doc_id) for kind, doc_id, _ in ranked], [('book', 1), ('article', 1)])
+
+    def test_index_follows_writes(self):
+        """Test that the FTS5 index tracks updates and deletes."""
+        backend = get_search_backend()
+        book = db.session.get(Book, 1)
+        book.title = 'مذكرات'
+        db.session.commit()
+        self.assertEqual([hit[:2] for hit in backend.rank('مذكرات')], [('book', 1)])
+        self.assertEqual([hit[:2] for hit in backend.rank('الدعوة')], [('article', 1)])
+
+        db.session.delete(db.session.get(Article, 1))
+        db.session.commit()
+        self.assertEqual(backend.rank('الدعوة'), [])
+
+    def test_query_operators_are_literal(self):
+        """Test that FTS5 syntax in user input does not raise."""
+        self.assertEqual(get_search_backend().rank('"AND OR NOT ('), [])
+
+    def test_search_page(self):
+        """Test that the search page renders ranked results."""
+        response = self.client.get('/search?q=الشباب')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('الشباب المسلم', response.get_data(as_text=True))
+
+    def test_search_page_facets_and_paging(self):
+        """Test snippets, facet counts, filters and offsets of a result page."""
+        backend = get_search_backend()
+        page = backend.search('الإسلامية', limit=1)
+        self.assertEqual(page.total, 2)
+        self.assertEqual(len(page.hits), 1)
+        self.assertEqual(page.facets['type'], {'book': 1, 'article': 1})
+        self.assertEqual(page.facets['category'], {'دعوة': 1, 'تربية': 1})
+        article_hit = backend.search('الإسلامية', kind='article').hits[0]
+        self.assertIn('<mark>الإسلامية</mark>', article_hit.snippet)
+
+        second = backend.search('الإسلامية', limit=1, offset=1)
+        self.assertNotEqual(second.hits[0][:2], page.hits[0][:2])
+
+        filtered = backend.search('الإسلامية', category='تربية')
+        self.assertEqual(filtered.total, 1)
+        self.assertEqual([hit.kind for hit in filtered.hits], ['article'])
+        self.assertEqual(backend.search('الإسلامية', kind='book').total, 1)
+
+    def test_normalized_queries_match_variants(self):
+        """Test that diacritics and spelling variants match through the index."""
+        backend = get_search_backend()
+        expected = [('book', 1), ('article', 1)]
+        for query in ('الدعوة', 'الدَّعْوَةُ', 'دعوه', 'والدعوة'):
+            self.assertEqual([hit[:2] for hit in backend.rank(query)], expected, query)
+        self.assertEqual(len(backend.rank('الاسلاميه')), 2)
+
+    def test_reindex_documents(self):
+        """Test that reindexing rebuilds the normalized text and the index."""
+        db.session.execute(text("UPDATE book SET normalized_title = NULL, normalized_body = NULL"))
+        self.assertEqual([hit[:2] for hit in get_search_backend().rank('الدعوة')], [('article', 1)])
+        reindex_documents()
+        db.session.commit()
+        self.assertEqual(len(get_search_backend().rank('الدعوة')), 2)
+
+    def test_make_snippet(self):
+        """Test that snippets show the original text around highlighted variants."""
+        snippet = make_snippet('<p>مقدمة ' + 'كلمة ' * 30 + 'الإسلاميّة ختام</p>', query_terms('اسلامي'), words=6)
+        self.assertTrue(snippet.startswith('…'))
+        self.assertIn('\ue000الإسلاميّة\ue001 ختام', snippet)
+        self.assertEqual(make_snippet('', ['x']), '')
+
+    def test_highlight_escapes_markup(self):
+        """Test that snippets keep highlights but never raw HTML."""
+        snippet = highlight('<p>a <script>x</script> \ue000term\ue001 & b</p>')
+        self.assertEqual(str(snippet), 'a x <mark>term</mark> &amp; b')
+
+    def test_reference_index_parity(self):
+        """Test that a standalone index ranks like the trigger-maintained one."""
+        engine = create_engine('sqlite://')
+        with engine.begin() as connection:
+            index_documents(connection, iter_documents())
+        with engine.connect() as connection:
+            reference = SQLiteFTSBackend(connection)
+            report = compare_backends(get_search_backend(), reference, ['الدعوة', 'الشباب', 'غير موجود'])
+            self.assertTrue(all(row['overlap'] == 1.0 for row in report))
+            self.assertIn('median_ms', time_queries(reference, ['الدعوة'], repeat=2))
+
+    def test_overlap_at_k(self):
+        """Test the top-k overlap metric."""
+        a = [('book', 1, 2.0), ('article', 1, 1.0)]
+        b = [('book', 1, 3.0), ('book', 2, 1.0)]
+        self.assertEqual(overlap_at_k(a, a), 1.0)
+        self.assertAlmostEqual(overlap_at_k(a, b), 1 / 3)
+        self.assertEqual(overlap_at_k([], []), 1.0)
+
+    def test_suggest_endpoint(self):
+        """Test that suggestions follow inserts, updates and deletes."""
+        def titles(query):
+            response = self.client.get('/api/search/suggest', query_string={'q': query})
+            self.assertEqual(response.status_code, 200)
+            return [suggestion['title'] for suggestion in response.get_json()['suggestions']]
+
+        # Checked on every keystroke, so each step sees the previous commit
+        self.app.extensions['suggest_index'].refresh_interval = 0
+        self.assertEqual(titles('الدعو'), ['الدعوة الإسلامية'])
+        self.assertEqual(titles('دعو'), ['دعوة', 'الدعوة الإسلامية'])
+        self.assertEqual(titles('مسل'), ['الشباب المسلم'])
+        self.assertEqual(titles(''), [])
+
+        db.session.add(Book(title='دعاء المسلم', language='العربية', category='أذكار',
+                            cover='c.jpg', download='#', description='أدعية'))
+        book = db.session.get(Book, 1)
+        book.title = 'مذكرات'
+        db.session.commit()
+        self.assertEqual(titles('مسل'), ['دعاء المسلم', 'الشباب المسلم'])
+        self.assertEqual(titles('دعو'), ['دعوة'])
+        self.assertEqual(titles('اذكار'), ['أذكار'])
+
+        db.session.delete(db.session.get(Article, 1))
+        db.session.commit()
+        self.assertEqual(titles('الشب'), [])
+
+        # Written by another process, which no cache invalidation of this one sees
+        self.app.extensions['content_cache'].check_interval = 0
+        with db.engine.begin() as connection:
+            connection.execute(insert(Book.__table__).values(
+                title='مسلمون', language='العربية', category='تاريخ', cover='c.jpg', download='#', description='-'))
+        self.assertEqual(titles('مسلمو'), ['مسلمون'])
+
+
+    def test_suggest_keystrokes_skip_the_database(self):
+        """Test that suggestions are answered from memory between refreshes."""
+        self.client.get('/api/search/suggest', query_string={'q': 'د'})
+        statements = []
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            for query in ('دع', 'دعو', 'دعوة'):
+                self.client.get('/api/search/suggest', query_string={'q': query})
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(statements, [])
+
+
+class PrefixIndexTestCase(unittest.TestCase):
+    def test_prefix_lookup_and_ranking(self):
+        """Test matching by whole title, by word and by normalized variant."""
+        index = PrefixIndex()
+        index.add('book', 1, 'فقه الدعوة', 'دعوة')
+        index.add('article', 2, 'الدعوة إلى الله', 'دعوة')
+        index.add('article', 3, 'أصول الدعوة والتربية', None)
+
+        self.assertEqual([s['title'] for s in index.suggest('الدعوة')],
+                         ['الدعوة إلى الله', 'فقه الدعوة', 'أصول الدعوة والتربية'])
+        self.assertEqual(index.suggest('اصول'), [{'type': 'article', 'title': 'أصول الدعوة والتربية', 'id': 3}])
+        self.assertEqual([s['type'] for s in index.suggest('دعو')], ['category', 'book', 'article', 'article'])
+        self.assertEqual(len(index.suggest('دعو', limit=2)), 2)
+        self.assertEqual(index.suggest('  '), [])
+
+    def test_remove_keeps_shared_categories(self):
+        """Test that a category stays indexed while any document uses it."""
+        index = PrefixIndex()
+        index.add('book', 1, 'فقه الدعوة', 'دعوة')
+        index.add('book', 2, 'الدعوة', 'دعوة')
+        index.remove('book', 1)
+        self.assertEqual(len(index), 1)
+        self.assertEqual([s['type'] for s in index.suggest('دعو')], ['category', 'book'])
+        index.add('book', 2, 'مذكرات', 'تاريخ')
+        self.assertEqual(index.suggest('دعو'), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
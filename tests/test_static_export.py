@@ -0,0 +1,98 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+from unittest import mock
+
+# Add the parent directory to the sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import static_export
+from app import create_app
+from database import db
+from models import Article, Book, GalleryImage
+from static_export import StaticExporter
+
+
+class StaticExportTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up some content, a small static folder and an export directory."""
+        self.output = tempfile.mkdtemp()
+        self.static_folder = tempfile.mkdtemp()
+        shutil.copytree(os.path.join(os.path.dirname(__file__), '..', 'static', 'js'),
+                        os.path.join(self.static_folder, 'js'))
+        self.app = create_app('testing')
+        self.app.static_folder = self.static_folder
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.books = [Book(title=f'كتاب {n}', language='ar', category='فقه', cover='c.jpg', download='#',
+                           description='d') for n in range(3)]
+        self.article = Article(title='مقال', summary='s', content='c', category='فكر')
+        db.session.add_all(self.books + [self.article, GalleryImage(url='/static/img/a.jpg', caption='a')])
+        db.session.commit()
+
+    def tearDown(self):
+        """Tear down the database and the temporary directories."""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.output)
+        shutil.rmtree(self.static_folder)
+
+    def export(self, full=False):
+        return StaticExporter(self.app, self.output, full=full).run()
+
+    def read_json(self, relative):
+        with open(os.path.join(self.output, relative), encoding='utf-8') as f:
+            return json.load(f)
+
+    def test_export_writes_pages_apis_and_static_files(self):
+        """Test that pages, whole collections, items and static files are exported."""
+        with mock.patch.object(static_export, 'MAX_PAGE_SIZE', 2):
+            exporter = self.export()
+        for relative in ('index.html', 'books/index.html', 'articles/index.html', 'gallery/index.html',
+                         'responsive-gallery/index.html', 'service-worker.js', 'static/js/main.js',
+                         f'api/books/{self.books[0].id}/index.json', f'api/articles/{self.article.id}/index.json'):
+            self.assertTrue(os.path.exists(os.path.join(self.output, relative)), relative)
+            self.assertIn(relative, exporter.written)
+
+        books = self.read_json('api/books/index.json')
+        self.assertEqual(sorted(book['id'] for book in books['books']), sorted(book.id for book in self.books))
+        self.assertIsNone(books['next_cursor'])
+        self.assertEqual(self.read_json(f'api/books/{self.books[1].id}/index.json')['book']['title'], 'كتاب 1')
+
+    def test_export_only_rewrites_what_changed(self):
+        """Test that a second export touches only changed content."""
+        self.export()
+        self.assertEqual(self.export().written, [])
+
+        self.books[1].title = 'عنوان جديد'
+        db.session.delete(self.article)
+        db.session.commit()
+        os.remove(os.path.join(self.static_folder, 'js', 'books.js'))
+        exporter = self.export()
+
+        self.assertIn(f'api/books/{self.books[1].id}/index.json', exporter.written)
+        self.assertIn('api/books/index.json', exporter.written)
+        self.assertNotIn(f'api/books/{self.books[0].id}/index.json', exporter.written)
+        self.assertNotIn('api/gallery/index.json', exporter.written)
+        self.assertEqual(sorted(exporter.removed),
+                         sorted([f'api/articles/{self.article.id}/index.json', 'static/js/books.js']))
+        self.assertEqual(self.read_json(f'api/books/{self.books[1].id}/index.json')['book']['title'], 'عنوان جديد')
+
+        # A full export renders everything again but still skips identical files on disk
+        self.assertGreater(len(self.export(full=True).written), 0)
+
+    def test_cli_command(self):
+        """Test that the export runs as a Flask command."""
+        result = self.app.test_cli_runner().invoke(args=['export-static', self.output])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertIn('files written', result.output)
+        self.assertTrue(os.path.exists(os.path.join(self.output, 'index.html')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,151 @@
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+
+# Add the parent directory to the sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from database import db
+from models import Book, GalleryImage, User
+from storage import is_immutable_path, reference_count, store_upload, sweep_uploads
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'not really an image'
+
+
+class StorageTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up an editor session and a temporary uploads folder."""
+        self.upload_folder = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['UPLOAD_FOLDER'] = self.upload_folder
+        self.app.extensions['job_queue'].eager = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        editor = User(username='editor', email='editor@example.com', role='editor')
+        editor.set_password('password')
+        db.session.add(editor)
+        db.session.commit()
+        self.client.post('/login', data=json.dumps({'username': 'editor', 'password': 'password'}),
+                         content_type='application/json')
+
+    def tearDown(self):
+        """Tear down the database and the uploads folder."""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.upload_folder)
+
+    def store(self, data, subfolder='gallery', extension='jpg', age=0):
+        """Stores a blob, optionally backdating it past the release grace period."""
+        folder = os.path.join(self.upload_folder, subfolder)
+        filename, _ = store_upload(io.BytesIO(data), folder, extension)
+        path = os.path.join(folder, filename)
+        if age:
+            os.utime(path, (os.path.getmtime(path) - age,) * 2)
+        return f'/static/uploads/{subfolder}/{filename}', path
+
+    def test_store_upload_is_content_addressed(self):
+        """Test that identical uploads share one blob named by their hash."""
+        folder = os.path.join(self.upload_folder, 'books')
+        first = store_upload(io.BytesIO(b'%PDF-1.4 book'), folder, 'PDF')
+        second = store_upload(io.BytesIO(b'%PDF-1.4 book'), folder, 'pdf')
+        self.assertEqual(first, (hashlib.sha256(b'%PDF-1.4 book').hexdigest() + '.pdf', True))
+        self.assertEqual(second, (first[0], False))
+        self.assertEqual(sorted(os.listdir(folder)), [first[0]])
+
+    def test_upload_endpoint_deduplicates(self):
+        """Test that uploading the same file twice returns the same URL."""
+        urls = []
+        for _ in range(2):
+            response = self.client.post('/api/upload/book-pdf', data={'file': (io.BytesIO(b'%PDF same'), 'a.pdf')},
+                                        content_type='multipart/form-data')
+            self.assertEqual(response.status_code, 201)
+            urls.append(response.get_json()['file_url'])
+        self.assertEqual(urls[0], urls[1])
+        self.assertTrue(is_immutable_path(urls[0]))
+
+    def test_deleting_last_reference_frees_blob(self):
+        """Test that a blob is removed only once no row references it."""
+        url, path = self.store(b'photo', age=7200)
+        first = GalleryImage(url=url, caption='a')
+        second = GalleryImage(url=url, caption='b')
+        db.session.add_all([first, second])
+        db.session.commit()
+
+        self.client.delete(f'/api/gallery/{first.id}')
+        self.assertTrue(os.path.exists(path))
+        self.client.delete(f'/api/gallery/{second.id}')
+        self.assertFalse(os.path.exists(path))
+
+    def test_replacing_a_url_frees_the_old_blob(self):
+        """Test that updating a book's cover releases the previous cover."""
+        old_url, old_path = self.store(b'old cover', subfolder='books', age=7200)
+        new_url, new_path = self.store(b'new cover', subfolder='books')
+        book = Book(title='t', language='ar', category='c', cover=old_url, download='#', description='d')
+        db.session.add(book)
+        db.session.commit()
+        book.cover = new_url
+        db.session.commit()
+        self.assertFalse(os.path.exists(old_path))
+        self.assertTrue(os.path.exists(new_path))
+
+    def test_references_match_file_names_literally(self):
+        """Test that LIKE wildcards in a legacy file name do not count other files as references."""
+        db.session.add(GalleryImage(url='/static/uploads/gallery/photoX1.jpg', caption='a'))
+        db.session.commit()
+        with db.engine.connect() as connection:
+            self.assertEqual(reference_count(connection, '/static/uploads/gallery/photo_1.jpg'), 0)
+            self.assertEqual(reference_count(connection, '/static/uploads/gallery/photoX1.jpg'), 1)
+
+    def test_recent_blobs_survive_release(self):
+        """Test that a just-uploaded blob is kept while its record is being created."""
+        url, path = self.store(b'fresh')
+        image = GalleryImage(url=url, caption='a')
+        db.session.add(image)
+        db.session.commit()
+        db.session.delete(image)
+        db.session.commit()
+        self.assertTrue(os.path.exists(path))
+
+    def test_sweep_removes_blobs_released_during_grace(self):
+        """Test that the sweep deletes unreferenced blobs once the grace period is over."""
+        url, path = self.store(b'fresh')
+        kept_url, kept_path = self.store(b'kept', age=7200)
+        image = GalleryImage(url=url, caption='a')
+        db.session.add_all([image, GalleryImage(url=kept_url, caption='b')])
+        db.session.commit()
+        db.session.delete(image)
+        db.session.commit()
+        self.assertEqual(sweep_uploads(), [])
+
+        os.utime(path, (os.path.getmtime(path) - 7200,) * 2)
+        self.assertEqual(sweep_uploads(), [path])
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(kept_path))
+
+    def test_immutable_cache_headers(self):
+        """Test that content-addressed uploads are cached forever."""
+        folder = os.path.join(self.app.static_folder, 'uploads', 'gallery')
+        filename, _ = store_upload(io.BytesIO(b'cache me'), folder, 'txt')
+        try:
+            response = self.client.get(f'/static/uploads/gallery/{filename}')
+            self.assertEqual(response.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+            response.close()
+            response = self.client.get('/static/js/main.js')
+            self.assertNotIn('immutable', response.headers.get('Cache-Control', ''))
+            response.close()
+        finally:
+            os.remove(os.path.join(folder, filename))
+        self.assertFalse(is_immutable_path('/static/uploads/gallery/2a1c170b97b74adfac8bd6f032e72e9c.jpeg'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import sys
+
+# Add the parent directory to the sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from app import create_app
+from database import db
+from models import UploadSession, User
+
+PDF = b'%PDF-1.4\n' + bytes(range(256)) * 40
+
+
+class ChunkedUploadTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up two editors, an eager queue and a temporary uploads folder."""
+        self.upload_folder = tempfile.mkdtemp()
+        self.app = create_app('testing')
+        self.app.config['UPLOAD_FOLDER'] = self.upload_folder
+        self.app.extensions['job_queue'].eager = True
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        self.client = self.app.test_client()
+        db.create_all()
+        for username in ('editor', 'other'):
+            user = User(username=username, email=f'{username}@example.com', role='editor')
+            user.set_password('password')
+            db.session.add(user)
+        db.session.commit()
+        self.login('editor')
+
+    def tearDown(self):
+        """Tear down the database and the uploads folder."""
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        shutil.rmtree(self.upload_folder)
+
+    def login(self, username):
+        self.client.post('/login', data=json.dumps({'username': username, 'password': 'password'}),
+                         content_type='application/json')
+
+    def start(self, data=PDF, filename='book.pdf'):
+        response = self.client.post('/api/upload/book-pdf/sessions',
+                                    data=json.dumps({'filename': filename, 'size': len(data)}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        return response.headers['Location']
+
+    def put(self, location, chunk, offset):
+        return self.client.put(f'{location}?offset={offset}', data=chunk,
+                               content_type='application/octet-stream')
+
+    def test_chunked_upload_is_stored_content_addressed(self):
+        """Test that chunks sent in order assemble into the uploaded PDF."""
+        location = self.start()
+        for offset in range(0, len(PDF), 4000):
+            response = self.put(location, PDF[offset:offset + 4000], offset)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.get_json()['upload']['offset'], min(offset + 4000, len(PDF)))
+
+        response = self.client.post(f'{location}/complete', data=json.dumps({'sha256': hashlib.sha256(PDF).hexdigest()}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        digest = hashlib.sha256(PDF).hexdigest()
+        self.assertEqual(response.get_json()['file_url'], f'/static/uploads/books/{digest}.pdf')
+        with open(os.path.join(self.upload_folder, 'books', f'{digest}.pdf'), 'rb') as f:
+            self.assertEqual(f.read(), PDF)
+        self.assertEqual(UploadSession.query.count(), 0)
+        self.assertEqual(os.listdir(os.path.join(self.upload_folder, '.partial')), [])
+
+    def test_upload_resumes_from_reported_offset(self):
+        """Test that a wrong offset is refused with the offset to resume from."""
+        location = self.start()
+        self.put(location, PDF[:5000], 0)
+
+        response = self.put(location, PDF[8000:], 8000)
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.get_json()['offset'], 5000)
+        self.assertEqual(self.client.get(location).get_json()['upload']['offset'], 5000)
+
+        # A chunk resent from an earlier offset replaces what followed it
+        self.assertEqual(self.put(location, PDF[5000:], 5000).status_code, 200)
+        self.assertEqual(self.client.post(f'{location}/complete').status_code, 201)
+
+    def test_oversized_chunk_is_rejected(self):
+        """Test that data beyond the declared size is refused and not kept."""
+        location = self.start()
+        response = self.put(location, PDF + b'extra', 0)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.client.get(location).get_json()['upload']['offset'], 0)
+
+    def test_incomplete_or_invalid_uploads_are_refused(self):
+        """Test that completing requires every byte and a PDF signature."""
+        location = self.start()
+        self.put(location, PDF[:100], 0)
+        self.assertEqual(self.client.post(f'{location}/complete').status_code, 409)
+
+        data = b'not a pdf at all'
+        location = self.start(data)
+        self.put(location, data, 0)
+        self.assertEqual(self.client.post(f'{location}/complete').status_code, 400)
+        self.assertEqual(self.client.get(location).status_code, 404)
+
+        response = self.client.post('/api/upload/book-pdf/sessions', data=json.dumps({'filename': 'a.exe', 'size': 10}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.app.config['MAX_BOOK_PDF_SIZE'] = 100
+        response = self.client.post('/api/upload/book-pdf/sessions', data=json.dumps({'filename': 'a.pdf', 'size': 101}),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_sessions_are_private_and_can_be_aborted(self):
+        """Test that only the owner sees a session and can cancel it."""
+        location = self.start()
+        self.put(location, PDF[:100], 0)
+        self.login('other')
+        self.assertEqual(self.client.get(location).status_code, 404)
+        self.assertEqual(self.put(location, PDF[100:200], 100).status_code, 404)
+
+        self.login('editor')
+        self.assertEqual(self.client.delete(location).status_code, 200)
+        self.assertEqual(self.client.get(location).status_code, 404)
+        self.assertEqual(os.listdir(os.path.join(self.upload_folder, '.partial')), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
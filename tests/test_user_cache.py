@@ -0,0 +1,100 @@
+import json
+import os
+import unittest
+import sys
+
+# Add the parent directory to the sys.path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import event
+
+from app import create_app
+from database import db
+from models import User
+
+
+class UserCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        """Set up an admin and an editor, each logged in with their own client.
+
+        No application context is left pushed, so requests do not share the
+        user Flask-Login keeps in ``g``.
+        """
+        self.app = create_app('testing')
+        self.client = self.app.test_client()
+        with self.app.app_context():
+            db.create_all()
+            for username, role in (('admin', 'admin'), ('editor', 'editor')):
+                user = User(username=username, email=f'{username}@example.com', role=role)
+                user.set_password('password')
+                db.session.add(user)
+            db.session.commit()
+            self.editor_id = User.query.filter_by(username='editor').one().id
+        self.admin = self.app.test_client()
+        self.login(self.admin, 'admin')
+        self.login(self.client, 'editor')
+
+    def tearDown(self):
+        """Tear down the database."""
+        with self.app.app_context():
+            db.drop_all()
+
+    def login(self, client, username):
+        client.post('/login', data=json.dumps({'username': username, 'password': 'password'}),
+                    content_type='application/json')
+
+    def count_queries(self, function):
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            result = function()
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        return result, statements
+
+    def test_auth_status_is_answered_without_queries(self):
+        """Test that polling the auth status reuses the cached user."""
+        self.client.get('/api/auth-status')
+        response, statements = self.count_queries(lambda: self.client.get('/api/auth-status'))
+        self.assertEqual(response.get_json()['user']['username'], 'editor')
+        self.assertEqual(statements, [])
+
+    def test_role_change_is_seen_immediately(self):
+        """Test that updating a user invalidates its cached copy."""
+        self.assertEqual(self.client.get('/api/auth-status').get_json()['user']['role'], 'editor')
+        self.admin.put(f'/api/users/{self.editor_id}', data=json.dumps({'role': 'user'}),
+                       content_type='application/json')
+        self.assertEqual(self.client.get('/api/auth-status').get_json()['user']['role'], 'user')
+        self.assertEqual(self.client.get('/api/jobs/1').status_code, 403)
+
+    def test_status_changes_and_deletions_are_seen_immediately(self):
+        """Test that status changes and deletions drop the cached user."""
+        self.client.get('/api/auth-status')
+        self.admin.put(f'/api/users/{self.editor_id}/status', data=json.dumps({'active': False}),
+                       content_type='application/json')
+        self.assertFalse(self.client.get('/api/auth-status').get_json()['user']['active'])
+
+        self.admin.delete(f'/api/users/{self.editor_id}')
+        self.assertFalse(self.client.get('/api/auth-status').get_json()['authenticated'])
+
+    def test_cached_user_changes_are_saved(self):
+        """Test that a user attached from the cache is still flushed on commit."""
+        cache = self.app.extensions['user_cache']
+        with self.app.test_request_context():
+            cache.load(self.editor_id)
+        with self.app.test_request_context():
+            user = cache.load(self.editor_id)
+            user.set_preferences({'theme': 'dark'})
+            db.session.commit()
+        with self.app.app_context():
+            self.assertEqual(db.session.get(User, self.editor_id).get_preferences(), {'theme': 'dark'})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,116 @@
+"""
+In-process cache of logged-in users.
+
+Flask-Login calls the user loader on every authenticated request, including
+each ``/api/auth-status`` poll. Instead of querying the ``user`` table every
+time, each worker keeps a detached copy of recently loaded users for
+``USER_CACHE_TTL`` seconds and attaches it to the request's session with
+``Session.merge(load=False)``, which does not touch the database. The copy
+behaves like a loaded ``User``: changes made to ``current_user`` are still
+flushed on commit.
+
+Every user has a version counter in the content cache backend (see
+``cache.py``). Views that change a user's role, status or credentials bump
+it through :meth:`UserCache.invalidate`, which makes cached copies of the
+old version unusable. With a shared backend the counter is seen by every
+worker; with the in-process one other workers pick up the change when their
+copy expires.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import make_transient_to_detached
+
+from database import db
+
+
+class UserCache:
+    """Caches detached ``User`` copies by id and version.
+
+    Args:
+        backend: The content cache backend holding the version counters.
+        ttl (int): Seconds a copy is used before the user is reloaded. ``0``
+            disables the cache.
+        max_entries (int): The number of users kept before evicting the
+            least recently used one.
+    """
+
+    def __init__(self, backend, ttl=30, max_entries=1024):
+        self.backend = backend
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def version(self, user_id):
+        """Returns the current version of a user."""
+        return self.backend.counter(f'user:{user_id}')
+
+    def _get(self, user_id, version):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            cached_version, expires_at, user = entry
+            if cached_version != version or expires_at <= time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return user
+
+    def _set(self, user, version):
+        model = type(user)
+        copy = model(**{column.key: getattr(user, column.key) for column in inspect(model).column_attrs})
+        make_transient_to_detached(copy)
+        with self._lock:
+            self._entries[user.id] = (version, time.monotonic() + self.ttl, copy)
+            self._entries.move_to_end(user.id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def load(self, user_id):
+        """Returns the user with ``user_id`` attached to the current session.
+
+        Returns:
+            User: The user, or None if it does not exist.
+        """
+        from models import User
+
+        if not self.ttl:
+            return db.session.get(User, user_id)
+        version = self.version(user_id)
+        cached = self._get(user_id, version)
+        if cached is not None:
+            return db.session.merge(cached, load=False)
+        user = db.session.get(User, user_id)
+        if user is not None:
+            self._set(user, version)
+        return user
+
+    def invalidate(self, *user_ids):
+        """Drops the cached copies of users, in this and every sharing worker.
+
+        Call it after committing a change to the users.
+        """
+        for user_id in user_ids:
+            self.backend.incr(f'user:{user_id}')
+            with self._lock:
+                self._entries.pop(user_id, None)
+
+    def clear(self):
+        """Removes every cached user from this worker."""
+        with self._lock:
+            self._entries.clear()
+
+
+def init_user_cache(app):
+    """Creates the application's user cache, sharing the content cache backend.
+
+    Returns:
+        UserCache: The cache instance.
+    """
+    cache = UserCache(app.extensions['content_cache'].backend, ttl=app.config.get('USER_CACHE_TTL', 30))
+    app.extensions['user_cache'] = cache
+    return cache
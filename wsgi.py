@@ -1,3 +1,6 @@
 from app import create_app
 
 app = create_app()
+
+# Resume jobs queued before the last restart
+app.extensions['job_queue'].start()